@@ -1,9 +1,256 @@
-from django.contrib import admin
-from .models import Class, TeacherProfile, Division, StudentProfile, Subject
+import csv
+import io
+
+from django import forms
+from django.contrib import admin, messages
+from django.core.exceptions import ValidationError
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404, redirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils.html import format_html
+
+from .changelist import KeysetPaginationMixin
+from .models import Class, TeacherProfile, Division, StudentProfile, Subject, AttendanceSession, AttendanceStat, Announcement, OutboundEmail, SchoolDay, TimetableSlot, RequestProfile, SearchToken
+from .timetable import check_slot, lock_timetable
+from .provisioning import import_csv
+from .search import profile_ids
 # Register your models here.
 
-admin.site.register(Class)
-admin.site.register(TeacherProfile)
-admin.site.register(Division)
-admin.site.register(StudentProfile)
-admin.site.register(Subject)
\ No newline at end of file
+
+# Passwords are hashed while the admin page waits (about half a second each), so larger
+# files go through the import_people command, which hashes them in a process pool.
+ADMIN_IMPORT_MAX_ROWS = 50
+
+
+class CSVImportForm(forms.Form):
+    csv_file = forms.FileField(
+        label="CSV file",
+        help_text=f"Up to {ADMIN_IMPORT_MAX_ROWS} rows, imported while you wait. "
+                  "Import larger files with: manage.py import_people <students|teachers> <file.csv>",
+    )
+
+    def clean_csv_file(self):
+        csv_file = self.cleaned_data['csv_file']
+        text = io.TextIOWrapper(csv_file.file, encoding='utf-8-sig', newline='')
+        try:
+            rows = sum(1 for _ in csv.reader(text)) - 1
+        except UnicodeDecodeError:
+            raise ValidationError("The file must be UTF-8 encoded CSV.")
+        finally:
+            text.detach()
+            csv_file.seek(0)
+        if rows > ADMIN_IMPORT_MAX_ROWS:
+            raise ValidationError(
+                f"{rows} rows is more than the {ADMIN_IMPORT_MAX_ROWS} the admin imports; use manage.py import_people."
+            )
+        return csv_file
+
+
+class CSVImportMixin:
+    """Adds an "Import CSV" page to a profile changelist (see app.provisioning)."""
+    import_kind = None
+    change_list_template = "admin/app/change_list_import.html"
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        return [
+            path('import-csv/', self.admin_site.admin_view(self.import_csv_view), name='%s_%s_import_csv' % info),
+        ] + super().get_urls()
+
+    def import_csv_view(self, request):
+        if not self.has_add_permission(request):
+            return redirect('admin:index')
+        form = CSVImportForm(request.POST or None, request.FILES or None)
+        result = None
+        if request.method == "POST" and form.is_valid():
+            csv_file = io.TextIOWrapper(form.cleaned_data['csv_file'].file, encoding='utf-8-sig', newline='')
+            try:
+                # Hash in this process: a pool per request would fork the web worker.
+                result = import_csv(self.import_kind, csv_file, workers=1)
+            except ValueError as exc:
+                messages.error(request, str(exc))
+            else:
+                messages.success(request, f"Created {result['created']} {self.import_kind}, skipped {len(result['errors'])} row(s).")
+        return TemplateResponse(request, "admin/app/import_csv.html", {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': f"Import {self.import_kind} from CSV",
+            'form': form,
+            'result': result,
+        })
+
+
+class DivisionListFilter(admin.SimpleListFilter):
+    """Filter on ``division``, listing divisions with their class in one query."""
+    title = "division"
+    parameter_name = 'division'
+
+    def lookups(self, request, model_admin):
+        return [(division.pk, str(division)) for division in Division.objects.select_related('class_field')]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(division_id=self.value())
+        return queryset
+
+
+class TokenSearchMixin:
+    """Search profiles through the SearchToken prefix index (see app.search) instead of LIKE scans."""
+    search_role = None
+
+    def get_search_results(self, request, queryset, search_term):
+        matches = profile_ids(self.search_role, search_term)
+        if matches is None:
+            return queryset, False
+        return queryset.filter(pk__in=matches), False
+
+
+@admin.register(StudentProfile)
+class StudentProfileAdmin(CSVImportMixin, TokenSearchMixin, KeysetPaginationMixin, admin.ModelAdmin):
+    import_kind = 'students'
+    search_role = SearchToken.Role.STUDENT
+    list_display = ('student_id', 'full_name', 'division', 'category', 'guardian_phone')
+    list_select_related = ('user', 'division__class_field')
+    list_filter = (DivisionListFilter, 'category')
+    search_fields = ('student_id',)
+    autocomplete_fields = ('user', 'division')
+
+    def get_queryset(self, request):
+        # Autocomplete lookups render __str__ from this queryset too. The changelist
+        # skips list_select_related once select_related is set, so repeat it here.
+        return super().get_queryset(request).select_related(*self.list_select_related)
+
+    @admin.display(description="Name", ordering='user__last_name')
+    def full_name(self, obj):
+        return obj.user.get_full_name()
+
+
+@admin.register(TeacherProfile)
+class TeacherProfileAdmin(CSVImportMixin, TokenSearchMixin, KeysetPaginationMixin, admin.ModelAdmin):
+    import_kind = 'teachers'
+    search_role = SearchToken.Role.TEACHER
+    list_display = ('employee_id', 'full_name', 'specialization', 'experience_years')
+    list_select_related = ('user',)
+    search_fields = ('employee_id',)
+    autocomplete_fields = ('user',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(*self.list_select_related)
+
+    @admin.display(description="Name", ordering='user__last_name')
+    def full_name(self, obj):
+        return obj.user.get_full_name()
+
+
+@admin.register(Class)
+class ClassAdmin(admin.ModelAdmin):
+    list_display = ('name', 'description')
+    search_fields = ('name',)
+
+
+@admin.register(Division)
+class DivisionAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'teacher', 'max_students')
+    list_select_related = ('class_field', 'teacher__user')
+    list_filter = ('class_field',)
+    search_fields = ('name', 'class_field__name')
+    autocomplete_fields = ('class_field', 'teacher')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(*self.list_select_related)
+
+
+@admin.register(Subject)
+class SubjectAdmin(admin.ModelAdmin):
+    list_display = ('code', 'name', 'division', 'teacher')
+    list_select_related = ('division__class_field', 'teacher__user')
+    list_filter = (DivisionListFilter,)
+    search_fields = ('code', 'name')
+    autocomplete_fields = ('division', 'teacher')
+
+
+@admin.register(AttendanceSession)
+class AttendanceSessionAdmin(KeysetPaginationMixin, admin.ModelAdmin):
+    list_display = ('date', 'slot', 'subject', 'division', 'present_count', 'roster_size', 'marked_by')
+    list_select_related = ('subject', 'division__class_field', 'marked_by__user')
+    list_filter = (DivisionListFilter,)
+    autocomplete_fields = ('subject', 'division', 'marked_by')
+    exclude = ('roster', 'presence')
+    # Newest first by id rather than the model's (-date, slot), which no index serves.
+    ordering = ('-pk',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('roster', 'presence')
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    """Stored request profiles, slowest first (see app.profiling)."""
+    list_display = ('path', 'view', 'role', 'duration_ms', 'queries', 'status', 'trigger', 'created_at', 'collapsed_link')
+    list_filter = ('trigger', 'role', 'view')
+    search_fields = ('path',)
+    exclude = ('summary', 'collapsed')
+    readonly_fields = ('summary_text', 'collapsed_link')
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        return [
+            path('<int:pk>/collapsed/', self.admin_site.admin_view(self.collapsed_view), name='%s_%s_collapsed' % info),
+        ] + super().get_urls()
+
+    def collapsed_view(self, request, pk):
+        if not self.has_view_permission(request):
+            return redirect('admin:index')
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        response = HttpResponse(profile.collapsed, content_type='text/plain; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="profile-{profile.pk}.folded"'
+        return response
+
+    @admin.display(description="Collapsed stacks")
+    def collapsed_link(self, obj):
+        return format_html('<a href="{}">download</a>', reverse('admin:app_requestprofile_collapsed', args=[obj.pk]))
+
+    @admin.display(description="Summary")
+    def summary_text(self, obj):
+        return format_html('<pre>{}</pre>', obj.summary)
+
+    def get_readonly_fields(self, request, obj=None):
+        return [field.name for field in self.model._meta.fields] + list(self.readonly_fields)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+admin.site.register(AttendanceStat)
+admin.site.register(Announcement)
+admin.site.register(OutboundEmail)
+admin.site.register(SchoolDay)
+
+
+class TimetableSlotForm(forms.ModelForm):
+    class Meta:
+        model = TimetableSlot
+        fields = '__all__'
+
+    def _post_clean(self):
+        # Reported as a form error rather than from save(): the admin validates and saves
+        # in one transaction, so the lock taken here still covers the save.
+        super()._post_clean()
+        if not self.errors:
+            lock_timetable()
+            try:
+                check_slot(self.instance)
+            except ValidationError as exc:
+                self.add_error(None, exc)
+
+
+@admin.register(TimetableSlot)
+class TimetableSlotAdmin(admin.ModelAdmin):
+    form = TimetableSlotForm
+
+    def save_model(self, request, obj, form, change):
+        obj.save(check_conflicts=False)
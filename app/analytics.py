@@ -0,0 +1,256 @@
+"""
+Attendance analytics for admins: weekly trends and at-risk students.
+
+A division's sessions over the last TERM_DAYS days are loaded into two boolean
+students × sessions matrices in date order, ``rostered`` and ``present``, by
+unpacking every roster and presence bitmap in one pass with NumPy. Per-student rates,
+the rolling rate over the last ROLLING_SESSIONS sessions, absence streaks and the
+weekly totals per division and subject are then sums and cumulative sums over those
+matrices, without a Python loop over students or marks.
+
+Each division's summary is cached per process under a version, kept in the shared
+cache so every worker sees it, that app.signals bumps once a session of the
+division is saved or deleted and the transaction commits. So it's recomputed only
+when attendance changes (or seeding bumps every division). The
+at-risk rules are applied to the cached summaries when reading, per
+StudentProfile.Category (``RULES``, overridable with ``settings.ATTENDANCE_RULES``),
+so changing a rule or a student's category needs no recompute.
+"""
+from collections import namedtuple
+from datetime import date, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+
+from app.models import AttendanceSession, Division, StudentProfile, Subject
+from erp.cache_backends import shared_cache
+
+Category = StudentProfile.Category
+TERM_DAYS = 120
+ROLLING_SESSIONS = 10
+MIN_SESSIONS = 5
+CACHE_TIMEOUT = 86400
+GLOBAL_VERSION_KEY = "attendance_analytics_version"
+
+# A student is at risk when their rate over the term or over their division's last
+# ROLLING_SESSIONS sessions is below the minimum, or they have missed
+# ``max_absence_streak`` of their sessions in a row. Entrance-exam batches are held to
+# a stricter standard than the board's 75%.
+Rule = namedtuple('Rule', 'min_rate min_recent_rate max_absence_streak')
+DEFAULT_RULE = Rule(0.75, 0.75, 6)
+RULES = {
+    Category.SCIENCE_JEE: Rule(0.85, 0.80, 4),
+    Category.SCIENCE_NEET: Rule(0.85, 0.80, 4),
+    Category.COMMERCE_CA: Rule(0.80, 0.75, 5),
+}
+REASONS = ('low_rate', 'low_recent_rate', 'absence_streak')
+
+
+def rule_for(category):
+    rules = {**RULES, **getattr(settings, 'ATTENDANCE_RULES', {})}
+    return Rule(*rules.get(category, DEFAULT_RULE))
+
+
+def load_matrix(sessions):
+    """
+    ``(student_ids, rostered, present)`` from ``(roster, presence)`` pairs: the sorted
+    ids of every rostered student and two boolean students × sessions matrices.
+    """
+    rosters = [bytes(roster) for roster, _ in sessions]
+    bitmaps = [bytes(presence) for _, presence in sessions]
+    sizes = np.array([len(roster) // 8 for roster in rosters], dtype=np.int64)
+    widths = np.array([len(bitmap) for bitmap in bitmaps], dtype=np.int64)
+    ids = np.frombuffer(b''.join(rosters), dtype='<u8')
+    bits = np.unpackbits(np.frombuffer(b''.join(bitmaps), dtype=np.uint8), bitorder='little')
+    # Roster entry i of session k is bit i of that session's bitmap in the joined bits.
+    offsets = np.arange(len(ids)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    positions = np.repeat((np.cumsum(widths) - widths) * 8, sizes) + offsets
+    columns = np.repeat(np.arange(len(rosters)), sizes)
+    student_ids, rows = np.unique(ids, return_inverse=True)
+    rostered = np.zeros((len(student_ids), len(rosters)), dtype=bool)
+    present = np.zeros_like(rostered)
+    rostered[rows, columns] = True
+    present[rows, columns] = bits[positions].astype(bool)
+    return student_ids, rostered, present
+
+def rolling_rates(rostered, present, window=ROLLING_SESSIONS):
+    """Each student's rate over the ``window`` sessions up to each session; NaN where they had none."""
+    sessions = rostered.shape[1]
+    attended = np.pad(np.cumsum(present, axis=1), ((0, 0), (1, 0)))
+    total = np.pad(np.cumsum(rostered, axis=1), ((0, 0), (1, 0)))
+    start = np.maximum(np.arange(1, sessions + 1) - window, 0)
+    attended = attended[:, 1:] - attended[:, start]
+    total = total[:, 1:] - total[:, start]
+    return np.divide(attended, total, out=np.full(total.shape, np.nan), where=total > 0)
+
+def absence_streaks(rostered, present):
+    """
+    ``(current, longest)`` runs of consecutive missed sessions per student. Sessions a
+    student wasn't rostered on neither extend nor break a run.
+    """
+    if not rostered.size:
+        return np.zeros(len(rostered), dtype=np.int64), np.zeros(len(rostered), dtype=np.int64)
+    missed = np.cumsum(rostered & ~present, axis=1)
+    # Misses up to the last attended session, carried forward: what a run starts from.
+    before = np.maximum.accumulate(np.where(present, missed, 0), axis=1)
+    runs = missed - before
+    return runs[:, -1], runs.max(axis=1)
+
+def summarize(sessions):
+    """A division's summary from its ``(date, subject_id, roster, presence)`` sessions in date order."""
+    student_ids, rostered, present = load_matrix([(roster, presence) for _, _, roster, presence in sessions])
+    current, longest = absence_streaks(rostered, present)
+    recent = rolling_rates(rostered, present)
+    ordinals = np.array([day.toordinal() for day, *_ in sessions], dtype=np.int64)
+    weeks, week_index = np.unique(ordinals - (ordinals - 1) % 7, return_inverse=True)  # Mondays
+    subject_ids, subject_index = np.unique(np.array([subject_id for _, subject_id, *_ in sessions], dtype=np.int64), return_inverse=True)
+    cells = subject_index * len(weeks) + week_index
+    size = len(subject_ids) * len(weeks)
+    by_subject = np.stack([
+        np.bincount(cells, weights=present.sum(axis=0), minlength=size),
+        np.bincount(cells, weights=rostered.sum(axis=0), minlength=size),
+    ]).astype(np.int64).reshape(2, len(subject_ids), len(weeks))
+    return {
+        'student_ids': student_ids,
+        'attended': present.sum(axis=1),
+        'total': rostered.sum(axis=1),
+        'recent_rate': recent[:, -1] if recent.shape[1] else np.full(len(student_ids), np.nan),
+        'current_streak': current,
+        'longest_streak': longest,
+        'weeks': weeks,
+        'weekly': by_subject.sum(axis=1),
+        'subject_ids': subject_ids,
+        'subject_weekly': by_subject,
+    }
+
+
+def _version_key(division_id):
+    return f"attendance_analytics_version_{division_id}"
+
+def _bump(key):
+    shared_cache.add(key, 0, None)
+    try:
+        shared_cache.incr(key)
+    except ValueError:
+        shared_cache.set(key, 1, None)
+
+def invalidate_division(division_id):
+    if division_id is not None:
+        _bump(_version_key(division_id))
+
+def invalidate_all():
+    _bump(GLOBAL_VERSION_KEY)
+
+def term_start(today=None):
+    return (today or timezone.localdate()) - timedelta(days=TERM_DAYS)
+
+def division_summaries(division_ids, start=None):
+    """``{division_id: summary}`` from the cache, computing the missing ones with a single query."""
+    start = start or term_start()
+    division_ids = list(dict.fromkeys(division_ids))
+    versions = shared_cache.get_many([GLOBAL_VERSION_KEY, *map(_version_key, division_ids)])
+    keys = {
+        pk: f"attendance_analytics_{pk}_{versions.get(GLOBAL_VERSION_KEY, 0)}"
+            f".{versions.get(_version_key(pk), 0)}_{start:%Y%m%d}"
+        for pk in division_ids
+    }
+    cached = cache.get_many(list(keys.values()))
+    summaries = {pk: cached[key] for pk, key in keys.items() if key in cached}
+    missing = {pk: [] for pk in division_ids if pk not in summaries}
+    if missing:
+        rows = (
+            AttendanceSession.objects.filter(division_id__in=list(missing), date__gte=start)
+            .order_by('date', 'slot', 'subject_id')
+            .values_list('division_id', 'date', 'subject_id', 'roster', 'presence')
+        )
+        for division_id, *session in rows.iterator():
+            missing[division_id].append(session)
+        computed = {pk: summarize(sessions) for pk, sessions in missing.items()}
+        cache.set_many({keys[pk]: summary for pk, summary in computed.items()}, CACHE_TIMEOUT)
+        summaries.update(computed)
+    return summaries
+
+
+def weekly_trend(summaries, subject_id=None):
+    """Attendance per week summed over division ``summaries`` (or one subject's), oldest first."""
+    parts = []
+    for summary in summaries:
+        counts = summary['weekly']
+        if subject_id is not None:
+            match = np.flatnonzero(summary['subject_ids'] == subject_id)
+            if not len(match):
+                continue
+            counts = summary['subject_weekly'][:, match[0]]
+        parts.append((summary['weeks'], counts))
+    weeks = np.unique(np.concatenate([part[0] for part in parts])) if parts else np.array([], dtype=np.int64)
+    totals = np.zeros((2, len(weeks)), dtype=np.int64)
+    for part_weeks, counts in parts:
+        totals[:, np.searchsorted(weeks, part_weeks)] += counts
+    return [
+        {'week': date.fromordinal(week).isoformat(), 'attended': attended, 'total': total,
+         'rate': round(attended / total, 4) if total else None}
+        for week, attended, total in zip(weeks.tolist(), *totals.tolist())
+    ]
+
+def at_risk(summaries, students):
+    """
+    The ``students`` (dicts with ``id``, ``division_id`` and ``category``) breaking
+    their category's rule in their division's summary, with their figures added, as
+    ``{category: [student, ...]}`` from the lowest rate.
+    """
+    members = {}
+    for student in students:
+        members.setdefault(student['division_id'], []).append(student)
+    flagged = {}
+    for division_id, group in members.items():
+        summary = summaries.get(division_id)
+        if summary is None or not len(summary['student_ids']):
+            continue
+        ids = np.array([student['id'] for student in group], dtype=np.uint64)
+        rows = np.searchsorted(summary['student_ids'], ids).clip(max=len(summary['student_ids']) - 1)
+        attended, total = summary['attended'][rows], summary['total'][rows]
+        rate = attended / np.maximum(total, 1)
+        recent, streak = summary['recent_rate'][rows], summary['current_streak'][rows]
+        category_rules = {category: rule_for(category) for category in {student['category'] for student in group}}
+        rules = np.array([category_rules[student['category']] for student in group], dtype=float)
+        reasons = np.stack([rate < rules[:, 0], recent < rules[:, 1], streak >= rules[:, 2]], axis=1)
+        reasons &= ((summary['student_ids'][rows] == ids) & (total >= MIN_SESSIONS))[:, None]
+        for index in np.flatnonzero(reasons.any(axis=1)).tolist():
+            student = group[index]
+            flagged.setdefault(student['category'], []).append({
+                **student,
+                'attended': int(attended[index]), 'total': int(total[index]),
+                'rate': round(float(rate[index]), 4),
+                'recent_rate': None if np.isnan(recent[index]) else round(float(recent[index]), 4),
+                'absence_streak': int(streak[index]),
+                'longest_absence_streak': int(summary['longest_streak'][rows[index]]),
+                'reasons': [reason for reason, hit in zip(REASONS, reasons[index].tolist()) if hit],
+            })
+    for rows in flagged.values():
+        rows.sort(key=lambda row: (row['rate'], row['id']))
+    return flagged
+
+def report(class_id=None, division_id=None, subject_id=None):
+    """
+    Weekly trend and at-risk students for a class, division or subject, ready for
+    JSON. At-risk figures cover every subject of the divisions in scope.
+    """
+    if subject_id is not None:
+        divisions = Subject.objects.filter(pk=subject_id).values_list('division_id', flat=True)
+    elif division_id is not None:
+        divisions = Division.objects.filter(pk=division_id).values_list('pk', flat=True)
+    else:
+        divisions = Division.objects.filter(class_field_id=class_id).values_list('pk', flat=True)
+    divisions = list(divisions)
+    summaries = division_summaries(divisions)
+    students = StudentProfile.objects.filter(division_id__in=divisions).values(
+        'id', 'student_id', 'division_id', 'category', first_name=F('user__first_name'), last_name=F('user__last_name'),
+    )
+    return {
+        'weeks': weekly_trend(summaries.values(), subject_id),
+        'at_risk': at_risk(summaries, students),
+        'rules': {category: rule_for(category)._asdict() for category in Category.values},
+    }
@@ -0,0 +1,51 @@
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Q
+
+from app.models import Announcement, Division
+from erp.cache_backends import shared_cache
+
+FEED_SIZE = 50
+FEED_TIMEOUT = 3600
+FEED_VERSION_KEY = "announcement_feed_version"
+
+
+# Feeds are cached per process; the version they are keyed on is in the shared cache,
+# so an announcement retires the cached feeds of every worker.
+
+def _feed_version():
+    version = shared_cache.get(FEED_VERSION_KEY)
+    if version is None:
+        shared_cache.add(FEED_VERSION_KEY, 1, None)
+        version = shared_cache.get(FEED_VERSION_KEY, 1)
+    return version
+
+def invalidate_feeds():
+    """Retire every cached feed at once; called whenever an announcement is posted, edited or removed."""
+    try:
+        shared_cache.incr(FEED_VERSION_KEY)
+    except ValueError:
+        shared_cache.set(FEED_VERSION_KEY, 2, None)
+
+def _load_feed(division_id):
+    target = Q(division__isnull=True, class_field__isnull=True)
+    if division_id is not None:
+        class_id = Division.objects.filter(pk=division_id).values_list('class_field_id', flat=True).first()
+        target |= Q(division_id=division_id) | Q(division__isnull=True, class_field_id=class_id)
+    return list(
+        Announcement.objects.filter(target)
+        .order_by('-created_at')
+        .values('id', 'title', 'text', 'created_at')[:FEED_SIZE]
+    )
+
+def division_feed(division_id):
+    """The latest FEED_SIZE announcements visible to a division, shared by all of its students."""
+    key = f"announcement_feed_{division_id}_{_feed_version()}"
+    feed = cache.get(key)
+    if feed is None:
+        feed = _load_feed(division_id)
+        cache.set(key, feed, FEED_TIMEOUT)
+    return feed
+
+def division_feed_page(division_id, page=1, per_page=10):
+    return Paginator(division_feed(division_id), per_page).get_page(page)
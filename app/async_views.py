@@ -0,0 +1,97 @@
+"""
+Async versions of the dashboard views, routed by erp.urls_async when served under
+ASGI (see erp/asgi.py). Independent widget queries are awaited together with
+asyncio.gather; WSGI deployments keep using the sync views in app.views.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.shortcuts import redirect, render
+
+from app import fragments, roles, stats, timetable
+from erp.db_router import read_from_replica
+from erp.request_metrics import query_budget
+from app.announcements import division_feed_page
+from app.models import AttendanceStat, Division
+
+
+async def _render(request, user, template, context):
+    # request.role and request.profile (from app.roles.RoleMiddleware) carry what the
+    # sidebar needs, so rendering issues no synchronous queries.
+    request.user = user
+    return await sync_to_async(render)(request, template, context)
+
+@query_budget(10)
+@read_from_replica
+async def dashboard_student(request):
+    user = await request.auser()
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path(), 'login')
+    # Only allow students
+    if request.role != roles.STUDENT:
+        return redirect(roles.DASHBOARDS[request.role])
+    student_profile = request.profile
+    stat, announcements, widget_version = await asyncio.gather(
+        AttendanceStat.objects.filter(scope=AttendanceStat.Scope.STUDENT, object_id=student_profile.pk).afirst(),
+        sync_to_async(division_feed_page)(student_profile.division_id, request.GET.get('page', 1)),
+        sync_to_async(fragments.division_version)(student_profile.division_id),
+    )
+    return await _render(request, user, "app/dashboard/dashboard_student.html", {
+        "attendance_percent": stat.percent if stat else 0,
+        "announcements": announcements,
+        "widget_version": widget_version,
+    })
+
+@query_budget(12)
+@read_from_replica
+async def dashboard_teacher(request):
+    user = await request.auser()
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path(), 'login')
+    # Only allow teachers
+    if request.role != roles.TEACHER:
+        return redirect(roles.DASHBOARDS[request.role])
+    teacher_profile = request.profile
+    divisions = Division.objects.filter(teacher=teacher_profile)
+
+    async def load_divisions():
+        return [division async for division in divisions.select_related('class_field')]
+
+    async def load_stats():
+        stats = AttendanceStat.objects.filter(scope=AttendanceStat.Scope.DIVISION, object_id__in=divisions.values('pk'))
+        return {stat.object_id: stat async for stat in stats}
+
+    teacher_divisions, division_stats, pending_attendance = await asyncio.gather(
+        load_divisions(), load_stats(), sync_to_async(timetable.pending_attendance)(teacher_profile),
+    )
+    for division in teacher_divisions:
+        stat = division_stats.get(division.pk)
+        division.attendance_percent = stat.percent if stat else 0
+    return await _render(request, user, "app/dashboard/dashboard_teacher.html", {
+        "teacher_divisions": teacher_divisions,
+        "pending_attendance": pending_attendance,
+        "widget_version": await sync_to_async(fragments.division_version)(*[d.pk for d in teacher_divisions]),
+    })
+
+@query_budget(10)
+@read_from_replica
+async def dashboard_admin(request):
+    user = await request.auser()
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path(), 'login')
+    # Only allow admin/staff
+    if request.role != roles.STAFF:
+        return redirect(roles.DASHBOARDS[request.role])
+    school, recent_activity = await asyncio.gather(
+        sync_to_async(stats.snapshot)(),
+        sync_to_async(stats.recent_activity)(),
+    )
+    return await _render(request, user, "app/dashboard/dashboard_admin.html", {
+        "total_students": school['students'],
+        "total_teachers": school['teachers'],
+        "total_classes": school['classes'],
+        "students_by_class": school['by_class'],
+        "students_by_category": school['by_category'],
+        "recent_activity": recent_activity,
+    })
@@ -0,0 +1,241 @@
+import sys
+from array import array
+from bisect import bisect_left
+
+from django.db import transaction
+from django.db.models import F
+from django.dispatch import Signal
+
+from app import fragments
+from app.models import AttendanceSession, AttendanceStat, RosterMembership, StudentProfile
+
+# Sent after a session is saved, with ``session``, ``subject`` and ``created``.
+attendance_marked = Signal()
+
+
+def encode_roster(student_ids) -> bytes:
+    ids = array('Q', sorted(set(student_ids)))
+    if sys.byteorder != 'little':
+        ids.byteswap()
+    return ids.tobytes()
+
+def decode_roster(data) -> array:
+    ids = array('Q')
+    ids.frombytes(bytes(data))
+    if sys.byteorder != 'little':
+        ids.byteswap()
+    return ids
+
+def encode_presence(roster, present_ids) -> bytes:
+    present = set(present_ids)
+    bits = 0
+    for index, student_id in enumerate(roster):
+        if student_id in present:
+            bits |= 1 << index
+    return bits.to_bytes((len(roster) + 7) // 8, 'little')
+
+def roster_index(roster, student_id):
+    index = bisect_left(roster, student_id)
+    if index < len(roster) and roster[index] == student_id:
+        return index
+    return None
+
+def is_present(presence, index) -> bool:
+    presence = bytes(presence)
+    return bool(presence[index >> 3] >> (index & 7) & 1)
+
+def present_ids(roster, presence):
+    bits = int.from_bytes(bytes(presence), 'little')
+    return [student_id for index, student_id in enumerate(roster) if bits >> index & 1]
+
+def count_present(presence) -> int:
+    return int.from_bytes(bytes(presence), 'little').bit_count()
+
+
+# Per-student results of submit_marks().
+PRESENT = 'present'
+ABSENT = 'absent'
+NOT_ON_ROSTER = 'not_on_roster'
+
+
+def _locked_session(subject, date, slot):
+    """The session row, locked for update, or a new one with the division's roster snapshotted (one query)."""
+    session = (
+        AttendanceSession.objects.select_for_update()
+        .filter(subject=subject, date=date, slot=slot)
+        .first()
+    )
+    if session is None:
+        roster = StudentProfile.objects.filter(division_id=subject.division_id).values_list('pk', flat=True)
+        session = AttendanceSession(
+            subject=subject,
+            division_id=subject.division_id,
+            date=date,
+            slot=slot,
+            roster=encode_roster(roster),
+        )
+    return session
+
+def _record(session, roster, previous, present, marked_by):
+    is_new = session.pk is None
+    session.presence = encode_presence(roster, present)
+    session.roster_size = len(roster)
+    session.present_count = count_present(session.presence)
+    if marked_by is not None:
+        session.marked_by = marked_by
+    session.save()
+    if is_new:
+        record_memberships(session.division_id, roster)
+    _update_stats(session, roster, previous, present, is_new)
+    return is_new
+
+def record_memberships(division_id, roster):
+    RosterMembership.objects.bulk_create(
+        [RosterMembership(student_id=student_id, division_id=division_id) for student_id in roster],
+        ignore_conflicts=True,
+    )
+
+def mark_session(subject, date, present, slot=1, marked_by=None):
+    """
+    Record a whole session in one row write. The roster is snapshotted from the
+    division the first time a session is marked; later calls correct presence only.
+    """
+    present = set(present)
+    with transaction.atomic():
+        session = _locked_session(subject, date, slot)
+        roster = decode_roster(session.roster)
+        unknown = present.difference(roster)
+        if unknown:
+            raise ValueError(f"Students not on the session roster: {sorted(unknown)}")
+        previous = set() if session.pk is None else set(present_ids(roster, session.presence))
+        is_new = _record(session, roster, previous, present, marked_by)
+    attendance_marked.send(sender=AttendanceSession, session=session, subject=subject, created=is_new)
+    return session
+
+def submit_marks(subject, date, marks, slot=1, marked_by=None):
+    """
+    Apply ``{student_id: present}`` marks to a session and return ``(session, created,
+    results)`` with a result per submitted student. Unlike mark_session(), students
+    not on the roster are rejected one by one (NOT_ON_ROSTER) instead of failing the
+    batch, and students left out keep their current mark (absent on a new session).
+    ``attendance_marked`` is sent once the surrounding transaction commits.
+    """
+    with transaction.atomic():
+        session = _locked_session(subject, date, slot)
+        roster = decode_roster(session.roster)
+        previous = set() if session.pk is None else set(present_ids(roster, session.presence))
+        present = set(previous)
+        results = {}
+        for student_id, mark in marks.items():
+            if roster_index(roster, student_id) is None:
+                results[student_id] = NOT_ON_ROSTER
+            elif mark:
+                present.add(student_id)
+                results[student_id] = PRESENT
+            else:
+                present.discard(student_id)
+                results[student_id] = ABSENT
+        is_new = _record(session, roster, previous, present, marked_by)
+        transaction.on_commit(
+            lambda: attendance_marked.send(sender=AttendanceSession, session=session, subject=subject, created=is_new)
+        )
+    return session, is_new, results
+
+def _bump(scope, object_ids, **deltas):
+    if not object_ids:
+        return
+    AttendanceStat.objects.filter(scope=scope, object_id__in=object_ids).update(
+        **{field: F(field) + delta for field, delta in deltas.items()}
+    )
+
+def _update_stats(session, roster, previous, present, is_new):
+    """Apply the difference between the old and new presence sets to the counters."""
+    student = AttendanceStat.Scope.STUDENT
+    AttendanceStat.objects.bulk_create(
+        [AttendanceStat(scope=student, object_id=student_id) for student_id in roster]
+        + [
+            AttendanceStat(scope=AttendanceStat.Scope.SUBJECT, object_id=session.subject_id),
+            AttendanceStat(scope=AttendanceStat.Scope.DIVISION, object_id=session.division_id),
+        ],
+        ignore_conflicts=True,
+    )
+    gained = present - previous
+    lost = previous - present
+    total = session.roster_size if is_new else 0
+    if is_new:
+        _bump(student, list(roster), total=1)
+    _bump(student, list(gained), attended=1)
+    _bump(student, list(lost), attended=-1)
+    attended = len(gained) - len(lost)
+    if total or attended:
+        _bump(AttendanceStat.Scope.SUBJECT, [session.subject_id], attended=attended, total=total)
+        _bump(AttendanceStat.Scope.DIVISION, [session.division_id], attended=attended, total=total)
+
+def compute_stats():
+    """Recount every counter from the raw sessions; returns ``{(scope, object_id): (attended, total)}``."""
+    counts = {}
+
+    def add(key, attended, total):
+        current = counts.get(key, (0, 0))
+        counts[key] = (current[0] + attended, current[1] + total)
+
+    sessions = AttendanceSession.objects.values_list(
+        'subject_id', 'division_id', 'roster', 'presence', 'roster_size', 'present_count'
+    )
+    for subject_id, division_id, roster_data, presence, roster_size, present_count in sessions.iterator():
+        add((AttendanceStat.Scope.SUBJECT, subject_id), present_count, roster_size)
+        add((AttendanceStat.Scope.DIVISION, division_id), present_count, roster_size)
+        bits = int.from_bytes(bytes(presence), 'little')
+        for index, student_id in enumerate(decode_roster(roster_data)):
+            add((AttendanceStat.Scope.STUDENT, student_id), bits >> index & 1, 1)
+    return counts
+
+def rebuild_stats(expected=None):
+    """Replace every counter with a recount from the raw sessions; returns the number written."""
+    expected = compute_stats() if expected is None else expected
+    with transaction.atomic():
+        AttendanceStat.objects.all().delete()
+        AttendanceStat.objects.bulk_create(
+            [
+                AttendanceStat(scope=scope, object_id=object_id, attended=attended, total=total)
+                for (scope, object_id), (attended, total) in expected.items()
+            ],
+            batch_size=1000,
+        )
+    fragments.invalidate_all()
+    return len(expected)
+
+def student_attendance(student, subject=None, start=None, end=None):
+    """
+    Yield ``(session, present)`` for every session the student was rostered on,
+    including those of divisions they have since left.
+    """
+    divisions = RosterMembership.objects.filter(student=student).values('division_id')
+    sessions = AttendanceSession.objects.filter(division_id__in=divisions)
+    if subject is not None:
+        sessions = sessions.filter(subject=subject)
+    if start is not None:
+        sessions = sessions.filter(date__gte=start)
+    if end is not None:
+        sessions = sessions.filter(date__lte=end)
+    for session in sessions.only('subject_id', 'date', 'slot', 'roster', 'presence').iterator():
+        index = roster_index(decode_roster(session.roster), student.pk)
+        if index is not None:
+            yield session, is_present(session.presence, index)
+
+def division_attendance(division, subject=None, start=None, end=None):
+    """Return ``{student_id: (attended, total)}`` for a division over a date range."""
+    sessions = AttendanceSession.objects.filter(division=division)
+    if subject is not None:
+        sessions = sessions.filter(subject=subject)
+    if start is not None:
+        sessions = sessions.filter(date__gte=start)
+    if end is not None:
+        sessions = sessions.filter(date__lte=end)
+    summary = {}
+    for roster_data, presence in sessions.values_list('roster', 'presence').iterator():
+        bits = int.from_bytes(bytes(presence), 'little')
+        for index, student_id in enumerate(decode_roster(roster_data)):
+            attended, total = summary.get(student_id, (0, 0))
+            summary[student_id] = (attended + (bits >> index & 1), total + 1)
+    return summary
@@ -0,0 +1,134 @@
+"""Helpers shared by the benchmark management commands."""
+import asyncio
+import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from http.cookies import SimpleCookie
+
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext
+
+_TEMPLATE_TIMING = re.compile(r'\btpl;dur=([\d.]+)')
+
+
+@contextmanager
+def quiet_request_metrics():
+    """Log only budget warnings from erp.request_metrics: a line per request would bury the report."""
+    logger = logging.getLogger('erp.request_metrics')
+    level = logger.level
+    logger.setLevel(max(level, logging.WARNING))
+    try:
+        yield
+    finally:
+        logger.setLevel(level)
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+def summarize(latencies, elapsed, errors=0):
+    """Latencies are in seconds; the summary reports milliseconds and requests per second."""
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+    }
+
+def _summarize_results(results, elapsed, expect=200):
+    """
+    ``results`` are ``(latency, status_code, queries, template_ms)`` tuples; any status
+    other than ``expect`` counts as an error. ``queries`` and ``template_ms`` are None
+    when they weren't measured.
+    """
+    summary = summarize(
+        [result[0] for result in results], elapsed, sum(1 for result in results if result[1] != expect)
+    )
+    queries = [result[2] for result in results if result[2] is not None]
+    if queries:
+        summary['queries_mean'] = round(sum(queries) / len(queries), 1)
+        summary['queries_max'] = max(queries)
+    templates = [result[3] for result in results if result[3] is not None]
+    if templates:
+        summary['template_ms_mean'] = round(sum(templates) / len(templates), 2)
+        summary['template_ms_p95'] = round(percentile(templates, 0.95), 2)
+    return summary
+
+def template_ms(response):
+    """Render time from the ``Server-Timing`` header (settings.SERVER_TIMING), or None."""
+    match = _TEMPLATE_TIMING.search(response.get('Server-Timing', ''))
+    return float(match[1]) if match else None
+
+def _consume(response):
+    # Streamed responses do their work while being iterated; time that too.
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    return response.status_code
+
+def run_wsgi(
+    path, cookies, requests, concurrency, method='get', data=None, expect=200, fresh_session=False,
+    content_type=None, headers=None,
+):
+    """
+    Drive ``path`` through Django's WSGI handler from ``concurrency`` threads, counting
+    the queries each request runs on its thread's connection. ``fresh_session`` drops
+    cookies set by earlier responses (e.g. to time repeated logins); a callable is
+    called before each request for new cookies (e.g. to time signing out). ``headers``
+    may also be a callable, e.g. for a new Idempotency-Key per request.
+    """
+    options = {'content_type': content_type} if content_type else {}
+
+    def worker(count):
+        client = Client()
+        client.cookies.update(cookies)
+        send = getattr(client, method)
+        timings = []
+        for _ in range(count):
+            if fresh_session:
+                client.cookies = SimpleCookie(fresh_session() if callable(fresh_session) else cookies)
+            request_headers = headers() if callable(headers) else headers
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = send(path, data, headers=request_headers, **options)
+                status = _consume(response)
+                latency = time.perf_counter() - start
+            timings.append((latency, status, len(queries), template_ms(response)))
+        return timings
+
+    start = time.perf_counter()
+    if concurrency == 1:
+        results = worker(requests)
+    else:
+        shares = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = [result for timings in pool.map(worker, shares) for result in timings]
+    return _summarize_results(results, time.perf_counter() - start, expect)
+
+def run_asgi(path, cookies, requests, concurrency, expect=200):
+    """Drive ``path`` through Django's ASGI handler with ``concurrency`` in-flight requests."""
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+        client = AsyncClient()
+        client.cookies.update(cookies)
+
+        async def one():
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(path)
+                return time.perf_counter() - start, response.status_code, None, template_ms(response)
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one() for _ in range(requests)))
+        return _summarize_results(results, time.perf_counter() - start, expect)
+
+    return asyncio.run(main())
@@ -0,0 +1,124 @@
+"""
+Admin changelists for large tables.
+
+``EstimatedCountPaginator`` counts exactly up to ``exact_limit`` rows with a bounded
+``COUNT`` over a ``LIMIT`` subquery, so small and well-filtered lists stay exact and
+a big table never pays for a full ``COUNT(*)``. Past the limit it uses the planner's
+row estimate on PostgreSQL (``EXPLAIN``), or, elsewhere, the highest primary key
+for an unfiltered table; filtered lists on other backends fall back to an exact
+count, which the filter's index keeps cheap.
+
+``KeysetChangeList`` pages with a cursor (``?after=<value>``) instead of ``OFFSET``
+whenever the list is ordered by a single unique, non-null field (the primary key,
+``student_id``, ``employee_id``, ...): each page is an index range scan however deep
+it is. Any other ordering, and "Show all", use the regular numbered pages.
+``KeysetPaginationMixin`` wires both into a ModelAdmin.
+"""
+import json
+
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ChangeList
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max
+from django.utils.functional import cached_property
+
+CURSOR_VAR = 'after'
+
+
+def estimate_count(queryset):
+    """The database's row estimate for ``queryset``, or None when it can't give one cheaply."""
+    if connections[queryset.db].vendor == 'postgresql':
+        plan = json.loads(queryset.order_by().explain(format='json'))
+        return int(plan[0]['Plan']['Plan Rows'])
+    if not queryset.query.where:
+        return queryset.model._base_manager.using(queryset.db).aggregate(top=Max('pk'))['top'] or 0
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    exact_limit = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list.order_by()
+        bounded = queryset[:self.exact_limit + 1].count()
+        if bounded <= self.exact_limit:
+            return bounded
+        estimate = estimate_count(queryset)
+        return max(estimate, bounded) if estimate is not None else queryset.count()
+
+
+class KeysetChangeList(ChangeList):
+    def __init__(self, request, *args, **kwargs):
+        self.cursor = request.GET.get(CURSOR_VAR)
+        self.keyset_field = None
+        self.next_cursor = None
+        super().__init__(request, *args, **kwargs)
+
+    def get_filters_params(self, params=None):
+        params = super().get_filters_params(params)
+        params.pop(CURSOR_VAR, None)
+        return params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # Sorting, filtering and searching start again from the first page.
+        return super().get_query_string({CURSOR_VAR: None, **(new_params or {})}, remove)
+
+    def _keyset_ordering(self):
+        ordering = self.queryset.query.order_by
+        if len(ordering) != 1 or not isinstance(ordering[0], str):
+            return None, False
+        name = ordering[0].lstrip('-')
+        try:
+            field = self.lookup_opts.pk if name == 'pk' else self.lookup_opts.get_field(name)
+        except FieldDoesNotExist:
+            return None, False
+        if not (field.primary_key or (field.unique and not field.null)) or field.is_relation:
+            return None, False
+        return field, ordering[0].startswith('-')
+
+    def get_results(self, request):
+        field, descending = self._keyset_ordering()
+        if field is None or self.show_all:
+            return super().get_results(request)
+        paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        queryset = self.queryset
+        after = f"{field.attname}__{'lt' if descending else 'gt'}"
+        if self.cursor is not None:
+            try:
+                queryset = queryset.filter(**{after: field.to_python(self.cursor)})
+            except ValidationError as exc:
+                raise IncorrectLookupParameters(exc) from exc
+        result_list = queryset[:self.list_per_page]
+        rows = list(result_list)
+        if len(rows) == self.list_per_page and queryset.filter(**{after: getattr(rows[-1], field.attname)}).exists():
+            self.next_cursor = field.value_to_string(rows[-1])
+        self.keyset_field = field
+        self.result_count = paginator.count
+        self.show_full_result_count = self.model_admin.show_full_result_count
+        self.full_result_count = self.root_queryset.count() if self.show_full_result_count else None
+        self.show_admin_actions = not self.show_full_result_count or bool(self.full_result_count)
+        self.result_list = result_list
+        self.can_show_all = self.result_count <= self.list_max_show_all
+        self.multi_page = self.cursor is not None or self.next_cursor is not None
+        self.paginator = paginator
+
+    @property
+    def first_page_url(self):
+        return self.get_query_string()
+
+    @property
+    def next_page_url(self):
+        return self.get_query_string({CURSOR_VAR: self.next_cursor}) if self.next_cursor is not None else None
+
+
+class KeysetPaginationMixin:
+    """Keyset pages and estimated counts for a ModelAdmin over a large table."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    change_list_template = "admin/app/change_list_keyset.html"
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
@@ -0,0 +1,74 @@
+"""
+CSV exports streamed row by row. Querysets are read with server-side chunked
+``.iterator()`` so memory stays flat regardless of school size.
+"""
+import csv
+
+from app.attendance import decode_roster
+from app.models import AttendanceSession, StudentProfile
+
+CHUNK_SIZE = 2000
+ROSTER_HEADER = [
+    'student_id', 'first_name', 'last_name', 'email', 'class', 'division', 'category', 'guardian_name', 'guardian_phone',
+]
+ATTENDANCE_HEADER = ['date', 'slot', 'subject', 'class', 'division', 'student_id', 'status']
+
+
+class Echo:
+    """File-like object whose write() hands the formatted line straight back to csv.writer's caller."""
+    def write(self, value):
+        return value
+
+
+def stream_csv(header, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+def roster_rows(class_id=None, division_id=None):
+    students = StudentProfile.objects.all()
+    if class_id:
+        students = students.filter(division__class_field_id=class_id)
+    if division_id:
+        students = students.filter(division_id=division_id)
+    return students.order_by('division__class_field__name', 'division__name', 'student_id').values_list(
+        'student_id', 'user__first_name', 'user__last_name', 'user__email', 'division__class_field__name',
+        'division__name', 'category', 'guardian_name', 'guardian_phone',
+    ).iterator(chunk_size=CHUNK_SIZE)
+
+def attendance_rows(class_id=None, division_id=None, subject_id=None, start=None, end=None):
+    sessions = AttendanceSession.objects.all()
+    if class_id:
+        sessions = sessions.filter(division__class_field_id=class_id)
+    if division_id:
+        sessions = sessions.filter(division_id=division_id)
+    if subject_id:
+        sessions = sessions.filter(subject_id=subject_id)
+    if start:
+        sessions = sessions.filter(date__gte=start)
+    if end:
+        sessions = sessions.filter(date__lte=end)
+    sessions = sessions.order_by('division_id', 'date', 'slot', 'subject__code').values_list(
+        'division_id', 'date', 'slot', 'subject__code', 'division__class_field__name', 'division__name',
+        'roster', 'presence',
+    )
+    current_division = None
+    student_ids = {}
+    for division_id, date, slot, code, class_name, division_name, roster_data, presence in sessions.iterator(
+        chunk_size=CHUNK_SIZE // 10
+    ):
+        if division_id != current_division:
+            # Only one division's id map is kept in memory at a time.
+            current_division = division_id
+            student_ids = {}
+        roster = decode_roster(roster_data)
+        missing = [pk for pk in roster if pk not in student_ids]
+        if missing:
+            student_ids.update(StudentProfile.objects.filter(pk__in=missing).values_list('pk', 'student_id'))
+        bits = int.from_bytes(bytes(presence), 'little')
+        for index, pk in enumerate(roster):
+            yield (
+                date.isoformat(), slot, code, class_name, division_name, student_ids.get(pk, f"#{pk}"),
+                'present' if bits >> index & 1 else 'absent',
+            )
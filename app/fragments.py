@@ -0,0 +1,55 @@
+"""
+Versioned template fragment caching.
+
+Templates cache their expensive, rarely-changing parts with Django's ``{% cache %}``
+tag for ``settings.FRAGMENT_CACHE_TIMEOUT`` seconds (available to templates as
+``fragment_timeout``), keyed on what they show plus a version. Changes bump the
+version rather than deleting fragments, so stale ones are simply never read again.
+Fragments are cached per process, but the versions live in the shared cache, so a
+bump retires the fragments of every worker:
+
+- sidebars vary on the user and ``request.role_version`` (see app.roles), which
+  changes whenever the user or their profile is saved;
+- dashboard widgets vary on ``division_version(...)`` of the divisions they show,
+  which combines a counter per division (bumped when attendance is marked for it), a
+  global counter (bumped when classes or divisions change or the attendance counters
+  are rebuilt) and the announcement feed version.
+
+Anything rendered per request, such as the CSRF token in the logout form, stays
+outside the cached blocks.
+"""
+from django.conf import settings
+
+from app.announcements import FEED_VERSION_KEY
+from erp.cache_backends import shared_cache
+
+GLOBAL_VERSION_KEY = "fragment_version"
+
+
+def _division_key(division_id):
+    return f"fragment_version_division_{division_id}"
+
+def _bump(key):
+    shared_cache.add(key, 0, None)
+    try:
+        shared_cache.incr(key)
+    except ValueError:
+        shared_cache.set(key, 1, None)
+
+def invalidate_division(division_id):
+    if division_id is not None:
+        _bump(_division_key(division_id))
+
+def invalidate_all():
+    _bump(GLOBAL_VERSION_KEY)
+
+def division_version(*division_ids):
+    """One string covering everything the division widgets show, read with a single cache round trip."""
+    keys = [GLOBAL_VERSION_KEY, FEED_VERSION_KEY, *(_division_key(pk) for pk in division_ids)]
+    values = shared_cache.get_many(keys)
+    return '.'.join(str(values.get(key, 0)) for key in keys)
+
+
+def fragment_cache(request):
+    """Context processor exposing ``fragment_timeout`` to ``{% cache %}`` tags."""
+    return {'fragment_timeout': getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 3600)}
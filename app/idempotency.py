@@ -0,0 +1,52 @@
+"""
+Idempotent JSON submissions.
+
+Clients send an ``Idempotency-Key`` header (any unique string, e.g. a UUID) with each
+logical submission and repeat it on retries. The response to the first request is
+stored under the key, in the same transaction as the writes it reports, so a retry
+after a dropped connection replays that response instead of writing again; reusing a
+key for a different payload is refused. Keys are scoped to the user and purged
+``settings.IDEMPOTENCY_KEY_TTL`` seconds after use.
+"""
+import hashlib
+import json
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from app.models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = IdempotencyKey._meta.get_field('key').max_length
+PURGE_PROBABILITY = 0.01
+
+
+class KeyReused(Exception):
+    pass
+
+
+def fingerprint(payload):
+    canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+def lookup(user, key, digest):
+    """The stored ``(status, response)`` for ``key``, or None; raises KeyReused if it was used for another payload."""
+    record = IdempotencyKey.objects.filter(user=user, key=key).values_list('fingerprint', 'status', 'response').first()
+    if record is None:
+        return None
+    if record[0] != digest:
+        raise KeyReused(f"{HEADER} {key!r} was already used for a different request.")
+    return record[1], record[2]
+
+def store(user, key, digest, status, response):
+    """Save the response; call inside the transaction that made the writes (IntegrityError if a retry won the race)."""
+    IdempotencyKey.objects.create(user=user, key=key, fingerprint=digest, status=status, response=response)
+    if random.random() < PURGE_PROBABILITY:
+        purge()
+
+def purge():
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 86400))
+    return IdempotencyKey.objects.filter(created_at__lt=cutoff).delete()[0]
@@ -0,0 +1,46 @@
+from django.db import transaction
+
+from app.models import LoginIdentifier, StudentProfile, TeacherProfile
+
+
+def identifier_rows(user, student=None, teacher=None):
+    """Build the LoginIdentifier rows for a user and (optionally) their profiles."""
+    Role = LoginIdentifier.Role
+    candidates = []
+    if student is not None:
+        candidates += [
+            (student.student_id, 0, Role.STUDENT, student.must_reset_password),
+            (user.email, 1, Role.STUDENT, student.must_reset_password),
+        ]
+    if teacher is not None:
+        candidates += [
+            (teacher.employee_id, 2, Role.TEACHER, teacher.must_reset_password),
+            (user.email, 3, Role.TEACHER, teacher.must_reset_password),
+        ]
+    candidates += [
+        (user.email, 4, Role.USER, False),
+        (user.username, 5, Role.USER, False),
+    ]
+    return [
+        LoginIdentifier(identifier=identifier, priority=priority, user=user, role=role, must_reset_password=must_reset)
+        for identifier, priority, role, must_reset in candidates
+        if identifier
+    ]
+
+def sync_login_identifiers(user):
+    student = StudentProfile.objects.filter(user=user).first()
+    teacher = TeacherProfile.objects.filter(user=user).first()
+    with transaction.atomic():
+        LoginIdentifier.objects.filter(user=user).delete()
+        LoginIdentifier.objects.bulk_create(identifier_rows(user, student, teacher))
+
+def resolve_login_identifier(user_input):
+    """Return the best LoginIdentifier (with its user) for the typed identifier, in one query."""
+    if not user_input:
+        return None
+    return (
+        LoginIdentifier.objects.select_related('user')
+        .filter(identifier=user_input)
+        .order_by('priority')
+        .first()
+    )
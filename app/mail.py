@@ -0,0 +1,99 @@
+"""
+Database-backed outbox. Views call ``enqueue_mail`` and return immediately; the
+``send_queued_mail`` command drains the queue in batches over one SMTP connection,
+retrying failures with exponential backoff until MAX_ATTEMPTS, then dead-lettering.
+"""
+import datetime
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from app.models import OutboundEmail
+
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 60  # seconds; doubles after every failed attempt
+BACKOFF_MAX = 3600
+CLAIM_TIMEOUT = 600  # a worker that crashed mid-batch releases its rows after this long
+
+
+def enqueue_mail(subject, message, recipient_list, from_email=None, html_message=None):
+    return OutboundEmail.objects.create(
+        subject=subject,
+        body=message,
+        html_body=html_message or '',
+        from_email=from_email or settings.EMAIL_HOST_USER or '',
+        recipients=list(recipient_list),
+    )
+
+def backoff(attempts):
+    return datetime.timedelta(seconds=min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX))
+
+def claim_batch(batch_size):
+    now = timezone.now()
+    OutboundEmail.objects.filter(
+        status=OutboundEmail.Status.SENDING, claimed_at__lt=now - datetime.timedelta(seconds=CLAIM_TIMEOUT)
+    ).update(status=OutboundEmail.Status.PENDING)
+    with transaction.atomic():
+        ids = list(
+            OutboundEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboundEmail.Status.PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        OutboundEmail.objects.filter(pk__in=ids).update(status=OutboundEmail.Status.SENDING, claimed_at=now)
+    return list(OutboundEmail.objects.filter(pk__in=ids).order_by('next_attempt_at'))
+
+def _record_failure(email, error):
+    email.attempts += 1
+    email.last_error = str(error)[:2000]
+    email.claimed_at = None
+    if email.attempts >= MAX_ATTEMPTS:
+        email.status = OutboundEmail.Status.DEAD
+    else:
+        email.status = OutboundEmail.Status.PENDING
+        email.next_attempt_at = timezone.now() + backoff(email.attempts)
+    email.save(update_fields=['attempts', 'last_error', 'claimed_at', 'status', 'next_attempt_at'])
+
+def send_batch(batch_size=50, connection=None):
+    """Send one claimed batch over a single connection; returns ``(sent, failed)``."""
+    batch = claim_batch(batch_size)
+    if not batch:
+        return 0, 0
+    connection = connection or get_connection()
+    sent = failed = 0
+    try:
+        connection.open()
+    except Exception as exc:
+        for email in batch:
+            _record_failure(email, exc)
+        return 0, len(batch)
+    try:
+        for email in batch:
+            message = EmailMultiAlternatives(
+                subject=email.subject,
+                body=email.body,
+                from_email=email.from_email or None,
+                to=email.recipients,
+                connection=connection,
+            )
+            if email.html_body:
+                message.attach_alternative(email.html_body, "text/html")
+            try:
+                # Backends return how many messages they sent; 0 means nothing went out
+                # (e.g. fail_silently, or no recipients), so keep the row for a retry.
+                if not connection.send_messages([message]):
+                    raise RuntimeError("The mail backend sent nothing.")
+            except Exception as exc:
+                _record_failure(email, exc)
+                failed += 1
+                continue
+            email.status = OutboundEmail.Status.SENT
+            email.sent_at = timezone.now()
+            email.claimed_at = None
+            email.save(update_fields=['status', 'sent_at', 'claimed_at'])
+            sent += 1
+    finally:
+        connection.close()
+    return sent, failed
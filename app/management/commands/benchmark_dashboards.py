@@ -0,0 +1,51 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment
+from django.urls import reverse
+
+from app.benchmarking import quiet_request_metrics, run_asgi, run_wsgi
+from app.models import StudentProfile, TeacherProfile
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare dashboard latency under the WSGI handler (sync views) and the ASGI handler "
+        "(async views) against the current database. Logs in as the first admin, teacher and student."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=10)
+        parser.add_argument('--output', help="Write the results as JSON to this path.")
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        teacher = TeacherProfile.objects.select_related('user').first()
+        student = StudentProfile.objects.select_related('user').first()
+        users = {
+            'dashboard_admin': User.objects.filter(is_staff=True).first(),
+            'dashboard_teacher': teacher.user if teacher else None,
+            'dashboard_student': student.user if student else None,
+        }
+        results = []
+        for name, user in users.items():
+            if user is None:
+                self.stderr.write(f"Skipping {name}: no matching user.")
+                continue
+            client = Client()
+            client.force_login(user)
+            path = reverse(name)
+            for server, runner, urlconf in [('wsgi', run_wsgi, 'erp.urls'), ('asgi', run_asgi, 'erp.urls_async')]:
+                with override_settings(ROOT_URLCONF=urlconf), quiet_request_metrics():
+                    summary = runner(path, client.cookies, options['requests'], options['concurrency'])
+                results.append({'view': name, 'server': server, **summary})
+                self.stdout.write(
+                    f"{name:<18} {server:<5} p50 {summary['p50_ms']:>8.2f}ms  p95 {summary['p95_ms']:>8.2f}ms  "
+                    f"p99 {summary['p99_ms']:>8.2f}ms  {summary['throughput_rps']:>8.1f} req/s  {summary['errors']} errors"
+                )
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
@@ -0,0 +1,196 @@
+import datetime
+import json
+import platform
+import uuid
+from http.cookies import SimpleCookie
+from importlib import import_module
+
+import django
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.contrib.auth.tokens import default_token_generator
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from app import urls
+from app.benchmarking import quiet_request_metrics, run_wsgi
+from app.models import AttendanceSession, Class, Division, StudentProfile, Subject, TeacherProfile
+from app.seeding import DEFAULT_PASSWORD
+from erp.session_cookie_middleware import ADMIN_SESSION_COOKIE_NAME
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark every page in app/urls.py and every admin changelist against the current "
+        "database (see seed_school), reporting latency percentiles, throughput, query counts and "
+        "template render time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100, help="Requests per view.")
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--password', default=DEFAULT_PASSWORD, help="Password of the seeded student, for login.")
+        parser.add_argument('--only', nargs='+', metavar='VIEW', help="Only benchmark these views.")
+        parser.add_argument('--output', help="Write the results as JSON to this path.")
+        parser.add_argument('--baseline', help="A previous --output file to compare p95 latency and queries with.")
+        parser.add_argument(
+            '--no-fragment-cache', action='store_true',
+            help="Render template fragments on every request, e.g. for a --baseline without fragment caching.",
+        )
+
+    def _cookies(self, user, admin_site=False):
+        client = Client()
+        if admin_site:
+            with override_settings(SESSION_COOKIE_NAME=ADMIN_SESSION_COOKIE_NAME):
+                client.force_login(user)
+        else:
+            client.force_login(user)
+        return client.cookies
+
+    def _reset_cookies(self, user):
+        # The session login() leaves for a student who must pick a new password.
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session['reset_user_id'] = user.pk
+        session.create()
+        return SimpleCookie({settings.SESSION_COOKIE_NAME: session.session_key})
+
+    def targets(self, password):
+        """
+        Yield ``(view, role, method, path, data, expected_status)`` for every benchmarked
+        request, optionally followed by a dict of extra run_wsgi() arguments.
+        """
+        student = StudentProfile.objects.select_related('user', 'division').exclude(division=None).first()
+        teacher = TeacherProfile.objects.select_related('user').exclude(divisions=None).first()
+        admin_user = User.objects.filter(is_staff=True).first()
+        if not (student and teacher and admin_user):
+            raise CommandError("Needs a student with a division, a class teacher and a staff user; run seed_school first.")
+        # Log in first: logging in updates last_login, which invalidates reset tokens.
+        self.cookies = {
+            'anonymous': {},
+            'student': self._cookies(student.user),
+            'teacher': self._cookies(teacher.user),
+            'admin': self._cookies(admin_user),
+            'admin_site': self._cookies(admin_user, admin_site=True),
+            'resetting': self._reset_cookies(student.user),
+        }
+        division = student.division
+        subject = Subject.objects.filter(division=division).first()
+        today = timezone.localdate()
+        yield 'index', 'anonymous', 'get', reverse('index'), None, 200
+        yield 'login', 'anonymous', 'get', reverse('login'), None, 200
+        yield 'reset_password_confirm', 'anonymous', 'get', reverse('reset_password_confirm', kwargs={
+            'uidb64': urlsafe_base64_encode(force_bytes(student.user.pk)),
+            'token': default_token_generator.make_token(student.user),
+        }), None, 200
+        # After the reset link: logging in changes last_login, which invalidates the token.
+        yield 'login:post', 'anonymous', 'post', reverse('login'), {'user': student.student_id, 'password': password}, 302
+        yield 'contact', 'anonymous', 'get', reverse('contact'), None, 200
+        yield 'forgot_password', 'anonymous', 'get', reverse('forgot_password'), None, 200
+        yield 'dashboard', 'student', 'get', reverse('dashboard'), None, 302
+        yield 'dashboard_student', 'student', 'get', reverse('dashboard_student'), None, 200
+        yield 'dashboard_teacher', 'teacher', 'get', reverse('dashboard_teacher'), None, 200
+        yield 'dashboard_admin', 'admin', 'get', reverse('dashboard_admin'), None, 200
+        yield 'export_roster', 'admin', 'get', reverse('export_roster'), {
+            'class': division.class_field_id, 'division': division.pk,
+        }, 200
+        yield 'export_attendance', 'admin', 'get', reverse('export_attendance'), {
+            'class': division.class_field_id, 'division': division.pk, 'subject': subject.pk if subject else '',
+            'start': (today - datetime.timedelta(days=30)).isoformat(), 'end': today.isoformat(),
+        }, 200
+        yield 'typeahead', 'admin', 'get', reverse('typeahead'), {'q': student.user.first_name[:2]}, 200
+        yield 'typeahead:teacher', 'teacher', 'get', reverse('typeahead'), {'q': student.user.last_name[:3]}, 200
+        session = AttendanceSession.objects.filter(subject=subject).order_by('-date', '-slot').first()
+        if session is not None:
+            # Marks the latest session again, each time under a new key so none is a replay.
+            yield 'submit_attendance', 'admin', 'post', reverse('submit_attendance'), {
+                'subject': subject.pk, 'date': session.date.isoformat(), 'slot': session.slot,
+                'marks': [{'student': student.pk, 'present': True}],
+            }, 200, {
+                'content_type': 'application/json', 'fresh_session': False,
+                'headers': lambda: {'Idempotency-Key': uuid.uuid4().hex},
+            }
+        yield 'sync_feed', 'teacher', 'get', reverse('sync_feed'), None, 200
+        yield 'attendance_analytics', 'admin', 'get', reverse('attendance_analytics'), {'division': division.pk}, 200
+        yield 'reset_password', 'resetting', 'get', reverse('reset_password'), None, 200
+        # Each request signs out of a session of its own, logged in before the timer starts.
+        yield 'signout', 'anonymous', 'post', reverse('signout'), None, 302, {
+            'fresh_session': lambda: self._cookies(student.user),
+        }
+        for model in admin.site._registry:
+            opts = model._meta
+            name = f"admin:{opts.app_label}_{opts.model_name}_changelist"
+            yield name, 'admin_site', 'get', reverse(name), None, 200
+
+    def handle(self, *args, **options):
+        try:
+            setup_test_environment()
+        except RuntimeError:
+            pass  # Already set up, e.g. when run from the test suite.
+        targets = list(self.targets(options['password']))
+        covered = {target[0].partition(':')[0] for target in targets}
+        missing = [pattern.name for pattern in urls.urlpatterns if pattern.name not in covered]
+        if missing:
+            raise CommandError(f"No benchmark target for: {', '.join(missing)}.")
+        if options['only']:
+            targets = [target for target in targets if target[0] in options['only']]
+        results = []
+        # Server-Timing carries each request's template render time back to run_wsgi.
+        overrides = {'SERVER_TIMING': True}
+        if options['no_fragment_cache']:
+            overrides['FRAGMENT_CACHE_TIMEOUT'] = 0
+        with override_settings(**overrides), quiet_request_metrics():
+            for view, role, method, path, data, expect, *extra in targets:
+                summary = run_wsgi(
+                    path, self.cookies[role], options['requests'], options['concurrency'],
+                    method=method, data=data, expect=expect, **{'fresh_session': method == 'post', **dict(*extra)},
+                )
+                results.append({'view': view, 'role': role, 'method': method.upper(), **summary})
+                self.stdout.write(
+                    f"{view:<40} p50 {summary['p50_ms']:>8.2f}ms  p95 {summary['p95_ms']:>8.2f}ms  "
+                    f"p99 {summary['p99_ms']:>8.2f}ms  {summary['throughput_rps']:>8.1f} req/s  "
+                    f"{summary.get('queries_mean', 0):>6.1f} queries  "
+                    f"{summary.get('template_ms_mean', 0):>7.2f}ms templates  {summary['errors']} errors"
+                )
+        report = {
+            'generated_at': timezone.now().isoformat(),
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            'requests': options['requests'],
+            'concurrency': options['concurrency'],
+            'fragment_cache': not options['no_fragment_cache'],
+            'dataset': {
+                'classes': Class.objects.count(),
+                'divisions': Division.objects.count(),
+                'students': StudentProfile.objects.count(),
+                'teachers': TeacherProfile.objects.count(),
+            },
+            'results': results,
+        }
+        if options['baseline']:
+            self.compare(report, options['baseline'])
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+
+    def compare(self, report, baseline_path):
+        try:
+            with open(baseline_path) as baseline_file:
+                baseline = {row['view']: row for row in json.load(baseline_file)['results']}
+        except (OSError, ValueError, KeyError) as exc:
+            raise CommandError(f"Can't read baseline {baseline_path}: {exc}")
+        self.stdout.write(f"\nCompared with {baseline_path}:")
+        for row in report['results']:
+            before = baseline.get(row['view'])
+            if before is None:
+                continue
+            change = (row['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100 if before['p95_ms'] else 0.0
+            queries = row.get('queries_mean', 0) - before.get('queries_mean', 0)
+            templates = row.get('template_ms_mean', 0) - before.get('template_ms_mean', 0)
+            line = f"{row['view']:<40} p95 {change:>+7.1f}%  queries {queries:>+6.1f}  templates {templates:>+7.2f}ms"
+            self.stdout.write(self.style.WARNING(line) if change > 10 or queries > 0 else line)
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from app.timetable import CALENDAR_DAYS_AHEAD, PENDING_LOOKBACK_DAYS, extend_calendar
+
+
+class Command(BaseCommand):
+    help = "Add SchoolDay rows around today, which pending attendance needs; run daily."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days-back', type=int, default=PENDING_LOOKBACK_DAYS)
+        parser.add_argument('--days-ahead', type=int, default=CALENDAR_DAYS_AHEAD)
+
+    def handle(self, *args, days_back, days_ahead, **options):
+        start, end = extend_calendar(days_back=days_back, days_ahead=days_ahead)
+        self.stdout.write(self.style.SUCCESS(f"The calendar covers {start} to {end}."))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.provisioning import DEFAULT_BATCH_SIZE, import_csv
+
+
+class Command(BaseCommand):
+    help = "Create students or teachers in bulk from a CSV file, reporting bad rows without stopping."
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=['students', 'teachers'])
+        parser.add_argument('csv_path')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--workers', type=int, default=None, help="Password hashing processes (default: CPU count).")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['csv_path'], newline='', encoding='utf-8-sig') as csv_file:
+                result = import_csv(options['kind'], csv_file, options['batch_size'], options['workers'])
+        except (OSError, ValueError) as exc:
+            raise CommandError(str(exc))
+        for line, error in result['errors']:
+            self.stderr.write(f"line {line}: {error}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {result['created']} {options['kind']}, skipped {len(result['errors'])} row(s)."
+        ))
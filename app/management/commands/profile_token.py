@@ -0,0 +1,12 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from app.profiling import TOKEN_HEADER, make_token
+
+
+class Command(BaseCommand):
+    help = "Print a signed header value that makes any request be profiled (see app.profiling)."
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{TOKEN_HEADER}: {make_token()}")
+        self.stderr.write(f"Valid for {settings.PROFILER_TOKEN_MAX_AGE} seconds.")
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.attendance import compute_stats, rebuild_stats
+from app.models import AttendanceStat
+
+
+class Command(BaseCommand):
+    help = "Rebuild the materialized attendance counters from raw sessions, or verify them with --check."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help="Only report counters that disagree with the raw data.")
+
+    def handle(self, *args, **options):
+        expected = compute_stats()
+        if options['check']:
+            stored = {
+                (scope, object_id): (attended, total)
+                for scope, object_id, attended, total in AttendanceStat.objects.values_list(
+                    'scope', 'object_id', 'attended', 'total'
+                ).iterator()
+            }
+            mismatches = 0
+            for key in sorted(set(expected) | set(stored)):
+                want = expected.get(key, (0, 0))
+                have = stored.get(key, (0, 0))
+                if want != have:
+                    mismatches += 1
+                    self.stderr.write(f"{key[0]} {key[1]}: stored {have[0]}/{have[1]}, expected {want[0]}/{want[1]}")
+            if mismatches:
+                raise CommandError(f"{mismatches} attendance counter(s) out of date.")
+            self.stdout.write(self.style.SUCCESS(f"All {len(expected)} attendance counters match."))
+            return
+        rebuilt = rebuild_stats(expected)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rebuilt} attendance counters."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from app.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the student/teacher search tokens, e.g. after bulk updates that skipped signals."
+
+    def handle(self, *args, **options):
+        created = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f"Wrote {created} search tokens."))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.seeding import CLASS_NAMES, DEFAULT_PASSWORD, seed_school
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill an empty database with a synthetic school for load testing. Every account "
+        "(students S000001…, teachers T00001…, staff 'admin') uses the same password."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=1000)
+        parser.add_argument('--students-per-division', type=int, default=40)
+        parser.add_argument('--classes', type=int, default=len(CLASS_NAMES))
+        parser.add_argument('--subjects-per-division', type=int, default=5)
+        parser.add_argument('--announcements-per-division', type=int, default=3)
+        parser.add_argument('--attendance-days', type=int, default=28, help="Days of past attendance to generate.")
+        parser.add_argument('--password', default=DEFAULT_PASSWORD)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            counts = seed_school(
+                students=options['students'],
+                students_per_division=options['students_per_division'],
+                classes=options['classes'],
+                subjects_per_division=options['subjects_per_division'],
+                announcements_per_division=options['announcements_per_division'],
+                attendance_days=options['attendance_days'],
+                password=options['password'],
+                seed=options['seed'],
+                batch_size=options['batch_size'],
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(
+            "Seeded " + ", ".join(f"{count} {name.replace('_', ' ')}" for name, count in counts.items()) + "."
+        ))
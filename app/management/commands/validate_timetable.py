@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.timetable import find_conflicts, timetable_entries
+
+
+class Command(BaseCommand):
+    help = "Check the whole timetable for double-booked teachers, divisions and rooms."
+
+    def handle(self, *args, **options):
+        entries = timetable_entries()
+        conflicts = find_conflicts(entries)
+        for kind, resource, first_id, second_id in conflicts:
+            self.stderr.write(f"{kind} {resource}: slot {first_id} overlaps slot {second_id}")
+        if conflicts:
+            raise CommandError(f"{len(conflicts)} conflict(s) in {len(entries)} timetable slots.")
+        self.stdout.write(self.style.SUCCESS(f"No conflicts in {len(entries)} timetable slots."))
@@ -0,0 +1,100 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Class',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(db_index=True, max_length=50, unique=True)),
+                ('description', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Division',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(db_index=True, max_length=100)),
+                ('max_students', models.PositiveIntegerField(default=30)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('class_field', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='divisions', to='app.class')),
+            ],
+            options={
+                'ordering': ['class_field', 'name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StudentProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('student_id', models.CharField(db_index=True, max_length=30, unique=True)),
+                ('date_of_birth', models.DateField()),
+                ('guardian_name', models.CharField(max_length=100)),
+                ('guardian_phone', models.CharField(max_length=20)),
+                ('address', models.TextField()),
+                ('category', models.CharField(choices=[('Science-Board', 'Science Board'), ('Science-JEE', 'Science Jee'), ('Science-NEET', 'Science Neet'), ('Commerce-Board', 'Commerce Board'), ('Commerce-CA', 'Commerce Ca')], max_length=50)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('must_reset_password', models.BooleanField(default=True)),
+                ('division', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='students', to='app.division')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='student_profile', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['student_id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='TeacherProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('employee_id', models.CharField(db_index=True, max_length=20, unique=True)),
+                ('qualification', models.CharField(max_length=255)),
+                ('specialization', models.CharField(max_length=255)),
+                ('experience_years', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('must_reset_password', models.BooleanField(default=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='teacher_profile', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['employee_id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Subject',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(db_index=True, max_length=100)),
+                ('code', models.CharField(db_index=True, max_length=30, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('division', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subjects', to='app.division')),
+                ('teacher', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='subjects', to='app.teacherprofile')),
+            ],
+            options={
+                'ordering': ['code'],
+            },
+        ),
+        migrations.AddField(
+            model_name='division',
+            name='teacher',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='divisions', to='app.teacherprofile'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='division',
+            unique_together={('name', 'class_field')},
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0002_attendance_session'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('student', 'Student'), ('subject', 'Subject'), ('division', 'Division')], max_length=10)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('attended', models.PositiveIntegerField(default=0)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('scope', 'object_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:06
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_login_identifiers(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    StudentProfile = apps.get_model('app', 'StudentProfile')
+    TeacherProfile = apps.get_model('app', 'TeacherProfile')
+    LoginIdentifier = apps.get_model('app', 'LoginIdentifier')
+    students = {p.user_id: p for p in StudentProfile.objects.all()}
+    teachers = {p.user_id: p for p in TeacherProfile.objects.all()}
+    rows = []
+    for user in User.objects.all().iterator():
+        candidates = []
+        student = students.get(user.pk)
+        if student is not None:
+            candidates += [(student.student_id, 0, 'student', student.must_reset_password),
+                           (user.email, 1, 'student', student.must_reset_password)]
+        teacher = teachers.get(user.pk)
+        if teacher is not None:
+            candidates += [(teacher.employee_id, 2, 'teacher', teacher.must_reset_password),
+                           (user.email, 3, 'teacher', teacher.must_reset_password)]
+        candidates += [(user.email, 4, 'user', False), (user.username, 5, 'user', False)]
+        rows += [
+            LoginIdentifier(identifier=identifier, priority=priority, user_id=user.pk, role=role,
+                            must_reset_password=must_reset)
+            for identifier, priority, role, must_reset in candidates
+            if identifier
+        ]
+    LoginIdentifier.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_announcement'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoginIdentifier',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('identifier', models.CharField(max_length=254)),
+                ('priority', models.PositiveSmallIntegerField()),
+                ('role', models.CharField(choices=[('student', 'Student'), ('teacher', 'Teacher'), ('user', 'User')], max_length=10)),
+                ('must_reset_password', models.BooleanField(default=False)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='login_identifiers', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['identifier', 'priority'],
+                'indexes': [models.Index(fields=['identifier', 'priority'], name='app_loginid_identif_e96780_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_login_identifiers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_timetable'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='timetableslot',
+            index=models.Index(fields=['weekday', 'start_time'], name='app_timetab_weekday_173707_idx'),
+        ),
+    ]
@@ -0,0 +1,93 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:38
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# A frozen copy of app.search's tokenizer as of this migration, so later changes to it
+# don't change what the backfill did; rebuild_search_index applies the current rules.
+MAX_TOKEN_LENGTH = 64
+ID_WEIGHT, NAME_WEIGHT, PHONE_WEIGHT, CONTACT_WEIGHT, PHONE_SUFFIX_WEIGHT, GUARDIAN_WEIGHT = 8, 6, 4, 3, 2, 1
+PHONE_SUFFIX_MIN = 4
+
+
+def _add(terms, text, weight):
+    text = unicodedata.normalize('NFKD', str(text or ''))
+    text = ''.join(char for char in text if not unicodedata.combining(char)).casefold()
+    for word in re.findall(r'\w+', text):
+        word = word[:MAX_TOKEN_LENGTH]
+        terms[word] = max(terms.get(word, 0), weight)
+
+def _person_terms(user):
+    terms = {}
+    _add(terms, user.first_name, NAME_WEIGHT)
+    _add(terms, user.last_name, NAME_WEIGHT)
+    _add(terms, user.email, CONTACT_WEIGHT)
+    _add(terms, user.username, CONTACT_WEIGHT)
+    return terms
+
+def student_terms(user, student):
+    terms = _person_terms(user)
+    _add(terms, student.guardian_name, GUARDIAN_WEIGHT)
+    digits = re.sub(r'\D', '', student.guardian_phone or '')
+    for start in range(1, len(digits) - PHONE_SUFFIX_MIN + 1):
+        terms.setdefault(digits[start:], PHONE_SUFFIX_WEIGHT)
+    _add(terms, digits, PHONE_WEIGHT)
+    _add(terms, student.student_id, ID_WEIGHT)
+    return terms
+
+def teacher_terms(user, teacher):
+    terms = _person_terms(user)
+    _add(terms, teacher.employee_id, ID_WEIGHT)
+    return terms
+
+
+def backfill_search_tokens(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    StudentProfile = apps.get_model('app', 'StudentProfile')
+    TeacherProfile = apps.get_model('app', 'TeacherProfile')
+    SearchToken = apps.get_model('app', 'SearchToken')
+    users = User.objects.in_bulk()
+    rows = []
+    for student in StudentProfile.objects.iterator():
+        rows += [
+            SearchToken(token=token, weight=weight, user_id=student.user_id, role='student',
+                        profile_id=student.pk, division_id=student.division_id)
+            for token, weight in student_terms(users[student.user_id], student).items()
+        ]
+    for teacher in TeacherProfile.objects.iterator():
+        rows += [
+            SearchToken(token=token, weight=weight, user_id=teacher.user_id, role='teacher', profile_id=teacher.pk)
+            for token, weight in teacher_terms(users[teacher.user_id], teacher).items()
+        ]
+    SearchToken.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_request_profile'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=64)),
+                ('weight', models.PositiveSmallIntegerField()),
+                ('role', models.CharField(choices=[('student', 'Student'), ('teacher', 'Teacher')], max_length=10)),
+                ('profile_id', models.PositiveBigIntegerField()),
+                ('division_id', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['token'], name='app_searcht_token_6075b3_idx'), models.Index(fields=['division_id', 'token'], name='app_searcht_divisio_05a91a_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_search_tokens, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0013_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncSequence',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SyncChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.PositiveBigIntegerField(unique=True)),
+                ('kind', models.CharField(choices=[('division', 'Division'), ('student', 'Student'), ('subject', 'Subject'), ('timetable_slot', 'Timetable Slot'), ('announcement', 'Announcement')], max_length=20)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('division_id', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('class_id', models.PositiveBigIntegerField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['division_id', 'seq'], name='app_synccha_divisio_32181f_idx'), models.Index(fields=['class_id', 'seq'], name='app_synccha_class_i_ce5703_idx'), models.Index(fields=['kind', 'object_id'], name='app_synccha_kind_942ecb_idx')],
+            },
+        ),
+    ]
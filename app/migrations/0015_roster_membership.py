@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:08
+
+import sys
+from array import array
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def decode_roster(data):
+    # A copy of app.attendance.decode_roster as of this migration: little-endian uint64 ids.
+    ids = array('Q')
+    ids.frombytes(bytes(data))
+    if sys.byteorder != 'little':
+        ids.byteswap()
+    return ids
+
+
+def backfill_roster_memberships(apps, schema_editor):
+    AttendanceSession = apps.get_model('app', 'AttendanceSession')
+    RosterMembership = apps.get_model('app', 'RosterMembership')
+    StudentProfile = apps.get_model('app', 'StudentProfile')
+    pairs = set()
+    for division_id, roster in AttendanceSession.objects.values_list('division_id', 'roster').iterator():
+        pairs.update((student_id, division_id) for student_id in decode_roster(roster))
+    # Rosters keep the ids of students deleted since.
+    students = set(StudentProfile.objects.values_list('pk', flat=True))
+    RosterMembership.objects.bulk_create(
+        [RosterMembership(student_id=student_id, division_id=division_id) for student_id, division_id in pairs
+         if student_id in students],
+        batch_size=1000,
+    )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0014_sync_change'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RosterMembership',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('division', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='roster_memberships', to='app.division')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='roster_memberships', to='app.studentprofile')),
+            ],
+            options={
+                'unique_together': {('student', 'division')},
+            },
+        ),
+        migrations.RunPython(backfill_roster_memberships, migrations.RunPython.noop),
+    ]
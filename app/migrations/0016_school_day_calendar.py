@@ -0,0 +1,14 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:18
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # Schema-only: run ``manage.py extend_calendar`` after migrating (and daily) to fill the calendar.
+
+    dependencies = [
+        ('app', '0015_roster_membership'),
+    ]
+
+    operations = [
+    ]
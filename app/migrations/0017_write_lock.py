@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0016_school_day_calendar'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WriteLock',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('acquired_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -1,5 +1,7 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.utils import timezone
 
 class Class(models.Model):
     name = models.CharField(max_length=50, unique=True, db_index=True)
@@ -71,6 +73,11 @@ class StudentProfile(models.Model):
 
     class Meta:
         ordering = ['student_id']
+        # Admin filters by division or category, paged in student_id order (see app.changelist).
+        indexes = [
+            models.Index(fields=['division', 'student_id']),
+            models.Index(fields=['category', 'student_id']),
+        ]
 
     def __str__(self):
         return f"{self.user.get_full_name()} ({self.student_id})"
@@ -93,3 +100,370 @@ class Subject(models.Model):
 
     def __repr__(self):
         return f"<Subject {self.code}>"
+
+class AttendanceSession(models.Model):
+    """
+    One taught session of a Subject. The roster is a snapshot of the division's
+    student ids (ascending, packed as little-endian uint64) and ``presence`` is a
+    bitmap where bit ``i`` is set when ``roster[i]`` attended.
+    """
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='attendance_sessions')
+    division = models.ForeignKey(Division, on_delete=models.CASCADE, related_name='attendance_sessions')
+    date = models.DateField()
+    slot = models.PositiveSmallIntegerField(default=1)
+    roster = models.BinaryField()
+    presence = models.BinaryField()
+    roster_size = models.PositiveIntegerField(default=0)
+    present_count = models.PositiveIntegerField(default=0)
+    marked_by = models.ForeignKey(TeacherProfile, on_delete=models.SET_NULL, null=True, blank=True, related_name='attendance_sessions')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('subject', 'date', 'slot')
+        ordering = ['-date', 'slot']
+        indexes = [
+            models.Index(fields=['division', 'date']),
+        ]
+
+    def __str__(self):
+        return f"{self.subject_id} {self.date} #{self.slot}"
+
+    def __repr__(self):
+        return f"<AttendanceSession {self.subject_id} {self.date} #{self.slot}>"
+
+class RosterMembership(models.Model):
+    """A division whose session rosters include the student, so their history survives a transfer."""
+    student = models.ForeignKey(StudentProfile, on_delete=models.CASCADE, related_name='roster_memberships')
+    division = models.ForeignKey(Division, on_delete=models.CASCADE, related_name='roster_memberships')
+
+    class Meta:
+        unique_together = ('student', 'division')
+
+    def __str__(self):
+        return f"{self.student_id} in {self.division_id}"
+
+class AttendanceStat(models.Model):
+    """Materialized attended/total counters, kept in step by app.attendance.mark_session."""
+    class Scope(models.TextChoices):
+        STUDENT = 'student'
+        SUBJECT = 'subject'
+        DIVISION = 'division'
+
+    scope = models.CharField(max_length=10, choices=Scope.choices)
+    object_id = models.PositiveBigIntegerField()
+    attended = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('scope', 'object_id')
+
+    @property
+    def percent(self):
+        if not self.total:
+            return 0
+        return round(self.attended * 100 / self.total, 1)
+
+    def __str__(self):
+        return f"{self.scope} {self.object_id}: {self.attended}/{self.total}"
+
+    def __repr__(self):
+        return f"<AttendanceStat {self.scope} {self.object_id}>"
+
+class Announcement(models.Model):
+    """Targeted at one division, every division of a class, or (with neither set) the whole school."""
+    title = models.CharField(max_length=200)
+    text = models.TextField()
+    division = models.ForeignKey(Division, on_delete=models.CASCADE, null=True, blank=True, related_name='announcements')
+    class_field = models.ForeignKey(Class, on_delete=models.CASCADE, null=True, blank=True, related_name='announcements')
+    author = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='announcements')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return self.title
+
+    def __repr__(self):
+        return f"<Announcement {self.title}>"
+
+class LoginIdentifier(models.Model):
+    """
+    Denormalized index of everything a person may type into the login form. Rows are
+    rebuilt by signals in app.signals; ``priority`` preserves the historical lookup order
+    (student id, student email, employee id, teacher email, user email, username).
+    """
+    class Role(models.TextChoices):
+        STUDENT = 'student'
+        TEACHER = 'teacher'
+        USER = 'user'
+
+    identifier = models.CharField(max_length=254)
+    priority = models.PositiveSmallIntegerField()
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='login_identifiers')
+    role = models.CharField(max_length=10, choices=Role.choices)
+    must_reset_password = models.BooleanField(default=False)
+
+    class Meta:
+        ordering = ['identifier', 'priority']
+        indexes = [
+            models.Index(fields=['identifier', 'priority']),
+        ]
+
+    def __str__(self):
+        return f"{self.identifier} -> {self.user_id} ({self.role})"
+
+    def __repr__(self):
+        return f"<LoginIdentifier {self.identifier}>"
+
+class SearchToken(models.Model):
+    """
+    Normalized words of a student's or teacher's name, id, email and guardian phone,
+    for prefix search (see app.search). Rows are rebuilt by signals in app.signals;
+    ``division_id`` is copied from the student so teachers' searches filter on it
+    without a join.
+    """
+    class Role(models.TextChoices):
+        STUDENT = 'student'
+        TEACHER = 'teacher'
+
+    token = models.CharField(max_length=64)
+    weight = models.PositiveSmallIntegerField()
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='search_tokens')
+    role = models.CharField(max_length=10, choices=Role.choices)
+    profile_id = models.PositiveBigIntegerField()
+    division_id = models.PositiveBigIntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['token']),
+            models.Index(fields=['division_id', 'token']),
+        ]
+
+    def __str__(self):
+        return f"{self.token} -> {self.role} {self.profile_id}"
+
+    def __repr__(self):
+        return f"<SearchToken {self.token}>"
+
+class RateLimitCounter(models.Model):
+    """Hit counter for one rate-limit key and window bucket (used by app.ratelimit.DatabaseBackend)."""
+    key = models.CharField(max_length=200)
+    bucket = models.BigIntegerField()
+    count = models.PositiveIntegerField(default=0)
+    expires_at = models.FloatField(db_index=True)
+
+    class Meta:
+        unique_together = ('key', 'bucket')
+
+    def __str__(self):
+        return f"{self.key} #{self.bucket}: {self.count}"
+
+    def __repr__(self):
+        return f"<RateLimitCounter {self.key} #{self.bucket}>"
+
+class OutboundEmail(models.Model):
+    """Queued message drained by the send_queued_mail command (see app.mail)."""
+    class Status(models.TextChoices):
+        PENDING = 'pending'
+        SENDING = 'sending'
+        SENT = 'sent'
+        DEAD = 'dead'
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=254, blank=True)
+    recipients = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.recipients)} ({self.status})"
+
+    def __repr__(self):
+        return f"<OutboundEmail {self.pk} {self.status}>"
+
+class SchoolDay(models.Model):
+    """Calendar table used to expand the weekly timetable into dated sessions."""
+    date = models.DateField(unique=True)
+    weekday = models.PositiveSmallIntegerField(db_index=True)  # Monday is 0, as date.weekday()
+    is_holiday = models.BooleanField(default=False)
+    note = models.CharField(max_length=200, blank=True)
+
+    class Meta:
+        ordering = ['date']
+
+    def __str__(self):
+        return f"{self.date}{' (holiday)' if self.is_holiday else ''}"
+
+    def __repr__(self):
+        return f"<SchoolDay {self.date}>"
+
+class TimetableSlot(models.Model):
+    """A recurring weekly period of a Subject; ``slot`` matches AttendanceSession.slot."""
+    class Weekday(models.IntegerChoices):
+        MONDAY = 0
+        TUESDAY = 1
+        WEDNESDAY = 2
+        THURSDAY = 3
+        FRIDAY = 4
+        SATURDAY = 5
+        SUNDAY = 6
+
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='timetable_slots')
+    weekday = models.PositiveSmallIntegerField(choices=Weekday.choices)
+    slot = models.PositiveSmallIntegerField(default=1)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    room = models.CharField(max_length=50, blank=True)
+    valid_from = models.DateField()
+    valid_until = models.DateField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['weekday', 'start_time']
+        indexes = [
+            models.Index(fields=['subject', 'weekday']),
+            models.Index(fields=['weekday', 'start_time']),
+        ]
+
+    def clean(self):
+        if self.start_time and self.end_time and self.start_time >= self.end_time:
+            raise ValidationError("The slot must end after it starts.")
+        if self.valid_until and self.valid_from and self.valid_until < self.valid_from:
+            raise ValidationError("valid_until must not be before valid_from.")
+
+    def save(self, *args, check_conflicts=True, **kwargs):
+        """
+        Raises ValidationError for double bookings, checked under the timetable write
+        lock. Pass ``check_conflicts=False`` only when the caller has checked under the
+        lock in the same transaction (as the admin form does).
+        """
+        from app.timetable import check_slot, lock_timetable
+        with transaction.atomic():
+            if check_conflicts:
+                lock_timetable()
+                check_slot(self)
+            super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.subject_id} {self.get_weekday_display()} {self.start_time}-{self.end_time}"
+
+    def __repr__(self):
+        return f"<TimetableSlot {self.subject_id} {self.weekday} #{self.slot}>"
+
+class RequestProfile(models.Model):
+    """A cProfile capture of one request (see app.profiling)."""
+    class Trigger(models.TextChoices):
+        REQUESTED = 'requested'
+        SAMPLED = 'sampled'
+
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    view = models.CharField(max_length=200, blank=True, db_index=True)
+    role = models.CharField(max_length=20)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='request_profiles')
+    status = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField(db_index=True)
+    queries = models.PositiveIntegerField(null=True, blank=True)
+    trigger = models.CharField(max_length=10, choices=Trigger.choices)
+    summary = models.TextField(help_text="Top functions by cumulative time.")
+    collapsed = models.TextField(help_text="Collapsed stacks (microseconds) for flamegraph tools.")
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['-duration_ms']
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
+
+    def __repr__(self):
+        return f"<RequestProfile {self.pk} {self.path}>"
+
+class IdempotencyKey(models.Model):
+    """The stored response to a client's ``Idempotency-Key``, replayed on retries (see app.idempotency)."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=100)
+    fingerprint = models.CharField(max_length=64, help_text="SHA-256 of the canonical request payload.")
+    status = models.PositiveSmallIntegerField()
+    response = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        unique_together = ('user', 'key')
+
+    def __str__(self):
+        return f"{self.key} ({self.user_id}): {self.status}"
+
+    def __repr__(self):
+        return f"<IdempotencyKey {self.key}>"
+
+class SyncSequence(models.Model):
+    """A named counter; its row lock orders SyncChange sequence numbers by commit (see app.sync)."""
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+    def __repr__(self):
+        return f"<SyncSequence {self.name}>"
+
+class SyncChange(models.Model):
+    """
+    The latest change to one synced object within one scope: its division, or for
+    announcements to a class or the whole school, ``class_id`` (both null for the
+    latter). Written from app.signals; read by the delta feed in app.sync.
+    """
+    class Kind(models.TextChoices):
+        DIVISION = 'division'
+        STUDENT = 'student'
+        SUBJECT = 'subject'
+        TIMETABLE_SLOT = 'timetable_slot'
+        ANNOUNCEMENT = 'announcement'
+
+    seq = models.PositiveBigIntegerField(unique=True)
+    kind = models.CharField(max_length=20, choices=Kind.choices)
+    object_id = models.PositiveBigIntegerField()
+    division_id = models.PositiveBigIntegerField(null=True, blank=True)
+    class_id = models.PositiveBigIntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['division_id', 'seq']),
+            models.Index(fields=['class_id', 'seq']),
+            models.Index(fields=['kind', 'object_id']),
+        ]
+
+    def __str__(self):
+        return f"#{self.seq} {self.kind} {self.object_id}"
+
+    def __repr__(self):
+        return f"<SyncChange {self.seq}>"
+
+class WriteLock(models.Model):
+    """
+    A named row that writers of one kind of data update to hold its lock until they
+    commit, serializing check-then-write sequences (see app.timetable).
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    acquired_at = models.DateTimeField()
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return f"<WriteLock {self.name}>"
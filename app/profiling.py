@@ -0,0 +1,204 @@
+"""
+On-demand request profiling.
+
+``ProfilingMiddleware`` profiles a request when
+
+- a staff user adds ``?_profile=1`` to the URL,
+- the request carries an ``X-Profile-Token`` header from ``make_token()`` (see the
+  ``profile_token`` command), valid for ``settings.PROFILER_TOKEN_MAX_AGE`` seconds, or
+- it falls in the sampled fraction ``settings.PROFILER_SAMPLE_RATE`` of traffic.
+
+The request runs under cProfile, for a summary of the functions with the most
+cumulative time, while a background thread samples its stack every
+``settings.PROFILER_SAMPLE_INTERVAL`` seconds (cProfile only keeps caller/callee
+pairs, not whole stacks). Each capture is stored as a RequestProfile with the
+summary and collapsed stacks (``frame;frame;frame microseconds`` lines, as read by
+flamegraph.pl or speedscope), and the response carries its id in ``X-Profile-Id``.
+
+Only one request per process is profiled at a time; others that ask meanwhile run
+unprofiled. Under ASGI only the event loop thread is profiled, including whatever
+else it ran meanwhile.
+"""
+import cProfile
+import io
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core import signing
+
+from app import roles
+from app.models import RequestProfile
+from erp.request_metrics import current_metrics, paused
+
+QUERY_FLAG = '_profile'
+TOKEN_HEADER = 'X-Profile-Token'
+TOKEN_SALT = 'app.profiling'
+SUMMARY_LINES = 40
+
+_lock = threading.Lock()
+
+
+def make_token():
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign('profile')
+
+def _valid_token(token):
+    try:
+        signing.TimestampSigner(salt=TOKEN_SALT).unsign(
+            token, max_age=getattr(settings, 'PROFILER_TOKEN_MAX_AGE', 3600)
+        )
+    except signing.BadSignature:
+        return False
+    return True
+
+def profile_trigger(request, is_staff):
+    if is_staff and request.GET.get(QUERY_FLAG) == '1':
+        return RequestProfile.Trigger.REQUESTED
+    token = request.headers.get(TOKEN_HEADER)
+    if token and _valid_token(token):
+        return RequestProfile.Trigger.REQUESTED
+    rate = getattr(settings, 'PROFILER_SAMPLE_RATE', 0)
+    if rate and random.random() < rate:
+        return RequestProfile.Trigger.SAMPLED
+    return None
+
+
+def _short_path(filename):
+    marker = f"site-packages{os.sep}"
+    if marker in filename:
+        return filename.split(marker, 1)[1]
+    base = str(settings.BASE_DIR)
+    if filename.startswith(base):
+        return os.path.relpath(filename, base)
+    return os.path.basename(filename)
+
+def _frame(code):
+    return f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})".replace(';', ',')
+
+
+class StackSampler:
+    """
+    Samples one thread's Python stack from a background thread, adding the time
+    since the previous sample to the stack seen. Frames above ``stop_frame`` (the
+    middleware itself and the server) are left out.
+    """
+    def __init__(self, thread_id, stop_frame=None, interval=None):
+        self.thread_id = thread_id
+        self.stop_frame = stop_frame
+        self.interval = interval or getattr(settings, 'PROFILER_SAMPLE_INTERVAL', 0.001)
+        self.stacks = {}
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._done.set()
+        self._thread.join()
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            if frame is not None:
+                stack = self._collapse(frame)
+                if stack:
+                    self.stacks[stack] = self.stacks.get(stack, 0) + (now - last) * 1e6
+            last = now
+
+    def _collapse(self, frame):
+        frames = []
+        while frame is not None and frame is not self.stop_frame:
+            if frame.f_code is StackSampler.__exit__.__code__:
+                return ''  # Caught the request finishing: the sampler is being stopped.
+            frames.append(_frame(frame.f_code))
+            frame = frame.f_back
+        return ';'.join(reversed(frames))
+
+
+def save_profile(request, response, profiler, stacks, duration_ms, queries, trigger):
+    summary = io.StringIO()
+    pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(SUMMARY_LINES)
+    user = getattr(request, 'user', None)
+    match = request.resolver_match
+    profile = RequestProfile.objects.create(
+        method=request.method,
+        path=request.get_full_path()[:500],
+        view=match._func_path if match else '',
+        role=getattr(request, 'role', None) or (roles.resolve(user)[0] if user is not None else roles.ANONYMOUS),
+        user=user if user is not None and user.is_authenticated else None,
+        status=response.status_code,
+        duration_ms=duration_ms,
+        queries=queries,
+        trigger=trigger,
+        summary=summary.getvalue(),
+        collapsed="\n".join(f"{stack} {round(us)}" for stack, us in sorted(stacks.items())),
+    )
+    keep = getattr(settings, 'PROFILER_MAX_STORED', 500)
+    cutoff = RequestProfile.objects.order_by('-pk').values_list('pk', flat=True)[keep:keep + 1].first()
+    if cutoff is not None:
+        RequestProfile.objects.filter(pk__lte=cutoff).delete()
+    return profile
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _finish(self, request, response, profiler, sampler, started, trigger):
+        duration_ms = (time.perf_counter() - started) * 1000
+        metrics = current_metrics()
+        with paused():
+            return save_profile(
+                request, response, profiler, sampler.stacks, duration_ms, metrics.queries if metrics else None, trigger,
+            )
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        trigger = profile_trigger(request, QUERY_FLAG in request.GET and request.user.is_staff)
+        if not trigger or not _lock.acquire(blocking=False):
+            return self.get_response(request)
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            with StackSampler(threading.get_ident(), stop_frame=sys._getframe()) as sampler:
+                response = profiler.runcall(self.get_response, request)
+        finally:
+            _lock.release()
+        profile = self._finish(request, response, profiler, sampler, started, trigger)
+        response['X-Profile-Id'] = str(profile.pk)
+        return response
+
+    async def __acall__(self, request):
+        is_staff = QUERY_FLAG in request.GET and (await request.auser()).is_staff
+        trigger = profile_trigger(request, is_staff)
+        if not trigger or not _lock.acquire(blocking=False):
+            return await self.get_response(request)
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            with StackSampler(threading.get_ident()) as sampler:
+                profiler.enable()
+                try:
+                    response = await self.get_response(request)
+                finally:
+                    profiler.disable()
+        finally:
+            _lock.release()
+        profile = await sync_to_async(self._finish)(request, response, profiler, sampler, started, trigger)
+        response['X-Profile-Id'] = str(profile.pk)
+        return response
@@ -0,0 +1,243 @@
+"""
+Bulk creation of students and teachers from CSV.
+
+Rows are read lazily and processed in batches: each batch is validated, its initial
+passwords are hashed in a process pool, and its User and profile rows are written
+with ``bulk_create`` inside one transaction. Invalid rows, and rows clashing with
+people already in the database, are reported with their line number and skipped;
+they never abort the rest of the file.
+"""
+import csv
+import datetime
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.apps import apps
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+
+from app import stats, sync
+from app.identifiers import identifier_rows
+from app.models import Division, LoginIdentifier, SearchToken, StudentProfile, SyncChange, TeacherProfile
+from app.search import token_rows
+
+STUDENT_COLUMNS = [
+    'student_id', 'first_name', 'last_name', 'email', 'date_of_birth', 'guardian_name',
+    'guardian_phone', 'address', 'class', 'division', 'category',
+]
+TEACHER_COLUMNS = [
+    'employee_id', 'first_name', 'last_name', 'email', 'qualification', 'specialization', 'experience_years',
+]
+DEFAULT_BATCH_SIZE = 500
+
+
+def _init_worker():
+    # Spawned (non-forked) workers start without Django configured.
+    if not apps.ready:
+        django.setup()
+
+def _hash_password(password):
+    # Blank passwords become unusable: the person must use the forgot-password flow.
+    return make_password(password or None)
+
+
+class RowError(Exception):
+    pass
+
+
+def _required(row, columns):
+    missing = [column for column in columns if not (row.get(column) or '').strip()]
+    if missing:
+        raise RowError(f"missing {', '.join(missing)}")
+
+def _clean_email(row):
+    email = row['email'].strip()
+    try:
+        validate_email(email)
+    except ValidationError:
+        raise RowError(f"invalid email {email!r}")
+    return email
+
+def _build_student(row, divisions):
+    _required(row, STUDENT_COLUMNS)
+    try:
+        date_of_birth = datetime.date.fromisoformat(row['date_of_birth'].strip())
+    except ValueError:
+        raise RowError(f"invalid date_of_birth {row['date_of_birth']!r}, expected YYYY-MM-DD")
+    category = row['category'].strip()
+    if category not in StudentProfile.Category.values:
+        raise RowError(f"unknown category {category!r}")
+    division = divisions.get((row['class'].strip(), row['division'].strip()))
+    if division is None:
+        raise RowError(f"unknown division {row['class'].strip()} {row['division'].strip()}")
+    student_id = row['student_id'].strip()
+    user = User(
+        username=student_id, email=_clean_email(row),
+        first_name=row['first_name'].strip(), last_name=row['last_name'].strip(),
+    )
+    profile = StudentProfile(
+        student_id=student_id, date_of_birth=date_of_birth, guardian_name=row['guardian_name'].strip(),
+        guardian_phone=row['guardian_phone'].strip(), address=row['address'].strip(), division=division,
+        category=category, must_reset_password=True,
+    )
+    return student_id, user, profile
+
+def _build_teacher(row, divisions):
+    _required(row, TEACHER_COLUMNS)
+    try:
+        experience_years = int(row['experience_years'])
+        if experience_years < 0:
+            raise ValueError
+    except ValueError:
+        raise RowError(f"invalid experience_years {row['experience_years']!r}")
+    employee_id = row['employee_id'].strip()
+    user = User(
+        username=employee_id, email=_clean_email(row),
+        first_name=row['first_name'].strip(), last_name=row['last_name'].strip(),
+    )
+    profile = TeacherProfile(
+        employee_id=employee_id, qualification=row['qualification'].strip(),
+        specialization=row['specialization'].strip(), experience_years=experience_years, must_reset_password=True,
+    )
+    return employee_id, user, profile
+
+KINDS = {
+    'students': (_build_student, StudentProfile, 'student_id', STUDENT_COLUMNS),
+    'teachers': (_build_teacher, TeacherProfile, 'employee_id', TEACHER_COLUMNS),
+}
+
+
+def _existing(model, id_field, ids, usernames, emails):
+    taken = set(model.objects.filter(**{f"{id_field}__in": ids}).values_list(id_field, flat=True))
+    taken |= set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+    taken_emails = set(User.objects.filter(email__in=emails).values_list('email', flat=True))
+    return taken, taken_emails
+
+def _import_batch(kind, rows, divisions, seen, pool, result):
+    build, model, id_field, _ = KINDS[kind]
+    built = []
+    for line, row in rows:
+        try:
+            key, user, profile = build(row, divisions)
+            if key in seen['ids'] or user.email in seen['emails']:
+                raise RowError(f"duplicate {id_field} or email within the file")
+        except RowError as exc:
+            result['errors'].append((line, str(exc)))
+            continue
+        seen['ids'].add(key)
+        seen['emails'].add(user.email)
+        built.append((line, key, user, profile, (row.get('password') or '').strip()))
+    if not built:
+        return
+    taken, taken_emails = _existing(
+        model, id_field, [b[1] for b in built], [b[2].username for b in built], [b[2].email for b in built]
+    )
+    accepted = []
+    for line, key, user, profile, password in built:
+        if key in taken or user.username in taken:
+            result['errors'].append((line, f"{id_field} {key} already exists"))
+        elif user.email in taken_emails:
+            result['errors'].append((line, f"email {user.email} already in use"))
+        else:
+            accepted.append((line, user, profile, password))
+    if not accepted:
+        return
+    passwords = [password for _, _, _, password in accepted]
+    hashes = pool.map(_hash_password, passwords, chunksize=16) if pool else map(_hash_password, passwords)
+    for (_, user, _, _), hashed in zip(accepted, hashes):
+        user.password = hashed
+    try:
+        with transaction.atomic():
+            _insert(kind, model, [(user, profile) for _, user, profile, _ in accepted])
+        created = len(accepted)
+    except IntegrityError:
+        # Someone created a clashing person since the check above: retry row by row so
+        # only those rows fail instead of the whole batch.
+        created = 0
+        for line, user, profile, _ in accepted:
+            try:
+                with transaction.atomic():
+                    _insert(kind, model, [(user, profile)])
+                created += 1
+            except IntegrityError:
+                result['errors'].append((line, f"{id_field} {user.username} was taken during the import"))
+    # Signals don't fire for bulk_create either, so the cached counts are recomputed.
+    stats.invalidate()
+    result['created'] += created
+
+def _insert(kind, model, people):
+    """Write ``(user, profile)`` pairs and their index rows; call inside a transaction."""
+    for user, profile in people:
+        user.pk = profile.pk = None  # Set by a rolled-back attempt on backends with RETURNING.
+    users = User.objects.bulk_create([user for user, _ in people])
+    if any(user.pk is None for user in users):
+        # Backends without RETURNING on bulk insert: look the new ids up by username.
+        ids = dict(User.objects.filter(username__in=[u.username for u in users]).values_list('username', 'pk'))
+        for user in users:
+            user.pk = ids[user.username]
+    profiles = []
+    for user, profile in people:
+        profile.user = user
+        profiles.append(profile)
+    model.objects.bulk_create(profiles)
+    # bulk_create skips signals, so the login and search indexes are populated here.
+    LoginIdentifier.objects.bulk_create([
+        row
+        for user, profile in people
+        for row in identifier_rows(
+            user,
+            student=profile if kind == 'students' else None,
+            teacher=profile if kind == 'teachers' else None,
+        )
+    ])
+    SearchToken.objects.bulk_create([
+        row
+        for user, profile in people
+        for row in token_rows(
+            user,
+            student=profile if kind == 'students' else None,
+            teacher=profile if kind == 'teachers' else None,
+        )
+    ])
+    if kind == 'students':
+        sync.record_many(
+            [(SyncChange.Kind.STUDENT, profile.pk, profile.division_id, None) for profile in profiles], compact=False,
+        )
+
+def import_csv(kind, csv_file, batch_size=DEFAULT_BATCH_SIZE, workers=None):
+    """
+    Import ``kind`` ('students' or 'teachers') from an open text file. Returns
+    ``{'created': int, 'errors': [(line, message), ...]}``.
+    """
+    if kind not in KINDS:
+        raise ValueError(f"Unknown import kind {kind!r}")
+    reader = csv.DictReader(csv_file)
+    missing = [column for column in KINDS[kind][3] if column not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"CSV is missing column(s): {', '.join(missing)}")
+    divisions = {}
+    if kind == 'students':
+        divisions = {
+            (division.class_field.name, division.name): division
+            for division in Division.objects.select_related('class_field')
+        }
+    result = {'created': 0, 'errors': []}
+    seen = {'ids': set(), 'emails': set()}
+    rows = enumerate(reader, start=2)
+    workers = os.cpu_count() if workers is None else workers
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) if workers > 1 else None
+    try:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            _import_batch(kind, batch, divisions, seen, pool, result)
+    finally:
+        if pool:
+            pool.shutdown()
+    return result
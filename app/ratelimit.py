@@ -0,0 +1,172 @@
+"""
+Sliding-window rate limiting shared by every worker process.
+
+Each limiter counts hits in fixed buckets of ``window`` seconds and estimates the
+rolling count as ``current + previous * (1 - elapsed / window)``. Counting relies on
+atomic increments in the configured backend (``settings.RATELIMIT_BACKEND``):
+
+- ``CacheBackend``: the default cache; atomic on Redis/Memcached, per-process on LocMem.
+- ``DatabaseBackend``: a row per key and bucket in the main database.
+- ``SQLiteBackend``: a small local SQLite file (``settings.RATELIMIT_SQLITE_PATH``),
+  shared by all workers on a single host.
+"""
+import hashlib
+import random
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.module_loading import import_string
+
+from app.models import RateLimitCounter
+
+
+class CacheBackend:
+    def __init__(self, alias='default'):
+        self.cache = caches[alias]
+
+    def _key(self, key, bucket):
+        return f"ratelimit_{key}_{bucket}"
+
+    def incr(self, key, bucket, ttl):
+        cache_key = self._key(key, bucket)
+        if self.cache.add(cache_key, 1, ttl):
+            return 1
+        try:
+            return self.cache.incr(cache_key)
+        except ValueError:
+            # Expired between add() and incr(); start the bucket again.
+            self.cache.add(cache_key, 1, ttl)
+            return 1
+
+    def get_many(self, key, buckets):
+        values = self.cache.get_many([self._key(key, bucket) for bucket in buckets])
+        return [values.get(self._key(key, bucket), 0) for bucket in buckets]
+
+    def delete(self, key, buckets):
+        self.cache.delete_many([self._key(key, bucket) for bucket in buckets])
+
+
+class DatabaseBackend:
+    purge_probability = 0.01
+
+    def incr(self, key, bucket, ttl):
+        counters = RateLimitCounter.objects.filter(key=key, bucket=bucket)
+        with transaction.atomic():
+            if not counters.update(count=F('count') + 1):
+                try:
+                    with transaction.atomic():
+                        RateLimitCounter.objects.create(key=key, bucket=bucket, count=1, expires_at=time.time() + ttl)
+                except IntegrityError:
+                    counters.update(count=F('count') + 1)
+            count = counters.values_list('count', flat=True).first()
+        if random.random() < self.purge_probability:
+            RateLimitCounter.objects.filter(expires_at__lt=time.time()).delete()
+        return count
+
+    def get_many(self, key, buckets):
+        counts = dict(RateLimitCounter.objects.filter(key=key, bucket__in=buckets).values_list('bucket', 'count'))
+        return [counts.get(bucket, 0) for bucket in buckets]
+
+    def delete(self, key, buckets):
+        RateLimitCounter.objects.filter(key=key, bucket__in=buckets).delete()
+
+
+class SQLiteBackend:
+    purge_probability = 0.01
+
+    def __init__(self, path=None):
+        self.path = str(path or getattr(settings, 'RATELIMIT_SQLITE_PATH', 'ratelimit.sqlite3'))
+        self.local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS ratelimit ("
+                "key TEXT NOT NULL, bucket INTEGER NOT NULL, count INTEGER NOT NULL, expires_at REAL NOT NULL, "
+                "PRIMARY KEY (key, bucket)) WITHOUT ROWID"
+            )
+            self.local.connection = connection
+        return connection
+
+    def incr(self, key, bucket, ttl):
+        connection = self._connection()
+        (count,) = connection.execute(
+            "INSERT INTO ratelimit (key, bucket, count, expires_at) VALUES (?, ?, 1, ?) "
+            "ON CONFLICT (key, bucket) DO UPDATE SET count = count + 1 RETURNING count",
+            (key, bucket, time.time() + ttl),
+        ).fetchone()
+        if random.random() < self.purge_probability:
+            connection.execute("DELETE FROM ratelimit WHERE expires_at < ?", (time.time(),))
+        return count
+
+    def get_many(self, key, buckets):
+        placeholders = ','.join('?' * len(buckets))
+        counts = dict(self._connection().execute(
+            f"SELECT bucket, count FROM ratelimit WHERE key = ? AND bucket IN ({placeholders})",
+            (key, *buckets),
+        ).fetchall())
+        return [counts.get(bucket, 0) for bucket in buckets]
+
+    def delete(self, key, buckets):
+        placeholders = ','.join('?' * len(buckets))
+        self._connection().execute(
+            f"DELETE FROM ratelimit WHERE key = ? AND bucket IN ({placeholders})", (key, *buckets)
+        )
+
+
+_backends = {}
+
+def get_backend():
+    # Keyed on the file too, so a changed RATELIMIT_SQLITE_PATH (e.g. in tests) takes effect.
+    path = getattr(settings, 'RATELIMIT_BACKEND', 'app.ratelimit.CacheBackend')
+    key = (path, getattr(settings, 'RATELIMIT_SQLITE_PATH', None))
+    if key not in _backends:
+        _backends[key] = import_string(path)()
+    return _backends[key]
+
+
+class RateLimiter:
+    def __init__(self, name, limit, window, backend=None):
+        self.name = name
+        self.limit = limit
+        self.window = window
+        self.backend = backend
+
+    def _state(self, key, now=None):
+        now = time.time() if now is None else now
+        bucket = int(now // self.window)
+        elapsed = (now % self.window) / self.window
+        digest = hashlib.sha1(str(key).encode()).hexdigest()
+        return f"{self.name}:{digest}", bucket, elapsed
+
+    def _backend(self):
+        return self.backend or get_backend()
+
+    def count(self, key, now=None):
+        full_key, bucket, elapsed = self._state(key, now)
+        current, previous = self._backend().get_many(full_key, [bucket, bucket - 1])
+        return current + previous * (1 - elapsed)
+
+    def is_limited(self, key, now=None):
+        return self.count(key, now) >= self.limit
+
+    def hit(self, key, now=None):
+        """Record one hit and return the estimated count in the rolling window."""
+        full_key, bucket, elapsed = self._state(key, now)
+        backend = self._backend()
+        current = backend.incr(full_key, bucket, self.window * 2)
+        (previous,) = backend.get_many(full_key, [bucket - 1])
+        return current + previous * (1 - elapsed)
+
+    def reset(self, key, now=None):
+        full_key, bucket, _ = self._state(key, now)
+        self._backend().delete(full_key, [bucket, bucket - 1])
@@ -0,0 +1,140 @@
+"""
+Role resolution for the signed-in user.
+
+``RoleMiddleware`` (after AuthenticationMiddleware) sets ``request.role`` to one of
+``ROLES``, ``request.profile`` to the user's TeacherProfile or StudentProfile
+(with division and class loaded), or None, and ``request.role_version`` to a string
+that changes whenever either might have. The role is resolved once at login and
+kept on the session with the cache versions it was resolved under; the profile
+object itself is cached (per process) under a key built from two version counters
+kept in the shared cache, so a change reaches every worker and normal page views
+skip the profile queries entirely:
+
+- a per-user version, bumped by app.signals when the user or one of their profiles
+  changes;
+- a global version, bumped when any division or class changes, since those are
+  loaded with the student profile.
+
+The resolved profile is also primed into ``user.student_profile`` /
+``user.teacher_profile``, so older template code reading those stays free.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+
+from erp.cache_backends import shared_cache
+
+STAFF = 'staff'
+TEACHER = 'teacher'
+STUDENT = 'student'
+USER = 'user'
+ANONYMOUS = 'anonymous'
+ROLES = [STAFF, TEACHER, STUDENT, USER, ANONYMOUS]
+
+# Where each role's dashboard lives; 'dashboard' is the generic landing page.
+DASHBOARDS = {
+    STAFF: 'dashboard_admin',
+    TEACHER: 'dashboard_teacher',
+    STUDENT: 'dashboard_student',
+    USER: 'dashboard',
+}
+
+SESSION_KEY = '_role'
+GLOBAL_VERSION_KEY = "role_version"
+PROFILE_TIMEOUT = 60 * 60
+
+
+def _user_version_key(user_id):
+    return f"role_version_{user_id}"
+
+def _profile_key(user_id, version, global_version):
+    return f"role_profile_{user_id}_{version}_{global_version}"
+
+def _bump(key):
+    shared_cache.add(key, 0, None)
+    try:
+        shared_cache.incr(key)
+    except ValueError:
+        shared_cache.set(key, 1, None)
+
+def invalidate_user(user_id):
+    _bump(_user_version_key(user_id))
+
+def invalidate_all():
+    _bump(GLOBAL_VERSION_KEY)
+
+
+def resolve(user):
+    """Return ``(role, profile)`` from the database, in the order the dashboards check them."""
+    if not user.is_authenticated:
+        return ANONYMOUS, None
+    if user.is_superuser or user.is_staff:
+        return STAFF, None
+    # Both reverse one-to-ones in one query; a missing profile raises an AttributeError subclass.
+    row = User.objects.select_related('teacher_profile', 'student_profile__division__class_field').get(pk=user.pk)
+    teacher = getattr(row, 'teacher_profile', None)
+    if teacher is not None:
+        return TEACHER, teacher
+    student = getattr(row, 'student_profile', None)
+    if student is not None:
+        return STUDENT, student
+    return USER, None
+
+def _prime(user, role, profile):
+    if role == TEACHER:
+        User.teacher_profile.related.set_cached_value(user, profile)
+    elif role == STUDENT:
+        User.student_profile.related.set_cached_value(user, profile)
+
+def role_version(request):
+    """The versions the session's role was resolved under, for keying cached fragments."""
+    entry = request.session.get(SESSION_KEY)
+    return f"{entry['version']}.{entry['global']}" if entry else ''
+
+def _annotate(request, user=None):
+    request.role, request.profile = role_for_request(request, user)
+    request.role_version = role_version(request)
+
+def role_for_request(request, user=None):
+    """Resolve ``(role, profile)`` for the request's user, from the session and cache when still current."""
+    user = request.user if user is None else user
+    if not user.is_authenticated:
+        return ANONYMOUS, None
+    user_key = _user_version_key(user.pk)
+    values = shared_cache.get_many([user_key, GLOBAL_VERSION_KEY])
+    version, global_version = values.get(user_key, 0), values.get(GLOBAL_VERSION_KEY, 0)
+    cached = request.session.get(SESSION_KEY)
+    if cached and cached['user'] == user.pk and (cached['version'], cached['global']) == (version, global_version):
+        profile = None
+        if cached['role'] in (TEACHER, STUDENT):
+            profile = cache.get(_profile_key(user.pk, version, global_version))
+        if profile is not None or cached['role'] not in (TEACHER, STUDENT):
+            _prime(user, cached['role'], profile)
+            return cached['role'], profile
+    role, profile = resolve(user)
+    if profile is not None:
+        cache.set(_profile_key(user.pk, version, global_version), profile, PROFILE_TIMEOUT)
+    request.session[SESSION_KEY] = {'user': user.pk, 'role': role, 'version': version, 'global': global_version}
+    _prime(user, role, profile)
+    return role, profile
+
+
+class RoleMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        _annotate(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        user = await request.auser()
+        await sync_to_async(_annotate)(request, user)
+        return await self.get_response(request)
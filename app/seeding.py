@@ -0,0 +1,231 @@
+"""
+Synthetic school data for load testing.
+
+``seed_school()`` builds Class → Division → Subject / TeacherProfile / StudentProfile
+rows (plus timetables, announcements and optionally past attendance) with
+``bulk_create``. Every seeded account shares one password hash, so even 100k students
+seed in seconds, and the same ``seed`` always produces the same school. Run it against
+an empty database, e.g. ``DB_NAME=bench.sqlite3``.
+
+Timetables are clash-free: subject ``j`` of division ``d`` meets on weekday
+``(j + d) % 5`` at hour ``8 + j // 5``, and each teacher takes the same subject in five
+consecutive divisions.
+"""
+import datetime
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from app import analytics, stats
+from app.announcements import invalidate_feeds
+from app.attendance import encode_presence, encode_roster, rebuild_stats
+from app.identifiers import identifier_rows
+from app.models import (
+    Announcement, AttendanceSession, Class, Division, LoginIdentifier, RosterMembership, SearchToken, StudentProfile,
+    Subject, TeacherProfile, TimetableSlot,
+)
+from app.search import token_rows
+from app.timetable import create_slots, extend_calendar
+
+CLASS_NAMES = ['I', 'II', 'III', 'IV', 'V', 'VI', 'VII', 'VIII', 'IX', 'X', 'XI', 'XII']
+SUBJECT_NAMES = [
+    'Mathematics', 'Physics', 'Chemistry', 'Biology', 'English', 'Accountancy', 'Economics',
+    'Computer Science', 'History', 'Geography',
+]
+FIRST_NAMES = [
+    'Aarav', 'Aditi', 'Ananya', 'Arjun', 'Diya', 'Ishaan', 'Kavya', 'Krishna', 'Meera', 'Neha',
+    'Nikhil', 'Priya', 'Rahul', 'Riya', 'Rohan', 'Saanvi', 'Sara', 'Vihaan', 'Vivaan', 'Zara',
+]
+LAST_NAMES = [
+    'Agarwal', 'Bose', 'Chopra', 'Das', 'Gupta', 'Iyer', 'Joshi', 'Kapoor', 'Khan', 'Kumar',
+    'Menon', 'Nair', 'Patel', 'Rao', 'Reddy', 'Shah', 'Sharma', 'Singh', 'Verma', 'Yadav',
+]
+DIVISION_NAMES = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+DEFAULT_PASSWORD = 'benchmark'
+ADMIN_USERNAME = 'admin'
+TEACHERS_SUBJECT_SPAN = 5
+
+
+def _division_name(index):
+    name = DIVISION_NAMES[index % len(DIVISION_NAMES)]
+    return name if index < len(DIVISION_NAMES) else f"{name}{index // len(DIVISION_NAMES)}"
+
+def _person(rng):
+    return rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+
+def _bulk_users(users, batch_size):
+    created = User.objects.bulk_create(users, batch_size=batch_size)
+    if any(user.pk is None for user in created):
+        # Backends without RETURNING on bulk insert: look the new ids up by username.
+        ids = dict(User.objects.filter(username__in=[u.username for u in created]).values_list('username', 'pk'))
+        for user in created:
+            user.pk = ids[user.username]
+    return created
+
+def _school_days(start, end):
+    day = start
+    while day <= end:
+        if day.weekday() < 5:
+            yield day
+        day += datetime.timedelta(days=1)
+
+
+def seed_school(
+    students=1000, students_per_division=40, classes=len(CLASS_NAMES), subjects_per_division=5,
+    announcements_per_division=3, attendance_days=28, password=DEFAULT_PASSWORD, seed=0, batch_size=1000,
+):
+    """
+    Create a school of ``students`` students spread over ``classes`` classes, with a
+    staff account ``admin``. Returns the number of rows created per model name.
+    """
+    if not 1 <= classes <= len(CLASS_NAMES):
+        raise ValueError(f"classes must be between 1 and {len(CLASS_NAMES)}")
+    if not 1 <= subjects_per_division <= len(SUBJECT_NAMES):
+        raise ValueError(f"subjects_per_division must be between 1 and {len(SUBJECT_NAMES)}")
+    if students < 1 or students_per_division < 1:
+        raise ValueError("students and students_per_division must be positive")
+    if Class.objects.exists() or StudentProfile.objects.exists() or TeacherProfile.objects.exists():
+        raise ValueError("The database already has school data; seed an empty database.")
+    rng = random.Random(seed)
+    hashed = make_password(password)
+    today = timezone.localdate()
+    term_start = today - datetime.timedelta(days=max(attendance_days, 1) + 7)
+    division_count = -(-students // students_per_division)
+
+    with transaction.atomic():
+        admin, admin_created = User.objects.get_or_create(
+            username=ADMIN_USERNAME,
+            defaults={'email': 'admin@example.com', 'is_staff': True, 'is_superuser': True, 'password': hashed},
+        )
+        class_rows = Class.objects.bulk_create(
+            [Class(name=name, description=f"Class {name}") for name in CLASS_NAMES[:classes]]
+        )
+
+        teacher_count = subjects_per_division * -(-division_count // TEACHERS_SUBJECT_SPAN)
+        teacher_users = []
+        for number in range(1, teacher_count + 1):
+            first, last = _person(rng)
+            employee_id = f"T{number:05d}"
+            teacher_users.append(User(
+                username=employee_id, email=f"{employee_id.lower()}@example.com",
+                first_name=first, last_name=last, password=hashed,
+            ))
+        teacher_users = _bulk_users(teacher_users, batch_size)
+        teachers = TeacherProfile.objects.bulk_create([
+            TeacherProfile(
+                user=user, employee_id=user.username, qualification=rng.choice(['B.Ed', 'M.Sc, B.Ed', 'M.A, B.Ed']),
+                specialization=SUBJECT_NAMES[index // (teacher_count // subjects_per_division)],
+                experience_years=rng.randint(1, 30), must_reset_password=False,
+            )
+            for index, user in enumerate(teacher_users)
+        ], batch_size=batch_size)
+
+        def teacher_for(division_index, subject_index):
+            blocks = teacher_count // subjects_per_division
+            return teachers[subject_index * blocks + division_index // TEACHERS_SUBJECT_SPAN]
+
+        divisions = Division.objects.bulk_create([
+            Division(
+                name=_division_name(index // classes), class_field=class_rows[index % classes],
+                teacher=teacher_for(index, 0), max_students=students_per_division,
+            )
+            for index in range(division_count)
+        ], batch_size=batch_size)
+
+        subjects = Subject.objects.bulk_create([
+            Subject(
+                name=SUBJECT_NAMES[j], code=f"{SUBJECT_NAMES[j][:3].upper()}-{d + 1:05d}",
+                division=division, teacher=teacher_for(d, j),
+            )
+            for d, division in enumerate(divisions)
+            for j in range(subjects_per_division)
+        ], batch_size=batch_size)
+
+        slots = create_slots([
+            TimetableSlot(
+                subject=subject, weekday=(j + d) % 5, slot=1,
+                start_time=datetime.time(8 + j // 5), end_time=datetime.time(8 + j // 5, 50),
+                room=f"Room {d + 1}", valid_from=term_start,
+            )
+            for d in range(division_count)
+            for j, subject in enumerate(subjects[d * subjects_per_division:(d + 1) * subjects_per_division])
+        ], batch_size=batch_size)
+
+        student_users = []
+        for number in range(1, students + 1):
+            first, last = _person(rng)
+            student_id = f"S{number:06d}"
+            student_users.append(User(
+                username=student_id, email=f"{student_id.lower()}@example.com",
+                first_name=first, last_name=last, password=hashed,
+            ))
+        student_users = _bulk_users(student_users, batch_size)
+        categories = StudentProfile.Category.values
+        student_rows = StudentProfile.objects.bulk_create([
+            StudentProfile(
+                user=user, student_id=user.username,
+                date_of_birth=datetime.date(2005 + rng.randint(0, 10), rng.randint(1, 12), rng.randint(1, 28)),
+                guardian_name=f"{rng.choice(FIRST_NAMES)} {user.last_name}",
+                guardian_phone=f"9{rng.randint(0, 999999999):09d}", address=f"{rng.randint(1, 999)} Main Road",
+                division=divisions[index // students_per_division], category=rng.choice(categories),
+                must_reset_password=False,
+            )
+            for index, user in enumerate(student_users)
+        ], batch_size=batch_size)
+
+        LoginIdentifier.objects.bulk_create(
+            [row for user in teacher_users for row in identifier_rows(user, teacher=user.teacher_profile)]
+            + [row for user in student_users for row in identifier_rows(user, student=user.student_profile)]
+            + (identifier_rows(admin) if admin_created else []),
+            batch_size=batch_size,
+        )
+        SearchToken.objects.bulk_create(
+            [row for user in teacher_users for row in token_rows(user, teacher=user.teacher_profile)]
+            + [row for user in student_users for row in token_rows(user, student=user.student_profile)],
+            batch_size=batch_size,
+        )
+
+        Announcement.objects.bulk_create([
+            Announcement(title=f"Notice {n + 1} for {division}", text="Please check the updated schedule.",
+                         division=division, author=admin)
+            for division in divisions
+            for n in range(announcements_per_division)
+        ], batch_size=batch_size)
+
+        rosters = {}
+        for profile in student_rows:
+            rosters.setdefault(profile.division_id, []).append(profile.pk)
+        sessions = []
+        for slot in slots if attendance_days else ():
+            roster = sorted(rosters.get(slot.subject.division_id, []))
+            for day in _school_days(today - datetime.timedelta(days=attendance_days), today - datetime.timedelta(days=1)):
+                if day.weekday() != slot.weekday:
+                    continue
+                present = [student_id for student_id in roster if rng.random() < 0.9]
+                presence = encode_presence(roster, present)
+                sessions.append(AttendanceSession(
+                    subject=slot.subject, division_id=slot.subject.division_id, date=day, slot=slot.slot,
+                    roster=encode_roster(roster), presence=presence, roster_size=len(roster),
+                    present_count=len(present), marked_by=slot.subject.teacher,
+                ))
+        AttendanceSession.objects.bulk_create(sessions, batch_size=batch_size)
+        RosterMembership.objects.bulk_create([
+            RosterMembership(student_id=student_id, division_id=division_id)
+            for division_id in {session.division_id for session in sessions}
+            for student_id in rosters.get(division_id, ())
+        ], batch_size=batch_size)
+        rebuild_stats()
+
+    # bulk_create skips signals, so the cached counters and feeds are reset here.
+    stats.invalidate()
+    invalidate_feeds()
+    analytics.invalidate_all()
+    extend_calendar(days_back=attendance_days)
+    return {
+        'classes': len(class_rows), 'divisions': len(divisions), 'subjects': len(subjects),
+        'teachers': len(teachers), 'students': len(student_rows), 'timetable_slots': len(slots),
+        'attendance_sessions': len(sessions),
+    }
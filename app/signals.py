@@ -0,0 +1,187 @@
+from functools import partial
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from app import analytics, fragments, roles, stats, sync
+from app.announcements import invalidate_feeds
+from app.attendance import attendance_marked
+from app.identifiers import sync_login_identifiers
+from app.models import (
+    Announcement, AttendanceSession, Class, Division, LoginIdentifier, SearchToken, StudentProfile, Subject, SyncChange, TeacherProfile, TimetableSlot,
+)
+from app.search import sync_search_tokens
+
+
+def after_commit(func, *args):
+    """
+    Run a cache update once the writing transaction commits (at once outside one), so
+    a rollback can't leave counters or versions out of step with the database.
+    """
+    transaction.on_commit(partial(func, *args))
+
+
+@receiver([post_save, post_delete], sender=Announcement)
+def announcement_changed(sender, **kwargs):
+    after_commit(invalidate_feeds)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    fields = set(update_fields) if update_fields is not None else None
+    # Logins save only last_login; skip the role and identifier work on that hot path.
+    if fields is None or fields - {'last_login'}:
+        after_commit(roles.invalidate_user, instance.pk)
+    if fields is None or {'email', 'username'} & fields:
+        sync_login_identifiers(instance)
+    if fields is None or {'email', 'username', 'first_name', 'last_name'} & fields:
+        sync_search_tokens(instance)
+    if fields is None or {'first_name', 'last_name'} & fields:
+        # Rosters in the sync feed carry student names.
+        student = StudentProfile.objects.filter(user=instance).values_list('pk', 'division_id').first()
+        if student is not None:
+            sync.record_many([(SyncChange.Kind.STUDENT, student[0], student[1], None)])
+
+@receiver(post_save, sender=StudentProfile)
+@receiver(post_save, sender=TeacherProfile)
+def profile_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    after_commit(roles.invalidate_user, instance.user_id)
+    user = User.objects.filter(pk=instance.user_id).first()
+    if user is not None:
+        sync_login_identifiers(user)
+        sync_search_tokens(user)
+
+@receiver(post_delete, sender=StudentProfile)
+@receiver(post_delete, sender=TeacherProfile)
+def profile_deleted(sender, instance, **kwargs):
+    # Only drop this profile's rows: a full resync here would re-insert rows for a
+    # user that is itself being deleted in the same cascade.
+    after_commit(roles.invalidate_user, instance.user_id)
+    role = LoginIdentifier.Role.STUDENT if sender is StudentProfile else LoginIdentifier.Role.TEACHER
+    LoginIdentifier.objects.filter(user_id=instance.user_id, role=role).delete()
+    SearchToken.objects.filter(user_id=instance.user_id, role=role).delete()
+
+
+@receiver(post_init, sender=StudentProfile)
+def student_loaded(sender, instance, **kwargs):
+    instance._stats_state = (instance.division_id, instance.category)
+
+@receiver(post_save, sender=StudentProfile)
+def student_saved(sender, instance, created, raw=False, **kwargs):
+    state = (instance.division_id, instance.category)
+    if raw:
+        return
+    # Classes are looked up now: the divisions may be gone by the time this commits.
+    if created:
+        after_commit(stats.adjust_student, stats.class_of_division(instance.division_id), instance.category, 1)
+        after_commit(stats.record_activity, f"Enrolled student {instance.student_id}")
+    elif state != instance._stats_state:
+        old_division, old_category = instance._stats_state
+        after_commit(stats.adjust_student, stats.class_of_division(old_division), old_category, -1)
+        after_commit(stats.adjust_student, stats.class_of_division(instance.division_id), instance.category, 1)
+    instance._stats_state = state
+
+@receiver(post_delete, sender=StudentProfile)
+def student_deleted(sender, instance, **kwargs):
+    after_commit(stats.adjust_student, stats.class_of_division(instance.division_id), instance.category, -1)
+
+@receiver(post_save, sender=TeacherProfile)
+def teacher_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        after_commit(stats.adjust, stats.TOTAL_KEYS['teachers'], 1)
+        after_commit(stats.record_activity, f"Added teacher {instance.employee_id}")
+
+@receiver(post_delete, sender=TeacherProfile)
+def teacher_deleted(sender, instance, **kwargs):
+    after_commit(stats.adjust, stats.TOTAL_KEYS['teachers'], -1)
+
+@receiver([post_save, post_delete], sender=Class)
+@receiver([post_save, post_delete], sender=Division)
+def class_structure_changed(sender, **kwargs):
+    # Moves between classes re-bucket whole divisions; recount rather than track them.
+    after_commit(stats.invalidate)
+    # Cached student profiles and dashboard widgets carry division and class names.
+    after_commit(roles.invalidate_all)
+    after_commit(fragments.invalidate_all)
+
+@receiver(post_init, sender=Division)
+@receiver(post_init, sender=StudentProfile)
+@receiver(post_init, sender=Subject)
+@receiver(post_init, sender=TimetableSlot)
+@receiver(post_init, sender=Announcement)
+def sync_loaded(sender, instance, **kwargs):
+    instance._sync_state = sync.sync_state(instance)
+    instance._synced_values = sync.synced_values(instance)
+
+@receiver(post_save, sender=Division)
+@receiver(post_save, sender=StudentProfile)
+@receiver(post_save, sender=Subject)
+@receiver(post_save, sender=TimetableSlot)
+@receiver(post_save, sender=Announcement)
+def sync_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    values = sync.synced_values(instance)
+    if created or values is None or values != instance._synced_values:
+        sync.record_change(instance, None if created else instance._sync_state)
+    instance._sync_state = sync.sync_state(instance)
+    instance._synced_values = values
+
+@receiver(post_delete, sender=Division)
+@receiver(post_delete, sender=StudentProfile)
+@receiver(post_delete, sender=Subject)
+@receiver(post_delete, sender=TimetableSlot)
+@receiver(post_delete, sender=Announcement)
+def sync_deleted(sender, instance, **kwargs):
+    sync.record_change(instance, instance._sync_state)
+
+@receiver(post_save, sender=Class)
+def class_renamed(sender, instance, created, raw=False, **kwargs):
+    # Synced divisions carry their class name.
+    if not (created or raw):
+        sync.record_many([
+            (SyncChange.Kind.DIVISION, pk, pk, None) for pk in instance.divisions.values_list('pk', flat=True)
+        ])
+
+@receiver(user_logged_in)
+def user_logged_in_activity(sender, user, **kwargs):
+    after_commit(stats.record_activity, f"{user.get_username()} logged in")
+
+@receiver(user_logged_in)
+def role_on_login(sender, request, user, **kwargs):
+    # Resolve the role while the login already writes the session, so the first
+    # dashboard redirect doesn't have to.
+    if request is not None and hasattr(request, 'session'):
+        roles.role_for_request(request, user)
+
+@receiver(attendance_marked)
+def attendance_activity(sender, session, subject, created, **kwargs):
+    verb = "submitted" if created else "corrected"
+    after_commit(stats.record_activity, f"Attendance {verb} for {subject.code} on {session.date} (slot {session.slot})")
+
+@receiver(attendance_marked)
+def attendance_widgets(sender, session, **kwargs):
+    after_commit(fragments.invalidate_division, session.division_id)
+
+@receiver([post_save, post_delete], sender=AttendanceSession)
+def attendance_analytics(sender, instance, **kwargs):
+    # After commit, so a report computed in between can't cache the old sessions under the new version.
+    after_commit(analytics.invalidate_division, instance.division_id)
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f"PRAGMA {name} = {value}")
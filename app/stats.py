@@ -0,0 +1,124 @@
+"""
+Cached school statistics for the admin dashboard.
+
+Totals and per-class / per-category student counts live in the shared cache (so
+every worker sees the same numbers) as separate integer keys and are adjusted with
+atomic ``incr``/``decr`` from model signals (see app.signals). ``CLASSES_KEY``
+doubles as a readiness marker: when it (or any counter) is missing, ``snapshot()``
+rebuilds everything with a handful of grouped queries. The counters expire after
+STATS_TIMEOUT, so drift from writes that bypass signals (``bulk_create``,
+``QuerySet.update``) is recounted at the latest then; such writes should still call
+``invalidate()``.
+
+Recent activity is a fixed-size ring buffer: each event takes the next sequence
+number from an atomic counter and overwrites slot ``seq % ACTIVITY_CAPACITY``. Events
+expire after ACTIVITY_TIMEOUT, and the counter that long after the last event.
+"""
+from django.db.models import Count
+from django.utils import timezone
+
+from app.models import Class, Division, StudentProfile, TeacherProfile
+from erp.cache_backends import shared_cache
+
+CLASSES_KEY = "stats_classes"
+TOTAL_KEYS = {
+    'students': "stats_total_students",
+    'teachers': "stats_total_teachers",
+    'classes': "stats_total_classes",
+}
+ACTIVITY_CAPACITY = 50
+ACTIVITY_SEQ_KEY = "stats_activity_seq"
+STATS_TIMEOUT = 60 * 60
+ACTIVITY_TIMEOUT = 7 * 24 * 60 * 60
+
+
+def _class_key(class_id):
+    return f"stats_class_{class_id if class_id is not None else 'none'}"
+
+def _category_key(category):
+    return f"stats_category_{category}"
+
+def invalidate():
+    shared_cache.delete(CLASSES_KEY)
+
+def rebuild():
+    classes = dict(Class.objects.values_list('pk', 'name'))
+    by_class = dict(
+        StudentProfile.objects.values_list('division__class_field_id').annotate(n=Count('pk')).order_by()
+    )
+    by_category = dict(StudentProfile.objects.values_list('category').annotate(n=Count('pk')).order_by())
+    values = {
+        TOTAL_KEYS['students']: sum(by_class.values()),
+        TOTAL_KEYS['teachers']: TeacherProfile.objects.count(),
+        TOTAL_KEYS['classes']: len(classes),
+    }
+    values.update({_class_key(class_id): by_class.get(class_id, 0) for class_id in [*classes, None]})
+    values.update({_category_key(category): by_category.get(category, 0) for category in StudentProfile.Category.values})
+    shared_cache.set_many(values, STATS_TIMEOUT)
+    shared_cache.set(CLASSES_KEY, classes, STATS_TIMEOUT)
+    return classes
+
+def adjust(key, delta):
+    if not delta:
+        return
+    try:
+        if delta > 0:
+            shared_cache.incr(key, delta)
+        else:
+            shared_cache.decr(key, -delta)
+    except ValueError:
+        # Counter evicted or never built: let the next snapshot() recount.
+        invalidate()
+
+def adjust_student(class_id, category, delta):
+    adjust(TOTAL_KEYS['students'], delta)
+    adjust(_class_key(class_id), delta)
+    if category:
+        adjust(_category_key(category), delta)
+
+def class_of_division(division_id):
+    if division_id is None:
+        return None
+    return Division.objects.filter(pk=division_id).values_list('class_field_id', flat=True).first()
+
+def snapshot():
+    """Return totals and breakdowns from the cache, rebuilding them if anything is missing."""
+    classes = shared_cache.get(CLASSES_KEY)
+    if classes is None:
+        classes = rebuild()
+    categories = StudentProfile.Category.values
+    keys = [*TOTAL_KEYS.values(), *(_class_key(pk) for pk in [*classes, None]), *map(_category_key, categories)]
+    values = shared_cache.get_many(keys)
+    if len(values) < len(keys):
+        classes = rebuild()
+        values = shared_cache.get_many(keys)
+    by_class = [(name, values.get(_class_key(pk), 0)) for pk, name in sorted(classes.items(), key=lambda item: item[1])]
+    unassigned = values.get(_class_key(None), 0)
+    if unassigned:
+        by_class.append(("Unassigned", unassigned))
+    return {
+        **{name: values.get(key, 0) for name, key in TOTAL_KEYS.items()},
+        'by_class': by_class,
+        'by_category': [
+            (StudentProfile.Category(category).label, values.get(_category_key(category), 0)) for category in categories
+        ],
+    }
+
+def record_activity(text):
+    shared_cache.add(ACTIVITY_SEQ_KEY, 0, ACTIVITY_TIMEOUT)
+    try:
+        seq = shared_cache.incr(ACTIVITY_SEQ_KEY)
+    except ValueError:
+        # Expired between add() and incr().
+        shared_cache.add(ACTIVITY_SEQ_KEY, 0, ACTIVITY_TIMEOUT)
+        seq = shared_cache.incr(ACTIVITY_SEQ_KEY)
+    shared_cache.touch(ACTIVITY_SEQ_KEY, ACTIVITY_TIMEOUT)
+    shared_cache.set(f"stats_activity_{seq % ACTIVITY_CAPACITY}", {'seq': seq, 'at': timezone.now(), 'text': text}, ACTIVITY_TIMEOUT)
+
+def recent_activity(limit=10):
+    seq = shared_cache.get(ACTIVITY_SEQ_KEY)
+    if not seq:
+        return []
+    slots = [f"stats_activity_{n % ACTIVITY_CAPACITY}" for n in range(seq, max(0, seq - min(limit, ACTIVITY_CAPACITY)), -1)]
+    entries = shared_cache.get_many(slots)
+    return sorted(entries.values(), key=lambda entry: entry['seq'], reverse=True)[:limit]
@@ -0,0 +1,200 @@
+"""
+Delta sync of a teacher's divisions for offline clients.
+
+Every save and delete of a Division, StudentProfile, Subject, TimetableSlot or
+Announcement logs a SyncChange (from app.signals) with the next sequence number and
+the scope it is visible in: its division, or for class-wide and school-wide
+announcements its class or nothing. An object that moves, such as a student changing
+division, is logged under the old scope as well, so the old division's teachers
+learn it has gone. Saves of a student that change none of the fields clients get
+(SYNCED_FIELDS), such as clearing must_reset_password, aren't logged. Only the latest
+entry per object and scope is kept. Sequence numbers are taken from a single counter
+row that stays locked until the writing transaction commits, so they are handed out
+in commit order and a client never misses a change numbered below a cursor it
+already holds.
+
+That lock is the cost: every logged write in the school waits for the one before it
+to commit, so a transaction that logs a change should do nothing slow afterwards.
+Bulk writers take all their numbers with one record_many() call, holding the lock
+once per transaction rather than once per object.
+
+The feed answers without a cursor with every record in the teacher's divisions,
+and with ``since=<cursor>`` with only the records changed after it, plus the ids of
+changed records that are no longer visible. Each response carries the cursor for
+the next call, which also names the teacher's set of divisions; when that set has
+changed since, the feed starts over with a full snapshot (``reset``). The current
+cursor takes two small queries, so it doubles as the ETag and an unchanged client
+gets a 304 before anything is loaded.
+
+Writes that skip signals (``QuerySet.update()``, ``bulk_create``) aren't logged;
+app.provisioning logs its students itself, and seeding targets empty databases
+that clients fetch as snapshots.
+"""
+import hashlib
+from functools import reduce
+from operator import or_
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max, Q
+
+from app.announcements import FEED_SIZE
+from app.models import Announcement, Division, StudentProfile, Subject, SyncChange, SyncSequence, TimetableSlot
+
+SEQUENCE = 'sync_changes'
+Kind = SyncChange.Kind
+
+KINDS = {
+    Division: Kind.DIVISION,
+    StudentProfile: Kind.STUDENT,
+    Subject: Kind.SUBJECT,
+    TimetableSlot: Kind.TIMETABLE_SLOT,
+    Announcement: Kind.ANNOUNCEMENT,
+}
+# Fields of a model that its feed records carry (names come from the User, whose
+# saves app.signals logs separately). Saves of these models that change none of them
+# are skipped; saves of the other models are always logged.
+SYNCED_FIELDS = {
+    StudentProfile: ('student_id', 'division_id'),
+}
+# Keys of each kind in feed responses.
+FEED_KEYS = {
+    Kind.DIVISION: 'divisions',
+    Kind.STUDENT: 'students',
+    Kind.SUBJECT: 'subjects',
+    Kind.TIMETABLE_SLOT: 'timetable_slots',
+    Kind.ANNOUNCEMENT: 'announcements',
+}
+
+
+def _allocate(count):
+    """Reserve ``count`` sequence numbers and return the last; call inside a transaction."""
+    sequence = SyncSequence.objects.filter(pk=SEQUENCE)
+    if not sequence.update(value=F('value') + count):
+        try:
+            with transaction.atomic():
+                SyncSequence.objects.create(name=SEQUENCE, value=count)
+        except IntegrityError:
+            sequence.update(value=F('value') + count)
+    return sequence.values_list('value', flat=True).get()
+
+def record_many(entries, compact=True):
+    """
+    Log ``(kind, object_id, division_id, class_id)`` entries under new sequence
+    numbers. With ``compact`` each replaces the earlier entry for the same object and
+    scope; bulk loads of new objects can skip that.
+    """
+    entries = list(dict.fromkeys(entries))
+    if not entries:
+        return
+    with transaction.atomic():
+        last = _allocate(len(entries))
+        if compact:
+            SyncChange.objects.filter(reduce(or_, (
+                Q(kind=kind, object_id=object_id, division_id=division_id, class_id=class_id)
+                for kind, object_id, division_id, class_id in entries
+            ))).delete()
+        first = last - len(entries) + 1
+        SyncChange.objects.bulk_create([
+            SyncChange(seq=first + index, kind=kind, object_id=object_id, division_id=division_id, class_id=class_id)
+            for index, (kind, object_id, division_id, class_id) in enumerate(entries)
+        ])
+
+def sync_state(instance):
+    """What places ``instance`` in a scope; app.signals keeps the value from load time to log moves."""
+    if isinstance(instance, Division):
+        return instance.pk, None
+    if isinstance(instance, Announcement):
+        return (instance.division_id, None) if instance.division_id else (None, instance.class_field_id)
+    if isinstance(instance, TimetableSlot):
+        return instance.subject_id
+    return instance.division_id, None
+
+def synced_values(instance):
+    """``instance``'s SYNCED_FIELDS as they are now, or None if every save is logged."""
+    fields = SYNCED_FIELDS.get(type(instance))
+    if fields is None:
+        return None
+    # Read from __dict__ so deferred fields aren't loaded; they then count as changed.
+    return tuple(instance.__dict__.get(field) for field in fields)
+
+def record_change(instance, previous=None):
+    """Log a save or delete of ``instance``, also under its ``previous`` sync_state() if that differs."""
+    kind = KINDS[type(instance)]
+    states = list(dict.fromkeys(state for state in (previous, sync_state(instance)) if state is not None))
+    if kind == Kind.TIMETABLE_SLOT:
+        divisions = Subject.objects.filter(pk__in=states).values_list('division_id', flat=True)
+        states = [(division_id, None) for division_id in divisions]
+    record_many([(kind, instance.pk, division_id, class_id) for division_id, class_id in states])
+
+
+def teacher_divisions(teacher):
+    """``{division_id: class_id}`` for the divisions a teacher is class teacher of or teaches a subject in."""
+    return dict(
+        Division.objects.filter(Q(teacher=teacher) | Q(subjects__teacher=teacher))
+        .order_by().values_list('pk', 'class_field_id').distinct()
+    )
+
+def _change_scope(divisions):
+    school_wide = Q(class_id__isnull=True) | Q(class_id__in=set(divisions.values()))
+    return Q(division_id__in=list(divisions)) | Q(kind=Kind.ANNOUNCEMENT, division_id__isnull=True) & school_wide
+
+def _digest(divisions):
+    return hashlib.sha256(','.join(map(str, sorted(divisions))).encode()).hexdigest()[:12]
+
+def current_cursor(divisions):
+    latest = SyncChange.objects.filter(_change_scope(divisions)).aggregate(latest=Max('seq'))['latest']
+    return f"{latest or 0}.{_digest(divisions)}"
+
+def parse_cursor(cursor):
+    """``(seq, digest)`` from a cursor; raises ValueError."""
+    seq, _, digest = cursor.partition('.')
+    if not seq.isdigit() or not digest:
+        raise ValueError("Invalid cursor.")
+    return int(seq), digest
+
+def _querysets(divisions):
+    ids = list(divisions)
+    visible = Q(division_id__in=ids) | Q(division__isnull=True) & (
+        Q(class_field__isnull=True) | Q(class_field_id__in=set(divisions.values()))
+    )
+    return {
+        Kind.DIVISION: Division.objects.filter(pk__in=ids).values(
+            'id', 'name', 'class_field_id', 'teacher_id', class_name=F('class_field__name'),
+        ),
+        Kind.STUDENT: StudentProfile.objects.filter(division_id__in=ids).values(
+            'id', 'student_id', 'division_id', first_name=F('user__first_name'), last_name=F('user__last_name'),
+        ),
+        Kind.SUBJECT: Subject.objects.filter(division_id__in=ids).values(
+            'id', 'code', 'name', 'division_id', 'teacher_id',
+        ),
+        Kind.TIMETABLE_SLOT: TimetableSlot.objects.filter(subject__division_id__in=ids).values(
+            'id', 'subject_id', 'weekday', 'slot', 'start_time', 'end_time', 'room', 'valid_from', 'valid_until',
+        ),
+        Kind.ANNOUNCEMENT: Announcement.objects.filter(visible).values(
+            'id', 'title', 'text', 'division_id', 'class_field_id', 'created_at',
+        ),
+    }
+
+def feed(divisions, since=None):
+    """
+    ``{'changed': {key: [record, ...]}, 'deleted': {key: [id, ...]}}`` for a teacher's
+    ``divisions``: every record (and the latest FEED_SIZE announcements) when
+    ``since`` is None, else only what changed after that sequence number.
+    """
+    querysets = _querysets(divisions)
+    if since is None:
+        querysets[Kind.ANNOUNCEMENT] = querysets[Kind.ANNOUNCEMENT].order_by('-created_at')[:FEED_SIZE]
+        return {
+            'changed': {FEED_KEYS[kind]: list(queryset) for kind, queryset in querysets.items()},
+            'deleted': {key: [] for key in FEED_KEYS.values()},
+        }
+    changed_ids = {kind: set() for kind in querysets}
+    for kind, object_id in SyncChange.objects.filter(_change_scope(divisions), seq__gt=since).values_list('kind', 'object_id'):
+        changed_ids[kind].add(object_id)
+    changed, deleted = {}, {}
+    for kind, queryset in querysets.items():
+        ids = changed_ids[kind]
+        rows = list(queryset.filter(pk__in=ids)) if ids else []
+        changed[FEED_KEYS[kind]] = rows
+        deleted[FEED_KEYS[kind]] = sorted(ids.difference(row['id'] for row in rows))
+    return {'changed': changed, 'deleted': deleted}
@@ -1,3 +1,1648 @@
-from django.test import TestCase
+import asyncio
+import contextvars
+import csv
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import numpy
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.cache.utils import make_template_fragment_key
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends import locmem
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.http import HttpResponse, StreamingHttpResponse
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.templatetags.static import static
+from django.urls import re_path, reverse
+from django.utils import timezone
+
+from app.admin import StudentProfileAdmin
+from app.changelist import EstimatedCountPaginator
+from app import analytics, announcements, attendance, idempotency, profiling, ratelimit, roles, search, seeding, stats, timetable
+from app import urls as app_urls
+from app.identifiers import resolve_login_identifier
+from app.mail import MAX_ATTEMPTS, enqueue_mail, send_batch
+from app.provisioning import STUDENT_COLUMNS, import_csv
+from app.views import MAX_LOGIN_ATTEMPTS
+from erp.db_router import REPLICA_ALIAS, ReplicaRouter, read_from_replica, replica_iterator, use_replica
+from erp.request_metrics import QueryBudgetExceeded, RequestMetricsMiddleware, query_budget
+from erp import db_router, request_metrics, staticfiles
+from erp.cache_backends import SQLiteCache, shared_cache
+from erp.session_cookie_middleware import AdminSessionMiddleware
+from erp.staticfiles import StaticFilesMiddleware
+from app.models import (
+    Announcement, AttendanceSession, AttendanceStat, Class, Division, IdempotencyKey, LoginIdentifier, OutboundEmail, RequestProfile, SchoolDay, SearchToken,
+    StudentProfile, Subject, TeacherProfile, TimetableSlot,
+)
+
+
+def make_teacher(employee_id, **kwargs):
+    user = User.objects.create_user(username=employee_id, email=f"{employee_id}@example.com", password='pass12345!', **kwargs)
+    return TeacherProfile.objects.create(
+        user=user, employee_id=employee_id, qualification='MSc', specialization='Physics', experience_years=5,
+    )
+
+def make_student(student_id, division, category=StudentProfile.Category.SCIENCE_BOARD):
+    user = User.objects.create_user(username=student_id, email=f"{student_id}@example.com", password='pass12345!')
+    return StudentProfile.objects.create(
+        user=user, student_id=student_id, date_of_birth=datetime.date(2008, 1, 1), guardian_name='Guardian',
+        guardian_phone='9999999999', address='Address', division=division, category=category,
+    )
+
+def make_division(class_name='XI', name='A', teacher=None):
+    class_obj, _ = Class.objects.get_or_create(name=class_name)
+    return Division.objects.create(name=name, class_field=class_obj, teacher=teacher)
+
+
+FAST_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
+def clear_caches():
+    for alias in settings.CACHES:
+        caches[alias].clear()
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class AttendanceStoreTests(TestCase):
+    def setUp(self):
+        self.teacher = make_teacher('T001')
+        self.division = make_division(teacher=self.teacher)
+        self.subject = Subject.objects.create(name='Physics', code='PHY-XI-A', division=self.division, teacher=self.teacher)
+        self.students = [make_student(f"S{i:03}", self.division) for i in range(12)]
+        self.date = datetime.date(2025, 6, 2)
+
+    def test_roster_round_trip(self):
+        ids = [9, 3, 2 ** 40, 3]
+        self.assertEqual(list(attendance.decode_roster(attendance.encode_roster(ids))), [3, 9, 2 ** 40])
+
+    def test_mark_session_is_one_row(self):
+        present = [s.pk for s in self.students[:9]]
+        session = attendance.mark_session(self.subject, self.date, present, marked_by=self.teacher)
+        self.assertEqual(session.roster_size, 12)
+        self.assertEqual(session.present_count, 9)
+        self.assertEqual(len(bytes(session.presence)), 2)
+        self.assertEqual(attendance.present_ids(attendance.decode_roster(session.roster), session.presence), present)
+
+    def test_correction_keeps_roster_snapshot(self):
+        attendance.mark_session(self.subject, self.date, [self.students[0].pk])
+        make_student('S999', self.division)
+        session = attendance.mark_session(self.subject, self.date, [self.students[1].pk])
+        self.assertEqual(session.roster_size, 12)
+        self.assertEqual(session.present_count, 1)
+        with self.assertRaises(ValueError):
+            attendance.mark_session(self.subject, self.date, [StudentProfile.objects.get(student_id='S999').pk])
+
+    def test_student_and_division_queries(self):
+        attendance.mark_session(self.subject, self.date, [s.pk for s in self.students[:6]], slot=1)
+        attendance.mark_session(self.subject, self.date, [s.pk for s in self.students[3:]], slot=2)
+        records = list(attendance.student_attendance(self.students[0]))
+        self.assertEqual(sorted(present for _, present in records), [False, True])
+        summary = attendance.division_attendance(self.division)
+        self.assertEqual(summary[self.students[4].pk], (2, 2))
+        self.assertEqual(summary[self.students[11].pk], (1, 2))
+
+    def test_history_survives_a_transfer(self):
+        attendance.mark_session(self.subject, self.date, [self.students[0].pk])
+        student = self.students[0]
+        student.division = make_division(name='B')
+        student.save()
+        records = list(attendance.student_attendance(student))
+        self.assertEqual([(session.subject_id, present) for session, present in records], [(self.subject.pk, True)])
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class AttendanceApiTests(TestCase):
+    def setUp(self):
+        self.teacher = make_teacher('T001')
+        self.division = make_division(teacher=self.teacher)
+        self.subject = Subject.objects.create(name='Physics', code='PHY-XI-A', division=self.division, teacher=self.teacher)
+        self.students = [make_student(f"S{i:03}", self.division) for i in range(4)]
+        self.outsider = make_student('S900', make_division(name='B'))
+        self.date = datetime.date(2025, 6, 2)
+        self.client.force_login(self.teacher.user)
+
+    def post(self, marks, key='key-1', **payload):
+        body = {'subject': self.subject.pk, 'date': self.date.isoformat(), 'slot': 1, 'marks': marks, **payload}
+        return self.client.post(reverse('submit_attendance'), json.dumps(body), content_type='application/json',
+                                headers={idempotency.HEADER: key} if key else {})
+
+    def marks(self, *present, absent=()):
+        return [{'student': s.pk, 'present': True} for s in present] + [{'student': s.pk, 'present': False} for s in absent]
+
+    def test_batch_reports_each_student(self):
+        response = self.post(self.marks(self.students[0], self.outsider, absent=[self.students[1]]))
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        self.assertEqual([r['status'] for r in body['results']], ['present', 'not_on_roster', 'absent'])
+        self.assertEqual((body['created'], body['present_count'], body['roster_size']), (True, 1, 4))
+        stat = AttendanceStat.objects.get(scope=AttendanceStat.Scope.STUDENT, object_id=self.students[0].pk)
+        self.assertEqual((stat.attended, stat.total), (1, 1))
+
+    def test_retry_replays_without_writing(self):
+        first = self.post(self.marks(*self.students[:3]))
+        with self.assertNumQueries(3):  # session, user, key lookup
+            retry = self.post(self.marks(*self.students[:3]))
+        self.assertEqual((retry.status_code, retry.json()), (201, first.json()))
+        self.assertEqual(retry[idempotency.REPLAYED_HEADER], 'true')
+        self.assertEqual(AttendanceSession.objects.get().present_count, 3)
+        self.assertEqual(AttendanceStat.objects.get(scope=AttendanceStat.Scope.DIVISION).total, 4)
+        self.assertEqual(self.post(self.marks(self.students[0])).status_code, 422)
+
+    def test_purging_old_keys_stays_within_budget(self):
+        with mock.patch.object(idempotency, 'PURGE_PROBABILITY', 1):
+            self.assertEqual(self.post(self.marks(*self.students[:3])).status_code, 201)
+
+    def test_later_batch_corrects_only_its_students(self):
+        self.post(self.marks(*self.students[:3]))
+        response = self.post(self.marks(absent=[self.students[0]]), key='key-2')
+        self.assertEqual((response.status_code, response.json()['created']), (200, False))
+        self.assertEqual(AttendanceSession.objects.get().present_count, 2)
+        self.assertEqual(IdempotencyKey.objects.count(), 2)
+
+    def test_losing_a_race_for_the_session_merges_into_it(self):
+        self.post(self.marks(self.students[1]), key='key-2')
+        submit_marks, calls = attendance.submit_marks, []
+
+        def racing(*args, **kwargs):
+            # The first attempt finds no session, then loses the insert to key-2's.
+            calls.append(1)
+            if len(calls) == 1:
+                raise IntegrityError("UNIQUE constraint failed: app_attendancesession")
+            return submit_marks(*args, **kwargs)
+
+        # The budget covers the usual single attempt, not a retried write.
+        with mock.patch('app.attendance.submit_marks', racing), self.settings(QUERY_BUDGET_MODE='warn'):
+            response = self.post(self.marks(self.students[0]))
+        self.assertEqual((response.status_code, response.json()['created'], len(calls)), (200, False, 2))
+        self.assertEqual(AttendanceSession.objects.get().present_count, 2)
+        self.assertEqual(IdempotencyKey.objects.count(), 2)
+
+    def test_losing_twice_asks_the_client_to_retry(self):
+        def racing(*args, **kwargs):
+            raise IntegrityError("UNIQUE constraint failed: app_attendancesession")
+
+        with mock.patch('app.attendance.submit_marks', racing), self.settings(QUERY_BUDGET_MODE='warn'):
+            response = self.post(self.marks(self.students[0]))
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.post(self.marks(self.students[0])).status_code, 201)
+
+    def test_rejects_bad_requests(self):
+        self.assertEqual(self.post(self.marks(self.students[0]), key='').status_code, 400)
+        self.assertEqual(self.post([{'student': 'S000', 'present': True}]).status_code, 400)
+        self.assertEqual(self.post(self.marks(self.students[0], self.students[0])).status_code, 400)
+        self.assertEqual(self.post(self.marks(self.students[0]), date='2025-13-01').status_code, 400)
+        self.assertEqual(self.post(self.marks(self.students[0]), subject=0).status_code, 404)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_only_the_subject_or_class_teacher(self):
+        self.client.force_login(make_teacher('T002').user)
+        self.assertEqual(self.post(self.marks(self.students[0])).status_code, 403)
+        self.client.force_login(self.students[0].user)
+        self.assertEqual(self.post(self.marks(self.students[0])).status_code, 403)
+        self.assertFalse(AttendanceSession.objects.exists())
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class SyncFeedTests(TestCase):
+    def setUp(self):
+        self.teacher = make_teacher('T001')
+        self.division = make_division(teacher=self.teacher)
+        self.other = make_division(class_name='XII')
+        self.subject = Subject.objects.create(name='Physics', code='PHY-XI-A', division=self.division, teacher=self.teacher)
+        self.students = [make_student(f"S{i:03}", self.division) for i in range(3)]
+        make_student('S900', self.other)
+        Announcement.objects.create(title='School', text='...')
+        Announcement.objects.create(title='Class XI', text='...', class_field=self.division.class_field)
+        Announcement.objects.create(title='Class XII', text='...', class_field=self.other.class_field)
+        self.client.force_login(self.teacher.user)
+
+    def get(self, since=None, **headers):
+        return self.client.get(reverse('sync_feed'), {'since': since} if since else {}, headers=headers)
+
+    def ids(self, body, key):
+        return sorted(row['id'] for row in body['changed'][key])
+
+    def test_snapshot_then_only_changes(self):
+        body = self.get().json()
+        self.assertTrue(body['reset'])
+        self.assertEqual(self.ids(body, 'students'), [s.pk for s in self.students])
+        self.assertEqual(sorted(a['title'] for a in body['changed']['announcements']), ['Class XI', 'School'])
+        self.assertEqual(self.ids(body, 'subjects'), [self.subject.pk])
+        body = self.get(body['cursor']).json()
+        self.assertFalse(body['reset'])
+        self.assertFalse(any(body['changed'].values()) or any(body['deleted'].values()))
+
+        moved, renamed = self.students[0], self.students[1]
+        moved.division = self.other
+        moved.save()
+        renamed.user.first_name = 'Asha'
+        renamed.user.save()
+        newcomer = make_student('S003', self.division)
+        subject_id = self.subject.pk
+        self.subject.delete()
+        Announcement.objects.create(title='Class XII again', text='...', class_field=self.other.class_field)
+        body = self.get(body['cursor']).json()
+        self.assertEqual(self.ids(body, 'students'), [renamed.pk, newcomer.pk])
+        self.assertEqual(body['changed']['students'][0]['first_name'], 'Asha')
+        self.assertEqual(body['deleted'], {**body['deleted'], 'students': [moved.pk], 'subjects': [subject_id]})
+        self.assertEqual(body['changed']['announcements'], [])
+
+    def test_unchanged_client_gets_304_without_loading(self):
+        response = self.get()
+        cursor, etag = response.json()['cursor'], response['ETag']
+        self.assertEqual(etag, f'"{cursor}"')
+        response = self.get(cursor)
+        with self.assertNumQueries(4):  # session, user, divisions, cursor
+            response = self.get(cursor, if_none_match=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.students[0].must_reset_password = True
+        self.students[0].save()  # Not in the feed: no change logged.
+        self.assertEqual(self.get(cursor, if_none_match=response['ETag']).status_code, 304)
+        self.students[0].student_id = 'S100'
+        self.students[0].save()
+        self.assertEqual(self.get(cursor, if_none_match=response['ETag']).status_code, 200)
+
+    def test_new_division_starts_over(self):
+        cursor = self.get().json()['cursor']
+        self.other.teacher = self.teacher
+        self.other.save()
+        body = self.get(cursor).json()
+        self.assertTrue(body['reset'])
+        self.assertEqual(len(body['changed']['students']), 4)
+        self.assertEqual(len(body['changed']['announcements']), 3)
+
+    def test_rejects_others_and_bad_cursors(self):
+        self.assertEqual(self.get('nonsense').status_code, 400)
+        self.client.force_login(self.students[0].user)
+        self.assertEqual(self.get().status_code, 403)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class AttendanceStatTests(TestCase):
+    def setUp(self):
+        self.teacher = make_teacher('T001')
+        self.division = make_division(teacher=self.teacher)
+        self.subject = Subject.objects.create(name='Physics', code='PHY-XI-A', division=self.division, teacher=self.teacher)
+        self.students = [make_student(f"S{i:03}", self.division) for i in range(4)]
+
+    def stat(self, scope, object_id):
+        return AttendanceStat.objects.get(scope=scope, object_id=object_id)
+
+    def test_counters_follow_marks_and_corrections(self):
+        day = datetime.date(2025, 6, 2)
+        attendance.mark_session(self.subject, day, [s.pk for s in self.students[:3]])
+        attendance.mark_session(self.subject, day, [s.pk for s in self.students[1:]], slot=2)
+        attendance.mark_session(self.subject, day, [self.students[0].pk])
+        first = self.stat(AttendanceStat.Scope.STUDENT, self.students[0].pk)
+        self.assertEqual((first.attended, first.total), (1, 2))
+        last = self.stat(AttendanceStat.Scope.STUDENT, self.students[3].pk)
+        self.assertEqual((last.attended, last.total), (1, 2))
+        division = self.stat(AttendanceStat.Scope.DIVISION, self.division.pk)
+        self.assertEqual((division.attended, division.total), (4, 8))
+        call_command('rebuild_attendance_stats', '--check', stdout=StringIO())
+
+    def test_rebuild_repairs_drift(self):
+        attendance.mark_session(self.subject, datetime.date(2025, 6, 2), [self.students[0].pk])
+        AttendanceStat.objects.filter(scope=AttendanceStat.Scope.SUBJECT).update(attended=99)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_attendance_stats', '--check', stdout=StringIO(), stderr=StringIO())
+        call_command('rebuild_attendance_stats', stdout=StringIO())
+        self.assertEqual(self.stat(AttendanceStat.Scope.SUBJECT, self.subject.pk).attended, 1)
+
+    def test_student_dashboard_reads_counter(self):
+        attendance.mark_session(self.subject, datetime.date(2025, 6, 2), [self.students[0].pk])
+        attendance.mark_session(self.subject, datetime.date(2025, 6, 3), [])
+        self.client.force_login(self.students[0].user)
+        response = self.client.get(reverse('dashboard_student'))
+        self.assertEqual(response.context['attendance_percent'], 50.0)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class AttendanceAnalyticsTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.teacher = make_teacher('T001')
+        self.division = make_division(teacher=self.teacher)
+        self.subject = Subject.objects.create(name='Physics', code='PHY-XI-A', division=self.division, teacher=self.teacher)
+        self.chemistry = Subject.objects.create(name='Chemistry', code='CHE-XI-A', division=self.division, teacher=self.teacher)
+        Category = StudentProfile.Category
+        self.steady = make_student('S000', self.division)
+        self.jee = make_student('S001', self.division, Category.SCIENCE_JEE)
+        self.board = make_student('S002', self.division)
+        self.dropping = make_student('S003', self.division)
+        # Eight sessions, the last two in Chemistry; absences per student by session index.
+        absent = {self.jee: {2, 5}, self.board: {2, 5}, self.dropping: {0, 3, 4, 5, 6, 7}}
+        start = timezone.localdate() - datetime.timedelta(days=30)
+        self.days = [start + datetime.timedelta(days=index) for index in range(8)]
+        for index, day in enumerate(self.days):
+            subject = self.subject if index < 6 else self.chemistry
+            present = [s.pk for s in (self.steady, self.jee, self.board, self.dropping) if index not in absent.get(s, ())]
+            attendance.mark_session(subject, day, present)
+
+    def test_streaks_skip_sessions_off_the_roster(self):
+        rostered = numpy.array([[1, 1, 0, 1, 1, 1], [1, 1, 1, 1, 1, 1]], dtype=bool)
+        present = numpy.array([[1, 0, 0, 0, 1, 0], [0, 0, 0, 1, 0, 0]], dtype=bool)
+        current, longest = analytics.absence_streaks(rostered, present)
+        self.assertEqual((current.tolist(), longest.tolist()), ([1, 2], [2, 3]))
+        rates = analytics.rolling_rates(rostered, present, window=2)
+        self.assertEqual(rates[0].tolist()[1:], [0.5, 0.0, 0.0, 0.5, 0.5])
+
+    def test_summary_matches_the_marks(self):
+        summary = analytics.division_summaries([self.division.pk])[self.division.pk]
+        self.assertEqual(summary['student_ids'].tolist(), [self.steady.pk, self.jee.pk, self.board.pk, self.dropping.pk])
+        self.assertEqual(summary['attended'].tolist(), [8, 6, 6, 2])
+        self.assertEqual(summary['total'].tolist(), [8, 8, 8, 8])
+        self.assertEqual(summary['current_streak'].tolist(), [0, 0, 0, 5])
+        self.assertEqual(summary['longest_streak'].tolist(), [0, 1, 1, 5])
+        expected = {}
+        for day in self.days:
+            expected.setdefault(day - datetime.timedelta(days=day.weekday()), 0)
+            expected[day - datetime.timedelta(days=day.weekday())] += 4
+        report = analytics.report(division_id=self.division.pk)
+        self.assertEqual({datetime.date.fromisoformat(w['week']): w['total'] for w in report['weeks']}, expected)
+        self.assertEqual(sum(w['attended'] for w in report['weeks']), 22)
+        chemistry = analytics.report(subject_id=self.chemistry.pk)['weeks']
+        self.assertEqual((sum(w['attended'] for w in chemistry), sum(w['total'] for w in chemistry)), (6, 8))
+
+    def test_at_risk_follows_category_rules(self):
+        at_risk = analytics.report(class_id=self.division.class_field_id)['at_risk']
+        Category = StudentProfile.Category
+        self.assertEqual([s['student_id'] for s in at_risk[Category.SCIENCE_JEE]], ['S001'])
+        self.assertEqual(at_risk[Category.SCIENCE_JEE][0]['reasons'], ['low_rate', 'low_recent_rate'])
+        # The same 75% is enough for a board student.
+        board = at_risk[Category.SCIENCE_BOARD]
+        self.assertEqual([s['student_id'] for s in board], ['S003'])
+        self.assertEqual(board[0]['reasons'], ['low_rate', 'low_recent_rate'])
+        self.assertEqual(board[0]['absence_streak'], 5)
+        with self.settings(ATTENDANCE_RULES={Category.SCIENCE_BOARD: (0.5, 0.5, 3)}):
+            board = analytics.report(division_id=self.division.pk)['at_risk'][Category.SCIENCE_BOARD]
+        self.assertEqual(board[0]['reasons'], ['low_rate', 'low_recent_rate', 'absence_streak'])
+
+    def test_summaries_refresh_only_on_new_attendance(self):
+        analytics.report(division_id=self.division.pk)
+        with self.assertNumQueries(2):
+            analytics.report(division_id=self.division.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            attendance.mark_session(self.subject, timezone.localdate(), [self.dropping.pk])
+        summary = analytics.division_summaries([self.division.pk])[self.division.pk]
+        self.assertEqual(summary['total'].tolist(), [9, 9, 9, 9])
+        self.assertEqual(summary['current_streak'].tolist(), [1, 1, 1, 0])
+        # Another worker deletes a session: only the shared version is bumped.
+        AttendanceSession.objects.filter(date=timezone.localdate()).delete()  # Its on_commit bump never runs here.
+        caches.create_connection('shared').incr(f"attendance_analytics_version_{self.division.pk}")
+        summary = analytics.division_summaries([self.division.pk])[self.division.pk]
+        self.assertEqual(summary['total'].tolist(), [8, 8, 8, 8])
+
+    def test_view_is_staff_only(self):
+        url = reverse('attendance_analytics')
+        self.client.force_login(self.teacher.user)
+        self.assertEqual(self.client.get(url, {'division': self.division.pk}).status_code, 403)
+        self.client.force_login(User.objects.create_user('root', is_staff=True))
+        self.assertEqual(self.client.get(url).status_code, 400)
+        self.assertEqual(self.client.get(url, {'division': self.division.pk, 'class': 1}).status_code, 400)
+        response = self.client.get(url, {'division': self.division.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['at_risk']['Science-JEE'][0]['rate'], 0.75)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class AnnouncementFeedTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.division = make_division()
+        self.other = make_division(class_name='XII')
+
+    def test_feed_targets_division_class_and_school(self):
+        Announcement.objects.create(title='School', text='Holiday')
+        Announcement.objects.create(title='Class', text='Lab', class_field=self.division.class_field)
+        Announcement.objects.create(title='Division', text='Test', division=self.division)
+        Announcement.objects.create(title='Other', text='Trip', division=self.other)
+        titles = [a['title'] for a in announcements.division_feed(self.division.pk)]
+        self.assertEqual(sorted(titles), ['Class', 'Division', 'School'])
+        self.assertEqual([a['title'] for a in announcements.division_feed(None)], ['School'])
+
+    def test_feed_is_cached_until_a_post(self):
+        Announcement.objects.create(title='First', text='One', division=self.division)
+        announcements.division_feed(self.division.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(len(announcements.division_feed(self.division.pk)), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Announcement.objects.create(title='Second', text='Two')
+        self.assertEqual(len(announcements.division_feed(self.division.pk)), 2)
+
+    def test_post_in_another_worker_retires_the_feed(self):
+        self.assertEqual(announcements.division_feed(self.division.pk), [])
+        # Another worker saves an announcement: only the shared version is bumped.
+        Announcement.objects.bulk_create([Announcement(title='Elsewhere', text='Posted elsewhere')])
+        caches.create_connection('shared').incr(announcements.FEED_VERSION_KEY)
+        self.assertEqual(len(announcements.division_feed(self.division.pk)), 1)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, RATELIMIT_BACKEND='app.ratelimit.CacheBackend')
+class LoginIdentifierTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.division = make_division()
+        self.student = make_student('S001', self.division)
+        self.teacher = make_teacher('T001')
+
+    def test_resolves_every_identifier_in_one_query(self):
+        for typed, user, role in [
+            ('S001', self.student.user, LoginIdentifier.Role.STUDENT),
+            ('S001@example.com', self.student.user, LoginIdentifier.Role.STUDENT),
+            ('T001', self.teacher.user, LoginIdentifier.Role.TEACHER),
+            ('T001@example.com', self.teacher.user, LoginIdentifier.Role.TEACHER),
+        ]:
+            with self.assertNumQueries(1):
+                identity = resolve_login_identifier(typed)
+                self.assertEqual((identity.user, identity.role), (user, role))
+        self.assertIsNone(resolve_login_identifier('nobody'))
+
+    def test_index_follows_profile_and_user_changes(self):
+        self.student.must_reset_password = False
+        self.student.save()
+        self.assertFalse(resolve_login_identifier('S001').must_reset_password)
+        user = self.student.user
+        user.email = 'new@example.com'
+        user.save()
+        self.assertIsNone(resolve_login_identifier('S001@example.com'))
+        self.assertEqual(resolve_login_identifier('new@example.com').role, LoginIdentifier.Role.STUDENT)
+        self.student.delete()
+        self.assertEqual(resolve_login_identifier('S001').role, LoginIdentifier.Role.USER)
+        self.assertEqual(resolve_login_identifier('new@example.com').role, LoginIdentifier.Role.USER)
+
+    def test_login_redirects_to_reset_when_flagged(self):
+        response = self.client.post(reverse('login'), {'user': 'S001', 'password': 'pass12345!'})
+        self.assertRedirects(response, reverse('reset_password'), fetch_redirect_response=False)
+        self.student.must_reset_password = False
+        self.student.save()
+        response = self.client.post(reverse('login'), {'user': 'S001@example.com', 'password': 'pass12345!'})
+        self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class SearchTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.teacher = make_teacher('T001', first_name='Meera', last_name='Iyer')
+        self.division = make_division(teacher=self.teacher)
+        self.other_division = make_division(name='B')
+        self.student = make_student('S001', self.division)
+        self.student.user.first_name, self.student.user.last_name = 'Zoë', 'Sharma'
+        self.student.user.save()
+        self.student.guardian_phone = '+91 98765 43210'
+        self.student.save()
+        self.other = make_student('S002', self.other_division)
+        self.other.user.first_name, self.other.user.last_name = 'Zoya', 'Shah'
+        self.other.user.save()
+
+    def names(self, query, scope=None):
+        return [row['name'] for row in search.typeahead(query, Q() if scope is None else scope)]
+
+    def test_prefix_matching_and_ranking(self):
+        self.assertEqual(self.names('zoe'), ['Zoë Sharma'])
+        self.assertEqual(self.names('ZO SHA'), ['Zoë Sharma', 'Zoya Shah'])
+        self.assertEqual(self.names('zo shar'), ['Zoë Sharma'])
+        self.assertEqual(self.names('3210'), ['Zoë Sharma'])
+        self.assertEqual(self.names('s002'), ['Zoya Shah'])
+        self.assertEqual(self.names('meera'), ['Meera Iyer'])
+        make_teacher('T002', first_name='Ravi', last_name='Sharmaji')
+        self.assertEqual(self.names('sharma'), ['Zoë Sharma', 'Ravi Sharmaji'])
+        self.assertEqual(self.names(' , '), [])
+
+    def test_index_follows_changes(self):
+        self.student.user.last_name = 'Verma'
+        self.student.user.save(update_fields=['last_name'])
+        self.assertEqual(self.names('sharma'), [])
+        self.assertEqual(self.names('verma'), ['Zoë Verma'])
+        self.student.user.save(update_fields=['last_login'])
+        self.student.delete()
+        self.assertEqual(self.names('verma'), [])
+        self.assertEqual(SearchToken.objects.filter(user=self.student.user).count(), 0)
+        search.rebuild_search_index()
+        self.assertEqual(self.names('zoya'), ['Zoya Shah'])
+
+    def test_endpoint_is_scoped_by_role(self):
+        self.client.force_login(self.teacher.user)
+        response = self.client.get(reverse('typeahead'), {'q': 'zo'})
+        self.assertEqual(response.json()['results'], [
+            {'type': 'student', 'id': self.student.pk, 'name': 'Zoë Sharma', 'student_id': 'S001', 'division': 'XI A'},
+        ])
+        self.client.force_login(User.objects.create_user('root', is_staff=True))
+        self.assertEqual(len(self.client.get(reverse('typeahead'), {'q': 'zo', 'limit': 1}).json()['results']), 1)
+        self.assertEqual(len(self.client.get(reverse('typeahead'), {'q': 'zo'}).json()['results']), 2)
+        self.assertEqual(self.client.get(reverse('typeahead'), {'q': 'zo', 'limit': 'x'}).status_code, 400)
+        self.client.force_login(self.student.user)
+        self.assertEqual(self.client.get(reverse('typeahead'), {'q': 'zo'}).status_code, 403)
+
+
+class RateLimiterTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        handle, self.sqlite_path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        self.addCleanup(os.remove, self.sqlite_path)
+
+    def backends(self):
+        return [ratelimit.CacheBackend(), ratelimit.DatabaseBackend(), ratelimit.SQLiteBackend(self.sqlite_path)]
+
+    def test_sliding_window_decays_previous_bucket(self):
+        for backend in self.backends():
+            limiter = ratelimit.RateLimiter('test', 4, 100, backend=backend)
+            for _ in range(4):
+                limiter.hit('key', now=1050)
+            self.assertTrue(limiter.is_limited('key', now=1099))
+            self.assertAlmostEqual(limiter.count('key', now=1125), 3.0)
+            self.assertFalse(limiter.is_limited('key', now=1125))
+            self.assertEqual(limiter.count('key', now=1300), 0)
+            limiter.reset('key', now=1099)
+            self.assertEqual(limiter.count('key', now=1099), 0)
+
+    def test_keys_are_independent(self):
+        limiter = ratelimit.RateLimiter('test', 1, 60, backend=ratelimit.CacheBackend())
+        limiter.hit('a')
+        self.assertTrue(limiter.is_limited('a'))
+        self.assertFalse(limiter.is_limited('b'))
+
+    def test_sqlite_backend_counts_concurrent_hits(self):
+        limiter = ratelimit.RateLimiter('test', 1000, 3600, backend=ratelimit.SQLiteBackend(self.sqlite_path))
+
+        def worker():
+            for _ in range(25):
+                limiter.hit('shared', now=7200)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(limiter.count('shared', now=7200), 200)
+
+    def test_backend_follows_settings(self):
+        self.assertNotEqual(os.path.dirname(settings.RATELIMIT_SQLITE_PATH), str(settings.BASE_DIR))
+        with self.settings(RATELIMIT_BACKEND='app.ratelimit.SQLiteBackend', RATELIMIT_SQLITE_PATH=self.sqlite_path):
+            backend = ratelimit.get_backend()
+            self.assertEqual(backend.path, self.sqlite_path)
+            ratelimit.RateLimiter('test', 5, 60).hit('key', now=60)
+            self.assertEqual(ratelimit.SQLiteBackend(self.sqlite_path).get_many('test:' + hashlib.sha1(b'key').hexdigest(), [1]), [1])
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, RATELIMIT_BACKEND='app.ratelimit.CacheBackend')
+class LoginRateLimitTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.student = make_student('S001', make_division())
+
+    def test_identifier_locked_after_failures(self):
+        for _ in range(5):
+            self.client.post(reverse('login'), {'user': 'S001', 'password': 'wrong'})
+        response = self.client.post(reverse('login'), {'user': 'S001', 'password': 'pass12345!'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Too many failed login attempts")
+        response = self.client.post(reverse('login'), {'user': 'other', 'password': 'wrong'})
+        self.assertContains(response, "Invalid credentials")
+
+    def test_parallel_attempts_are_counted_before_checking(self):
+        # The other attempts run while the first is between the limit check and its
+        # password check, as parallel requests would.
+        checked = []
+
+        def resolve(user_input):
+            checked.append(user_input)
+            if len(checked) == 1:
+                for _ in range(MAX_LOGIN_ATTEMPTS):
+                    self.client_class().post(reverse('login'), {'user': 'S001', 'password': 'wrong'})
+            return resolve_login_identifier(user_input)
+
+        with mock.patch('app.views.resolve_login_identifier', resolve):
+            self.client.post(reverse('login'), {'user': 'S001', 'password': 'wrong'})
+        self.assertEqual(len(checked), MAX_LOGIN_ATTEMPTS)
+
+    def test_success_clears_the_count(self):
+        for _ in range(MAX_LOGIN_ATTEMPTS - 1):
+            self.client.post(reverse('login'), {'user': 'S001', 'password': 'wrong'})
+        self.client.post(reverse('login'), {'user': 'S001', 'password': 'pass12345!'})
+        self.client.logout()
+        response = self.client.post(reverse('login'), {'user': 'S001', 'password': 'wrong'})
+        self.assertContains(response, "Invalid credentials")
+
+
+class SilentBackend(locmem.EmailBackend):
+    def send_messages(self, email_messages):
+        return 0
+
+
+class FlakyBackend(locmem.EmailBackend):
+    opened = 0
+
+    def open(self):
+        FlakyBackend.opened += 1
+        return super().open()
+
+    def send_messages(self, email_messages):
+        if any('fail' in address for message in email_messages for address in message.to):
+            raise OSError("mailbox unavailable")
+        return super().send_messages(email_messages)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, RATELIMIT_BACKEND='app.ratelimit.CacheBackend')
+class OutboxTests(TestCase):
+    def setUp(self):
+        clear_caches()
+
+    def test_forgot_password_enqueues_instead_of_sending(self):
+        make_student('S001', make_division())
+        self.client.post(reverse('forgot_password'), {'email': 'S001@example.com'})
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutboundEmail.objects.get().recipients, ['S001@example.com'])
+        call_command('send_queued_mail', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(OutboundEmail.objects.get().status, OutboundEmail.Status.SENT)
+
+    def test_batch_reuses_connection_and_retries_failures(self):
+        for address in ['a@example.com', 'fail@example.com', 'b@example.com']:
+            enqueue_mail("Notice", "Body", [address], from_email='school@example.com')
+        FlakyBackend.opened = 0
+        sent, failed = send_batch(connection=FlakyBackend())
+        self.assertEqual((sent, failed, FlakyBackend.opened), (2, 1, 1))
+        failed_email = OutboundEmail.objects.get(recipients=['fail@example.com'])
+        self.assertEqual((failed_email.status, failed_email.attempts), (OutboundEmail.Status.PENDING, 1))
+        self.assertGreater(failed_email.next_attempt_at, timezone.now())
+        for _ in range(MAX_ATTEMPTS - 1):
+            OutboundEmail.objects.filter(pk=failed_email.pk).update(next_attempt_at=timezone.now())
+            send_batch(connection=FlakyBackend())
+        self.assertEqual(OutboundEmail.objects.get(pk=failed_email.pk).status, OutboundEmail.Status.DEAD)
+
+    def test_nothing_delivered_stays_retryable(self):
+        email = enqueue_mail("Notice", "Body", ['a@example.com'], from_email='school@example.com')
+        self.assertEqual(send_batch(connection=SilentBackend()), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboundEmail.Status.PENDING, 1))
+        self.assertEqual(email.last_error, "The mail backend sent nothing.")
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, RATELIMIT_BACKEND='app.ratelimit.CacheBackend')
+class ProvisioningTests(TestCase):
+    header = ','.join(STUDENT_COLUMNS + ['password'])
+
+    def setUp(self):
+        clear_caches()
+        make_division()
+        make_student('S000', Division.objects.get())
+
+    def csv(self, *rows):
+        return StringIO('\n'.join([self.header, *rows]) + '\n')
+
+    def row(self, student_id, email=None, division='A', dob='2008-05-01', password='initial-pass-1'):
+        email = email or f"{student_id}@example.com"
+        return f"{student_id},Ana,Roy,{email},{dob},Guardian,999,Street,XI,{division},Science-JEE,{password}"
+
+    def test_imports_valid_rows_and_reports_bad_ones(self):
+        result = import_csv('students', self.csv(
+            self.row('S001'),
+            self.row('S002', division='Z'),
+            self.row('S003', dob='01/05/2008'),
+            self.row('S000'),
+            self.row('S004', email='S001@example.com'),
+            self.row('S005', password=''),
+        ), batch_size=2, workers=1)
+        self.assertEqual(result['created'], 2)
+        self.assertEqual([line for line, _ in result['errors']], [3, 4, 5, 6])
+        student = StudentProfile.objects.select_related('user', 'division').get(student_id='S001')
+        self.assertTrue(student.must_reset_password)
+        self.assertTrue(student.user.check_password('initial-pass-1'))
+        self.assertFalse(User.objects.get(username='S005').has_usable_password())
+        self.assertEqual(resolve_login_identifier('S001').user, student.user)
+
+    def test_rows_taken_during_the_import_fail_alone(self):
+        # As if S000 were created between this batch's check and its insert.
+        with mock.patch('app.provisioning._existing', return_value=(set(), set())):
+            result = import_csv('students', self.csv(self.row('S030'), self.row('S000'), self.row('S031')), workers=1)
+        self.assertEqual(result['created'], 2)
+        self.assertEqual([line for line, _ in result['errors']], [3])
+        self.assertEqual(
+            sorted(StudentProfile.objects.values_list('student_id', flat=True)), ['S000', 'S030', 'S031'],
+        )
+        self.assertEqual(resolve_login_identifier('S031').user.username, 'S031')
+        self.assertIn('taken during the import', result['errors'][0][1])
+
+    def test_admin_hashes_in_process(self):
+        with self.settings(SESSION_COOKIE_NAME='sessionid_admin'):
+            self.client.force_login(User.objects.create_superuser('root', 'root@example.com', 'pass12345!'))
+        upload = SimpleUploadedFile('students.csv', self.csv(self.row('S021')).getvalue().encode())
+        with mock.patch('app.provisioning.ProcessPoolExecutor') as pool:
+            self.client.post(reverse('admin:app_studentprofile_import_csv'), {'csv_file': upload})
+        pool.assert_not_called()
+        self.assertTrue(StudentProfile.objects.filter(student_id='S021').exists())
+
+    def test_hashes_in_process_pool(self):
+        call_command('import_people', 'students', self.write_file(self.row('S010'), self.row('S011')),
+                     '--workers', '2', stdout=StringIO())
+        self.assertTrue(User.objects.get(username='S011').check_password('initial-pass-1'))
+
+    def test_admin_upload(self):
+        with self.settings(SESSION_COOKIE_NAME='sessionid_admin'):
+            self.client.force_login(User.objects.create_superuser('root', 'root@example.com', 'pass12345!'))
+        upload = SimpleUploadedFile('students.csv', self.csv(self.row('S020')).getvalue().encode())
+        response = self.client.post(reverse('admin:app_studentprofile_import_csv'), {'csv_file': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(StudentProfile.objects.filter(student_id='S020').exists())
+
+    def test_admin_refuses_large_files(self):
+        with self.settings(SESSION_COOKIE_NAME='sessionid_admin'):
+            self.client.force_login(User.objects.create_superuser('root', 'root@example.com', 'pass12345!'))
+        upload = SimpleUploadedFile('students.csv', self.csv(self.row('S040'), self.row('S041')).getvalue().encode())
+        with mock.patch('app.admin.ADMIN_IMPORT_MAX_ROWS', 1):
+            response = self.client.post(reverse('admin:app_studentprofile_import_csv'), {'csv_file': upload})
+        self.assertContains(response, 'use manage.py import_people')
+        self.assertFalse(StudentProfile.objects.filter(student_id='S040').exists())
+
+    def write_file(self, *rows):
+        handle, path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(handle, 'w') as csv_file:
+            csv_file.write(self.csv(*rows).getvalue())
+        self.addCleanup(os.remove, path)
+        return path
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class ExportTests(TestCase):
+    def setUp(self):
+        self.division = make_division()
+        self.other = make_division(name='B')
+        self.subject = Subject.objects.create(name='Physics', code='PHY-XI-A', division=self.division)
+        self.students = [make_student(f"S{i:03}", self.division) for i in range(3)]
+        make_student('S900', self.other)
+        attendance.mark_session(self.subject, datetime.date(2025, 6, 2), [self.students[0].pk])
+        attendance.mark_session(self.subject, datetime.date(2025, 7, 1), [])
+        self.client.force_login(User.objects.create_user('staff', password='pass12345!', is_staff=True))
+
+    def read(self, response):
+        self.assertIsInstance(response, StreamingHttpResponse)
+        return list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+
+    def test_roster_filtered_by_division(self):
+        rows = self.read(self.client.get(reverse('export_roster'), {'division': self.division.pk}))
+        self.assertEqual(rows[0][0], 'student_id')
+        self.assertEqual([row[0] for row in rows[1:]], ['S000', 'S001', 'S002'])
+
+    def test_attendance_register_by_date_range(self):
+        rows = self.read(self.client.get(reverse('export_attendance'), {'start': '2025-06-01', 'end': '2025-06-30'}))
+        self.assertEqual(rows[1:], [
+            ['2025-06-02', '1', 'PHY-XI-A', 'XI', 'A', 'S000', 'present'],
+            ['2025-06-02', '1', 'PHY-XI-A', 'XI', 'A', 'S001', 'absent'],
+            ['2025-06-02', '1', 'PHY-XI-A', 'XI', 'A', 'S002', 'absent'],
+        ])
+        self.assertEqual(self.client.get(reverse('export_attendance'), {'start': 'June'}).status_code, 400)
+
+    def test_students_cannot_export(self):
+        self.client.force_login(self.students[0].user)
+        self.assertRedirects(self.client.get(reverse('export_roster')), reverse('dashboard'), fetch_redirect_response=False)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, SESSION_ENGINE='django.contrib.sessions.backends.cache')
+class SessionCookieMiddlewareTests(TestCase):
+    def make_middleware(self, get_response):
+        return AdminSessionMiddleware(get_response)
+
+    def test_cookie_name_chosen_per_request(self):
+        def view(request):
+            request.session['path'] = request.path
+            return HttpResponse()
+
+        middleware = self.make_middleware(view)
+        factory = RequestFactory()
+        self.assertIn('sessionid_admin', middleware(factory.get('/admin/')).cookies)
+        self.assertIn('sessionid_main', middleware(factory.get('/dashboard')).cookies)
+        self.assertEqual(settings.SESSION_COOKIE_NAME, 'sessionid_main')
+
+    def test_concurrent_threads_do_not_share_cookie_names(self):
+        barrier = threading.Barrier(8)
+
+        def view(request):
+            barrier.wait(timeout=5)
+            request.session['path'] = request.path
+            return HttpResponse()
+
+        middleware = self.make_middleware(view)
+        factory = RequestFactory()
+        results = {}
+
+        def worker(index):
+            path = '/admin/' if index % 2 else '/dashboard'
+            response = middleware(factory.get(path))
+            results[index] = (path, set(response.cookies))
+
+        threads = [threading.Thread(target=worker, args=(index,)) for index in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for path, cookies in results.values():
+            self.assertEqual(cookies, {'sessionid_admin' if path == '/admin/' else 'sessionid_main'})
+        self.assertEqual(settings.SESSION_COOKIE_NAME, 'sessionid_main')
+
+    def test_concurrent_async_requests(self):
+        async def view(request):
+            await asyncio.sleep(0.01)
+            request.session['path'] = request.path
+            return HttpResponse()
+
+        middleware = self.make_middleware(view)
+        factory = RequestFactory()
+
+        async def run():
+            paths = ['/admin/', '/dashboard'] * 10
+            responses = await asyncio.gather(*(middleware(factory.get(path)) for path in paths))
+            return zip(paths, responses)
+
+        for path, response in asyncio.run(run()):
+            self.assertEqual(set(response.cookies), {'sessionid_admin' if path == '/admin/' else 'sessionid_main'})
+
+    def test_admin_and_site_sessions_are_separate(self):
+        user = User.objects.create_superuser('root', 'root@example.com', 'pass12345!')
+        with self.settings(SESSION_COOKIE_NAME='sessionid_admin'):
+            self.client.force_login(user)
+        self.assertEqual(self.client.get('/admin/').status_code, 200)
+        self.assertRedirects(self.client.get(reverse('dashboard')), '/login?next=/dashboard', fetch_redirect_response=False)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, ROOT_URLCONF='erp.urls_async')
+class AsyncDashboardTests(TestCase):
+    def setUp(self):
+        self.teacher = make_teacher('T001')
+        self.division = make_division(teacher=self.teacher)
+        self.subject = Subject.objects.create(name='Physics', code='PHY-XI-A', division=self.division, teacher=self.teacher)
+        self.student = make_student('S001', self.division)
+        attendance.mark_session(self.subject, datetime.date(2025, 6, 2), [self.student.pk])
+
+    async def test_student_dashboard(self):
+        await self.async_client.aforce_login(self.student.user)
+        response = await self.async_client.get(reverse('dashboard_student'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['attendance_percent'], 100.0)
+        self.assertContains(response, 'S001')
+
+    async def test_teacher_dashboard(self):
+        await self.async_client.aforce_login(self.teacher.user)
+        response = await self.async_client.get(reverse('dashboard_teacher'))
+        self.assertEqual([d.attendance_percent for d in response.context['teacher_divisions']], [100.0])
+        self.assertContains(response, 'XI - A')
+
+    async def test_admin_dashboard_and_role_redirects(self):
+        admin_user = await User.objects.acreate(username='root', is_staff=True)
+        await self.async_client.aforce_login(admin_user)
+        response = await self.async_client.get(reverse('dashboard_admin'))
+        self.assertEqual((response.context['total_students'], response.context['total_teachers']), (1, 1))
+        response = await self.async_client.get(reverse('dashboard_student'))
+        self.assertRedirects(response, reverse('dashboard_admin'), fetch_redirect_response=False)
+        await self.async_client.alogout()
+        response = await self.async_client.get(reverse('dashboard_teacher'))
+        self.assertEqual(response.status_code, 302)
+
+    async def test_streamed_export_steps_in_separate_contexts(self):
+        admin_user = await User.objects.acreate(username='root', is_staff=True)
+        await self.async_client.aforce_login(admin_user)
+        response = await self.async_client.get(reverse('export_roster'), {'division': self.division.pk})
+        content = iter(response.streaming_content)
+        chunks = []
+        with self.assertLogs('erp.request_metrics', 'INFO') as logs:
+            # As an ASGI server may: each step through sync_to_async, in a copy of the context.
+            while (chunk := await sync_to_async(next)(content, None)) is not None:
+                chunks.append(chunk)
+                self.assertFalse(db_router._use_replica.get())
+                self.assertIsNone(request_metrics._current.get())
+        self.assertIn(b'S001', b''.join(chunks))
+        self.assertIn('export_roster', logs.output[0])
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'cache.sqlite3')
+
+    def worker_cache(self):
+        # A separate instance with its own connection, like another worker process.
+        return SQLiteCache(self.path, {})
+
+    def test_entries_are_shared_between_workers(self):
+        first, second = self.worker_cache(), self.worker_cache()
+        first.set('feed', {'items': [1, 2]}, None)
+        self.assertTrue(first.add('version', 0, None))
+        self.assertFalse(second.add('version', 5, None))
+        second.incr('version')
+        self.assertEqual(first.get_many(['feed', 'version', 'missing']), {'feed': {'items': [1, 2]}, 'version': 1})
+        with self.assertRaises(ValueError):
+            first.incr('missing')
+        first.set('short', 1, 10)
+        with mock.patch('time.time', return_value=time.time() + 11):
+            self.assertIsNone(second.get('short'))
+            self.assertTrue(second.add('short', 2, 10))
+        second.delete_many(['feed', 'short'])
+        self.assertEqual(first.get_many(['feed', 'short']), {})
+
+    def test_concurrent_increments_are_atomic(self):
+        self.worker_cache().add('counter', 0, None)
+
+        def worker():
+            cache = self.worker_cache()
+            for _ in range(25):
+                cache.incr('counter')
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.worker_cache().get('counter'), 200)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class AdminStatsTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.division = make_division()
+        self.other = make_division(class_name='XII')
+
+    def test_counts_follow_signals_without_recounting(self):
+        stats.snapshot()
+        with self.captureOnCommitCallbacks(execute=True):
+            student = make_student('S001', self.division, category=StudentProfile.Category.SCIENCE_JEE)
+            make_student('S002', self.division)
+            make_teacher('T001')
+        with self.assertNumQueries(0):
+            school = stats.snapshot()
+        self.assertEqual((school['students'], school['teachers'], school['classes']), (2, 1, 2))
+        self.assertEqual(school['by_class'], [('XI', 2), ('XII', 0)])
+        student.division = self.other
+        student.category = StudentProfile.Category.SCIENCE_NEET
+        with self.captureOnCommitCallbacks(execute=True):
+            student.save()
+            student.user.delete()
+        school = stats.snapshot()
+        self.assertEqual((school['students'], school['by_class']), (1, [('XI', 1), ('XII', 0)]))
+        self.assertEqual(dict(school['by_category'])[StudentProfile.Category.SCIENCE_NEET.label], 0)
+
+    def test_rolled_back_writes_leave_counts_alone(self):
+        stats.snapshot()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            make_student('S001', self.division)
+            make_teacher('T001')
+            raise IntegrityError("rolled back")
+        with self.assertNumQueries(0):
+            school = stats.snapshot()
+        self.assertEqual((school['students'], school['teachers']), (0, 0))
+
+    def test_rebuilds_after_eviction(self):
+        make_student('S001', self.division)
+        shared_cache.delete(stats.TOTAL_KEYS['students'])
+        self.assertEqual(stats.snapshot()['students'], 1)
+
+    def test_activity_ring_buffer_is_bounded(self):
+        for n in range(stats.ACTIVITY_CAPACITY + 5):
+            stats.record_activity(f"event {n}")
+        entries = stats.recent_activity(limit=stats.ACTIVITY_CAPACITY + 10)
+        self.assertEqual(len(entries), stats.ACTIVITY_CAPACITY)
+        self.assertEqual(entries[0]['text'], f"event {stats.ACTIVITY_CAPACITY + 4}")
+
+    def test_counters_expire_and_recount(self):
+        stats.snapshot()
+        make_student('S001', self.division)
+        StudentProfile.objects.update(division=self.other)  # Skips the signals.
+        with mock.patch('time.time', return_value=time.time() + stats.STATS_TIMEOUT + 1):
+            self.assertEqual(stats.snapshot()['by_class'], [('XI', 0), ('XII', 1)])
+
+    def test_admin_dashboard_uses_cache(self):
+        admin_user = User.objects.create_user('root', is_staff=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            make_student('S001', self.division)
+        self.client.force_login(admin_user)
+        self.client.get(reverse('dashboard_admin'))
+        with self.assertNumQueries(2):  # session and user
+            response = self.client.get(reverse('dashboard_admin'))
+        self.assertEqual(response.context['total_students'], 1)
+        self.assertIn('Enrolled student S001', [a['text'] for a in response.context['recent_activity']])
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class AdminChangelistTests(TestCase):
+    def setUp(self):
+        with self.settings(SESSION_COOKIE_NAME='sessionid_admin'):
+            self.client.force_login(User.objects.create_superuser('root', 'root@example.com', 'pass12345!'))
+        self.teacher = make_teacher('T001', first_name='Tara', last_name='Iyer')
+        self.divisions = [make_division(name=name, teacher=self.teacher) for name in 'ABC']
+
+    def add_students(self, start, count):
+        for n in range(start, start + count):
+            make_student(f"S{n:03d}", self.divisions[n % 3])
+
+    def changelist_queries(self, name, params=None):
+        with CaptureQueriesContext(connections['default']) as queries:
+            response = self.client.get(reverse(f'admin:app_{name}_changelist'), params or {})
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self.add_students(0, 3)
+        for index, division in enumerate(self.divisions):
+            Subject.objects.create(name='Physics', code=f"PHY{index}", division=division, teacher=self.teacher)
+        targets = [('studentprofile', None), ('studentprofile', {'division': self.divisions[0].pk}),
+                   ('teacherprofile', None), ('division', None), ('subject', None)]
+        self.changelist_queries('studentprofile')  # warm up the session and content types
+        before = [self.changelist_queries(name, params)[0] for name, params in targets]
+        self.add_students(3, 60)
+        for n in range(2, 12):
+            make_teacher(f"T{n:03d}")
+        self.assertEqual([self.changelist_queries(name, params)[0] for name, params in targets], before)
+        self.assertLessEqual(max(before), 8)
+
+    def test_keyset_pages(self):
+        self.add_students(0, 12)
+        with mock.patch.object(StudentProfileAdmin, 'list_per_page', 5):
+            _, response = self.changelist_queries('studentprofile')
+            cl = response.context['cl']
+            self.assertEqual([s.student_id for s in cl.result_list], ['S000', 'S001', 'S002', 'S003', 'S004'])
+            self.assertEqual(cl.next_cursor, 'S004')
+            _, response = self.changelist_queries('studentprofile', {'after': 'S009'})
+            cl = response.context['cl']
+            self.assertEqual([s.student_id for s in cl.result_list], ['S010', 'S011'])
+            self.assertIsNone(cl.next_cursor)
+            self.assertEqual(cl.result_count, 12)
+            # Other orderings fall back to numbered pages.
+            _, response = self.changelist_queries('studentprofile', {'o': '2'})
+            self.assertIsNone(response.context['cl'].keyset_field)
+
+    def test_search_uses_token_index(self):
+        self.add_students(0, 3)
+        student = StudentProfile.objects.get(student_id='S001')
+        student.user.first_name, student.user.last_name = 'Ananya', 'Sharma'
+        student.user.save()
+        _, response = self.changelist_queries('studentprofile', {'q': 'anan shar'})
+        self.assertEqual(list(response.context['cl'].result_list), [student])
+        _, response = self.changelist_queries('teacherprofile', {'q': 'tar'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.teacher])
+
+    def test_autocomplete_is_one_query_for_the_page(self):
+        self.add_students(0, 6)
+        params = {'app_label': 'app', 'model_name': 'subject', 'field_name': 'division', 'term': 'X'}
+        with CaptureQueriesContext(connections['default']) as queries:
+            response = self.client.get(reverse('admin:autocomplete'), params)
+        self.assertEqual([r['text'] for r in response.json()['results']], ['XI A', 'XI B', 'XI C'])
+        before = len(queries)
+        make_division(class_name='XII', name='A')
+        with CaptureQueriesContext(connections['default']) as queries:
+            response = self.client.get(reverse('admin:autocomplete'), params)
+        self.assertEqual(len(response.json()['results']), 4)
+        self.assertEqual(len(queries), before)
+
+    def test_estimated_count_past_exact_limit(self):
+        self.add_students(0, 8)
+        StudentProfile.objects.filter(student_id='S000').delete()
+        with mock.patch.object(EstimatedCountPaginator, 'exact_limit', 5):
+            with self.assertNumQueries(2):  # bounded count, then max(pk)
+                estimated = EstimatedCountPaginator(StudentProfile.objects.all(), 5).count
+            self.assertGreaterEqual(estimated, 7)
+            filtered = StudentProfile.objects.filter(division=self.divisions[0])
+            self.assertEqual(EstimatedCountPaginator(filtered, 5).count, 2)
+        self.assertEqual(EstimatedCountPaginator(StudentProfile.objects.all(), 5).count, 7)
+
+
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.teacher = make_teacher('T001')
+        self.division = make_division(teacher=self.teacher)
+        self.subject = Subject.objects.create(name='Physics', code='PHY-XI-A', division=self.division, teacher=self.teacher)
+        self.student = make_student('S001', self.division)
+
+    def test_student_fragments_follow_changes(self):
+        self.client.force_login(self.student.user)
+        response = self.client.get(reverse('dashboard_student'))
+        self.assertContains(response, '<strong>0%</strong>', html=True)
+        key = make_template_fragment_key('sidebar', ['student', self.student.user.pk, response.wsgi_request.role_version])
+        self.assertIn('@S001', cache.get(key))
+        self.assertNotIn('csrfmiddlewaretoken', cache.get(key))
+        with self.captureOnCommitCallbacks(execute=True):
+            attendance.mark_session(self.subject, datetime.date(2025, 6, 2), [self.student.pk])
+        self.assertContains(self.client.get(reverse('dashboard_student')), '<strong>100.0%</strong>', html=True)
+        self.student.user.first_name = 'Asha'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.student.user.save()
+        self.assertContains(self.client.get(reverse('dashboard_student')), 'Asha', count=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            Announcement.objects.create(title='Sports day', text='Friday', division=self.division)
+        self.assertContains(self.client.get(reverse('dashboard_student')), 'Sports day')
+
+    def test_teacher_classes_follow_division_changes(self):
+        self.client.force_login(self.teacher.user)
+        self.assertContains(self.client.get(reverse('dashboard_teacher')), 'XI - A')
+        self.division.name = 'B'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.division.save()
+        self.assertContains(self.client.get(reverse('dashboard_teacher')), 'XI - B')
+        with self.captureOnCommitCallbacks(execute=True):
+            make_division(name='C', teacher=self.teacher)
+        self.assertContains(self.client.get(reverse('dashboard_teacher')), 'XI - C')
+
+    def test_bump_in_another_worker_retires_widgets(self):
+        self.client.force_login(self.student.user)
+        self.assertContains(self.client.get(reverse('dashboard_student')), '<strong>0%</strong>', html=True)
+        # Another worker marks attendance: the counters change and only the shared version is bumped.
+        AttendanceStat.objects.create(scope=AttendanceStat.Scope.STUDENT, object_id=self.student.pk, attended=1, total=1)
+        other_worker = caches.create_connection('shared')
+        other_worker.add(f"fragment_version_division_{self.division.pk}", 1, None)
+        self.assertContains(self.client.get(reverse('dashboard_student')), '<strong>100.0%</strong>', html=True)
+
+    @override_settings(FRAGMENT_CACHE_TIMEOUT=0)
+    def test_timeout_zero_disables(self):
+        self.client.force_login(self.teacher.user)
+        response = self.client.get(reverse('dashboard_teacher'))
+        key = make_template_fragment_key('sidebar', ['teacher', self.teacher.user.pk, response.wsgi_request.role_version])
+        self.assertIsNone(cache.get(key))
+
+
+class StaticPipelineTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.root)
+        cls.static = override_settings(STATIC_ROOT=cls.root, STORAGES={
+            **settings.STORAGES, 'staticfiles': {'BACKEND': 'erp.staticfiles.CompressedManifestStaticFilesStorage'},
+        })
+        cls.static.enable()
+        cls.addClassCleanup(cls.static.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        with open(os.path.join(cls.root, 'staticfiles.json')) as manifest:
+            cls.css = json.load(manifest)['paths']['admin/css/base.css']
+
+    def get(self, name, **headers):
+        middleware = StaticFilesMiddleware(lambda request: HttpResponse(status=404))
+        response = middleware(RequestFactory().get(settings.STATIC_URL + name, headers=headers))
+        return response, b''.join(response.streaming_content) if response.streaming else response.content
+
+    def test_collectstatic_writes_compressed_variants(self):
+        self.assertTrue(os.path.exists(os.path.join(self.root, self.css + '.gz')))
+        self.assertEqual(os.path.exists(os.path.join(self.root, self.css + '.br')), staticfiles.brotli is not None)
+        self.assertFalse([name for name in os.listdir(os.path.join(self.root, 'images')) if name.endswith('.gz')])
+
+    def test_serves_negotiated_variant(self):
+        with open(os.path.join(self.root, self.css), 'rb') as original:
+            body = original.read()
+        response, content = self.get(self.css, accept_encoding='gzip, deflate')
+        self.assertEqual((response['Content-Encoding'], response['Content-Type']), ('gzip', 'text/css'))
+        self.assertEqual(gzip.decompress(content), body)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        gzip_etag = response['ETag']
+        response, content = self.get(self.css)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(content, body)
+        response, _ = self.get(self.css, accept_encoding='br;q=0, *')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        if staticfiles.brotli is not None:
+            response, content = self.get(self.css, accept_encoding='gzip, br')
+            self.assertEqual(staticfiles.brotli.decompress(content), body)
+        response, _ = self.get(self.css, accept_encoding='gzip', if_none_match=gzip_etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_unhashed_and_unknown_files(self):
+        response, _ = self.get('admin/css/base.css', accept_encoding='gzip')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=60')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        response, _ = self.get('admin/css/base.css', if_none_match=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.get('missing.css')[0].status_code, 404)
+
+    def test_static_urls_fall_back_to_plain_names(self):
+        self.assertEqual(static('admin/css/base.css'), settings.STATIC_URL + self.css)
+        self.assertEqual(static('app/css/new.css'), settings.STATIC_URL + 'app/css/new.css')
+        empty = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, empty)
+        with self.settings(STATIC_ROOT=empty):
+            self.assertEqual(static('app/css/style.css'), settings.STATIC_URL + 'app/css/style.css')
+
+    def test_accepted_encodings(self):
+        self.assertEqual(staticfiles.accepted_encodings('gzip;q=0.5, br'), {'gzip', 'br'})
+        self.assertEqual(staticfiles.accepted_encodings('gzip;q=0, *;q=1'), {'br'})
+        self.assertEqual(staticfiles.accepted_encodings('identity'), {'identity'})
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class PendingAttendanceTests(TestCase):
+    def setUp(self):
+        self.teacher = make_teacher('T001')
+        self.division = make_division(teacher=self.teacher)
+        self.subject = Subject.objects.create(name='Physics', code='PHY-XI-A', division=self.division, teacher=self.teacher)
+        # Mondays and Wednesdays, 09:00-10:00.
+        for weekday in (0, 2):
+            TimetableSlot.objects.create(
+                subject=self.subject, weekday=weekday, slot=1, start_time=datetime.time(9), end_time=datetime.time(10),
+                valid_from=datetime.date(2025, 1, 1),
+            )
+        self.now = timezone.make_aware(datetime.datetime(2025, 6, 11, 9, 30))  # Wednesday, mid-lesson
+        timetable.extend_calendar(today=self.now.date(), days_ahead=0)
+
+    def test_lists_missed_sessions_only(self):
+        attendance.mark_session(self.subject, datetime.date(2025, 6, 2), [])
+        SchoolDay.objects.filter(date=datetime.date(2025, 6, 4)).update(is_holiday=True)
+        pending = timetable.pending_attendance(self.teacher, now=self.now, lookback_days=10)
+        self.assertEqual([row['date'] for row in pending], [datetime.date(2025, 6, 9)])
+        self.assertEqual(pending[0]['code'], 'PHY-XI-A')
+
+    def test_reads_without_writing(self):
+        SchoolDay.objects.filter(date__gte=datetime.date(2025, 6, 9)).delete()
+        with CaptureQueriesContext(connections['default']) as queries:
+            pending = timetable.pending_attendance(self.teacher, now=self.now, lookback_days=10)
+        self.assertEqual([row['date'] for row in pending], [datetime.date(2025, 6, 2), datetime.date(2025, 6, 4)])
+        self.assertEqual([query['sql'].split()[0] for query in queries], ['SELECT'])
+        self.assertFalse(SchoolDay.objects.filter(date__gte=datetime.date(2025, 6, 9)).exists())
+
+    def test_extend_calendar_command(self):
+        out = StringIO()
+        call_command('extend_calendar', days_back=3, days_ahead=3, stdout=out)
+        today = timezone.localdate()
+        self.assertTrue(SchoolDay.objects.filter(date=today - datetime.timedelta(days=3)).exists())
+        self.assertTrue(SchoolDay.objects.filter(date=today + datetime.timedelta(days=3)).exists())
+        self.assertIn(f"covers {today - datetime.timedelta(days=3)}", out.getvalue())
+
+    def test_includes_today_once_slot_has_ended(self):
+        later = self.now + datetime.timedelta(hours=1)
+        pending = timetable.pending_attendance(self.teacher, now=later, lookback_days=2)
+        self.assertEqual([row['date'] for row in pending], [datetime.date(2025, 6, 9), datetime.date(2025, 6, 11)])
+
+    def test_dashboard_divisions_avoid_per_row_queries(self):
+        make_division(name='B', teacher=self.teacher)
+        self.client.force_login(self.teacher.user)
+        response = self.client.get(reverse('dashboard_teacher'))
+        self.assertContains(response, 'XI - B')
+        with self.assertNumQueries(0):
+            [division.class_field.name for division in response.context['teacher_divisions']]
+
+
+class TimetableConflictTests(TestCase):
+    def entry(self, id, start, end, teacher=None, division=None, room='', weekday=0, valid_until=None):
+        return {
+            'id': id, 'weekday': weekday, 'start_time': datetime.time(*start), 'end_time': datetime.time(*end),
+            'valid_from': datetime.date(2025, 1, 1), 'valid_until': valid_until,
+            'teacher': teacher, 'division': division, 'room': room,
+        }
+
+    def test_sweep_finds_only_overlaps(self):
+        conflicts = timetable.find_conflicts([
+            self.entry(1, (9,), (10,), teacher=1, division=1, room='Lab 1'),
+            self.entry(2, (10,), (11,), teacher=1, division=2, room='lab 1'),
+            self.entry(3, (9, 30), (10, 30), teacher=2, division=1, room=' LAB 1 '),
+            self.entry(4, (9,), (10,), teacher=1, division=3, weekday=1),
+            self.entry(5, (9,), (10,), teacher=3, division=4, valid_until=datetime.date(2024, 12, 31)),
+        ])
+        self.assertEqual(sorted(conflicts), [
+            ('division', 1, 1, 3), ('room', 'lab 1', 1, 3), ('room', 'lab 1', 3, 2),
+        ])
+
+    @override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+    def test_save_and_command_flag_double_booking(self):
+        teacher = make_teacher('T001')
+        physics = Subject.objects.create(name='Physics', code='PHY-A', division=make_division(), teacher=teacher)
+        chemistry = Subject.objects.create(name='Chemistry', code='CHE-B', division=make_division(name='B'), teacher=teacher)
+        common = {'weekday': 0, 'valid_from': datetime.date(2025, 1, 1)}
+        TimetableSlot.objects.create(subject=physics, start_time=datetime.time(9), end_time=datetime.time(10), **common)
+        clash = TimetableSlot(subject=chemistry, start_time=datetime.time(9, 30), end_time=datetime.time(10, 30), **common)
+        with self.assertRaisesMessage(ValidationError, 'Double-booked teacher'):
+            clash.save()
+        self.assertEqual(TimetableSlot.objects.count(), 1)
+        # update() skips the check, so the command still audits what's stored.
+        later = TimetableSlot.objects.create(subject=chemistry, start_time=datetime.time(10), end_time=datetime.time(11), **common)
+        TimetableSlot.objects.filter(pk=later.pk).update(start_time=datetime.time(9, 30))
+        with self.assertRaises(CommandError):
+            call_command('validate_timetable', stdout=StringIO(), stderr=StringIO())
+
+    @override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+    def test_admin_checks_once_under_the_lock(self):
+        teacher = make_teacher('T001')
+        physics = Subject.objects.create(name='Physics', code='PHY-A', division=make_division(), teacher=teacher)
+        chemistry = Subject.objects.create(name='Chemistry', code='CHE-B', division=make_division(name='B'), teacher=teacher)
+        TimetableSlot.objects.create(subject=physics, weekday=0, start_time=datetime.time(9), end_time=datetime.time(10),
+                                     valid_from=datetime.date(2025, 1, 1))
+        with self.settings(SESSION_COOKIE_NAME='sessionid_admin'):
+            self.client.force_login(User.objects.create_superuser('root', 'root@example.com', 'pass12345!'))
+        form = {'subject': chemistry.pk, 'weekday': 0, 'slot': 2, 'start_time': '09:30', 'end_time': '10:30',
+                'room': '', 'valid_from': '2025-01-01', 'valid_until': ''}
+        response = self.client.post(reverse('admin:app_timetableslot_add'), form)
+        self.assertContains(response, 'Double-booked teacher')
+        with mock.patch('app.timetable.slot_conflicts', wraps=timetable.slot_conflicts) as conflicts:
+            response = self.client.post(reverse('admin:app_timetableslot_add'), {**form, 'start_time': '10:00', 'end_time': '11:00'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(conflicts.call_count, 1)
+        self.assertEqual(TimetableSlot.objects.count(), 2)
+
+    @override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+    def test_bulk_creation_rejects_double_booking(self):
+        teacher = make_teacher('T001')
+        physics = Subject.objects.create(name='Physics', code='PHY-A', division=make_division(), teacher=teacher)
+        chemistry = Subject.objects.create(name='Chemistry', code='CHE-B', division=make_division(name='B'), teacher=teacher)
+        common = {'weekday': 0, 'valid_from': datetime.date(2025, 1, 1)}
+        TimetableSlot.objects.create(subject=physics, start_time=datetime.time(9), end_time=datetime.time(10), **common)
+        with self.assertRaisesMessage(ValidationError, 'Double-booked teacher'):
+            timetable.create_slots([
+                TimetableSlot(subject=chemistry, start_time=datetime.time(10), end_time=datetime.time(11), **common),
+                TimetableSlot(subject=chemistry, start_time=datetime.time(9, 30), end_time=datetime.time(10, 30), **common),
+            ])
+        self.assertEqual(TimetableSlot.objects.count(), 1)
+        timetable.create_slots([
+            TimetableSlot(subject=chemistry, start_time=datetime.time(10), end_time=datetime.time(11), **common),
+            TimetableSlot(subject=chemistry, start_time=datetime.time(9), end_time=datetime.time(10), weekday=1,
+                          valid_from=datetime.date(2025, 1, 1)),
+        ])
+        self.assertEqual(TimetableSlot.objects.count(), 3)
+
+
+class RoleMiddlewareTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.teacher = make_teacher('T001')
+        self.division = make_division(teacher=self.teacher)
+        self.student = make_student('S001', self.division)
+
+    def test_redirects_skip_profile_queries(self):
+        self.client.force_login(self.student.user)
+        with CaptureQueriesContext(connections['default']) as queries:
+            response = self.client.get(reverse('dashboard'))
+            self.assertRedirects(response, reverse('dashboard_student'), fetch_redirect_response=False)
+            response = self.client.get(reverse('dashboard_teacher'))
+            self.assertRedirects(response, reverse('dashboard_student'), fetch_redirect_response=False)
+            response = self.client.get(reverse('dashboard_student'))
+        self.assertContains(response, 'Science-Board')
+        self.assertFalse([q for q in queries if 'profile' in q['sql']])
+        self.assertEqual((response.wsgi_request.role, response.wsgi_request.profile), (roles.STUDENT, self.student))
+
+    def test_profile_and_class_changes_invalidate(self):
+        self.client.force_login(self.student.user)
+        self.client.get(reverse('dashboard_student'))
+        self.student.category = StudentProfile.Category.COMMERCE_CA
+        with self.captureOnCommitCallbacks(execute=True):
+            self.student.save()
+        self.assertContains(self.client.get(reverse('dashboard_student')), 'Commerce-CA')
+        self.division.class_field.name = 'XII'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.division.class_field.save()
+        self.assertContains(self.client.get(reverse('dashboard_student')), 'XII A')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.student.delete()
+        response = self.client.get(reverse('dashboard_student'))
+        self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+
+    def test_change_in_another_worker_invalidates(self):
+        self.client.force_login(self.student.user)
+        self.client.get(reverse('dashboard_student'))
+        # Another worker saves the profile: only the shared version is bumped.
+        StudentProfile.objects.filter(pk=self.student.pk).update(category=StudentProfile.Category.COMMERCE_CA)
+        other_worker = caches.create_connection('shared')
+        other_worker.add(f"role_version_{self.student.user_id}", 0, None)
+        other_worker.incr(f"role_version_{self.student.user_id}")
+        self.assertContains(self.client.get(reverse('dashboard_student')), 'Commerce-CA')
+
+    def test_resolve(self):
+        staff = User.objects.create_user('root', is_staff=True)
+        plain = User.objects.create_user('plain')
+        self.assertEqual(roles.resolve(staff), (roles.STAFF, None))
+        self.assertEqual(roles.resolve(plain), (roles.USER, None))
+        self.assertEqual(roles.resolve(self.teacher.user), (roles.TEACHER, self.teacher))
+        with self.assertNumQueries(1):
+            role, profile = roles.resolve(self.student.user)
+            self.assertEqual(str(profile.division), 'XI A')
+
+    async def test_async_request(self):
+        await self.async_client.aforce_login(self.teacher.user)
+        response = await self.async_client.get(reverse('dashboard_student'))
+        self.assertRedirects(response, reverse('dashboard_teacher'), fetch_redirect_response=False)
+        response = await self.async_client.get(reverse('dashboard_teacher'))
+        self.assertEqual((response.asgi_request.role, response.asgi_request.profile), (roles.TEACHER, self.teacher))
+
+
+
+class ReplicaRoutingTests(SimpleTestCase):
+    """A second SQLite file stands in for the read replica."""
+    databases = {'default'}
+
+    @classmethod
+    def setUpClass(cls):
+        # The alias only exists for this class, so it is added after the runner's checks.
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        configured = connections.configure_settings({
+            'default': connections.settings['default'],
+            REPLICA_ALIAS: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.path.join(cls.tmpdir.name, 'replica.sqlite3')},
+        })
+        connections.settings[REPLICA_ALIAS] = configured[REPLICA_ALIAS]
+        cls.databases = {'default', REPLICA_ALIAS}
+        super().setUpClass()
+        with connections[REPLICA_ALIAS].schema_editor() as editor:
+            editor.create_model(Class)
+        Class.objects.using(REPLICA_ALIAS).bulk_create([Class(name='XI'), Class(name='XII')])
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[REPLICA_ALIAS].close()
+        del connections[REPLICA_ALIAS]
+        del connections.settings[REPLICA_ALIAS]
+        cls.databases = {'default'}
+        cls.tmpdir.cleanup()
+
+    def test_reads_use_replica_only_when_requested(self):
+        self.assertEqual(Class.objects.count(), 0)
+        with use_replica():
+            self.assertEqual(Class.objects.count(), 2)
+            self.assertEqual(User.objects.db, 'default')
+        self.assertEqual(read_from_replica(lambda: Class.objects.count())(), 2)
+
+        @read_from_replica
+        async def count_classes():
+            return await Class.objects.acount()
+
+        self.assertEqual(asyncio.run(count_classes()), 2)
+        with use_replica():
+            self.assertEqual(ReplicaRouter().db_for_write(Class), 'default')
+        self.assertFalse(ReplicaRouter().allow_migrate(REPLICA_ALIAS, 'app'))
+
+    def test_streamed_rows_use_replica_step_by_step(self):
+        def rows():
+            yield Class.objects.count()
+            yield Class.objects.count()
+
+        stream = replica_iterator(rows())
+        # Each step in a context of its own, as under ASGI; the flag mustn't outlive a step.
+        for _ in range(2):
+            self.assertEqual(contextvars.copy_context().run(next, stream), 2)
+            self.assertEqual(Class.objects.count(), 0)
+        self.assertIsNone(contextvars.copy_context().run(next, stream, None))
+
+    def test_sqlite_connections_use_wal(self):
+        with connections[REPLICA_ALIAS].cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], settings.SQLITE_PRAGMAS['busy_timeout'])
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, RATELIMIT_BACKEND='app.ratelimit.CacheBackend')
+class SeedAndBenchmarkTests(TestCase):
+    def setUp(self):
+        clear_caches()
+
+    def test_seeded_school_is_consistent(self):
+        counts = seeding.seed_school(students=50, students_per_division=10, classes=2, subjects_per_division=3,
+                                     attendance_days=14)
+        self.assertEqual((counts['divisions'], counts['subjects'], counts['teachers']), (5, 15, 3))
+        self.assertEqual(StudentProfile.objects.filter(division__isnull=False).count(), 50)
+        self.assertTrue(self.client.login(username='S000001', password=seeding.DEFAULT_PASSWORD))
+        self.assertEqual(resolve_login_identifier('t00001@example.com').user.username, 'T00001')
+        self.assertEqual([row['student_id'] for row in search.typeahead('s000050')], ['S000050'])
+        self.assertEqual(stats.snapshot()['students'], 50)
+        call_command('validate_timetable', stdout=StringIO())
+        call_command('rebuild_attendance_stats', '--check', stdout=StringIO())
+        with self.assertRaises(ValueError):
+            seeding.seed_school(students=10)
+
+    def test_benchmark_covers_every_view(self):
+        seeding.seed_school(students=20, students_per_division=10, classes=1, subjects_per_division=2, attendance_days=7)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'bench.json')
+            with self.assertNoLogs('erp.request_metrics', 'INFO'):
+                call_command('benchmark_views', requests=2, concurrency=1, output=path, stdout=StringIO())
+            with open(path) as report_file:
+                report = json.load(report_file)
+        results = {row['view']: row for row in report['results']}
+        self.assertEqual(report['dataset']['students'], 20)
+        self.assertIn('admin:app_studentprofile_changelist', results)
+        self.assertEqual([view for view, row in results.items() if row['errors']], [])
+        self.assertGreater(results['dashboard_student']['queries_mean'], 0)
+        self.assertEqual(results['dashboard_student']['requests'], 2)
+        self.assertGreater(results['dashboard_student']['template_ms_mean'], 0)
+        for view in ('submit_attendance', 'sync_feed', 'attendance_analytics', 'reset_password', 'signout'):
+            self.assertEqual(results[view]['requests'], 2)
+        unbenchmarked = re_path('^unbenchmarked$', app_urls.urlpatterns[0].callback, name='unbenchmarked')
+        with mock.patch.object(app_urls, 'urlpatterns', [*app_urls.urlpatterns, unbenchmarked]):
+            with self.assertRaisesMessage(CommandError, 'No benchmark target for: unbenchmarked.'):
+                call_command('benchmark_views', requests=1, concurrency=1, stdout=StringIO())
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class RequestMetricsTests(TestCase):
+    def middleware_for(self, view):
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            return view(request)
+        middleware = RequestMetricsMiddleware(get_response)
+        return middleware
+
+    @override_settings(SERVER_TIMING=True)
+    def test_server_timing_header(self):
+        clear_caches()
+        student = make_student('S001', make_division())
+        self.client.force_login(student.user)
+        with self.assertLogs('erp.request_metrics', 'INFO') as logs:
+            response = self.client.get(reverse('dashboard_student'))
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+, cache;desc="\d+ hits, [1-9]\d* misses"')
+        record = json.loads(logs.records[-1].getMessage())
+        self.assertEqual((record['view'], record['query_budget']), ('app.views.dashboard_student', 10))
+        self.assertGreater(record['queries'], 0)
+        self.assertGreater(record['template_ms'], 0)
+
+    def test_query_budget(self):
+        @query_budget(1)
+        def view(request):
+            list(User.objects.all())
+            list(Class.objects.all())
+            return HttpResponse()
+
+        middleware = self.middleware_for(view)
+        request = RequestFactory().get('/')
+        with override_settings(QUERY_BUDGET_MODE='raise'):
+            with self.assertRaisesMessage(QueryBudgetExceeded, 'ran 2 queries, over its budget of 1'):
+                middleware(request)
+        with override_settings(QUERY_BUDGET_MODE='warn'):
+            with self.assertLogs('erp.request_metrics', 'WARNING'):
+                self.assertEqual(middleware(request).status_code, 200)
+
+    def test_streamed_queries_are_counted(self):
+        @query_budget(0)
+        def view(request):
+            return StreamingHttpResponse(str(n) for n in Class.objects.values_list('pk', flat=True))
+
+        response = self.middleware_for(view)(RequestFactory().get('/'))
+        with self.settings(QUERY_BUDGET_MODE='raise'), self.assertRaises(QueryBudgetExceeded):
+            b''.join(response.streaming_content)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, PROFILER_SAMPLE_RATE=0)
+class ProfilingTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.admin = User.objects.create_user('root', password='pass12345!', is_staff=True, is_superuser=True)
+
+    def test_staff_flag_stores_profile(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('dashboard_admin'), {'_profile': '1'})
+        profile = RequestProfile.objects.get(pk=response['X-Profile-Id'])
+        self.assertEqual((profile.view, profile.role, profile.trigger), (
+            'app.views.dashboard_admin', 'staff', RequestProfile.Trigger.REQUESTED,
+        ))
+        self.assertGreater(profile.queries, 0)
+        self.assertIn('dashboard_admin', profile.summary)
+
+        with self.settings(SESSION_COOKIE_NAME='sessionid_admin'):
+            self.client.force_login(self.admin)
+        changelist = self.client.get(reverse('admin:app_requestprofile_changelist'))
+        self.assertContains(changelist, reverse('admin:app_requestprofile_collapsed', args=[profile.pk]))
+        download = self.client.get(reverse('admin:app_requestprofile_collapsed', args=[profile.pk]))
+        self.assertEqual(download.content.decode(), profile.collapsed)
+
+    def test_sampled_stacks(self):
+        def slow_view(request):
+            time.sleep(0.05)
+            return HttpResponse()
+
+        with profiling.StackSampler(threading.get_ident(), stop_frame=sys._getframe()) as sampler:
+            slow_view(None)
+        stack, micros = max(sampler.stacks.items(), key=lambda item: item[1])
+        self.assertTrue(stack.startswith('slow_view (app/tests.py:'))
+        self.assertGreater(micros, 20000)
+
+    def test_triggers(self):
+        student = make_student('S001', make_division())
+        self.client.force_login(student.user)
+        self.assertNotIn('X-Profile-Id', self.client.get(reverse('dashboard_student'), {'_profile': '1'}))
+        self.client.logout()
+        self.assertNotIn('X-Profile-Id', self.client.get(reverse('login'), HTTP_X_PROFILE_TOKEN='forged'))
+        response = self.client.get(reverse('login'), HTTP_X_PROFILE_TOKEN=profiling.make_token())
+        self.assertEqual(RequestProfile.objects.get(pk=response['X-Profile-Id']).role, 'anonymous')
+        with self.settings(PROFILER_SAMPLE_RATE=1, PROFILER_MAX_STORED=2):
+            for _ in range(3):
+                self.client.get(reverse('index'))
+        self.assertEqual(
+            list(RequestProfile.objects.order_by('pk').values_list('trigger', flat=True)),
+            [RequestProfile.Trigger.SAMPLED] * 2,
+        )
@@ -0,0 +1,226 @@
+import datetime
+import heapq
+from collections import defaultdict
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from app.models import AttendanceSession, Class, Division, SchoolDay, Subject, TimetableSlot, WriteLock
+
+PENDING_LOOKBACK_DAYS = 14
+CALENDAR_DAYS_AHEAD = 365
+
+
+def ensure_school_days(start, end):
+    """Make sure the calendar has a row for every date in ``[start, end]``."""
+    days = (end - start).days + 1
+    if SchoolDay.objects.filter(date__range=(start, end)).count() == days:
+        return
+    SchoolDay.objects.bulk_create(
+        [
+            SchoolDay(date=day, weekday=day.weekday())
+            for day in (start + datetime.timedelta(days=n) for n in range(days))
+        ],
+        ignore_conflicts=True,
+    )
+
+def extend_calendar(today=None, days_back=PENDING_LOOKBACK_DAYS, days_ahead=CALENDAR_DAYS_AHEAD):
+    """Fill the calendar around ``today``; run daily (``manage.py extend_calendar``) so it never runs out."""
+    today = today or timezone.localdate()
+    start, end = today - datetime.timedelta(days=days_back), today + datetime.timedelta(days=days_ahead)
+    ensure_school_days(start, end)
+    return start, end
+
+def pending_attendance(teacher, now=None, lookback_days=PENDING_LOOKBACK_DAYS):
+    """
+    Timetabled sessions of ``teacher``'s subjects that have ended within the lookback
+    window without an AttendanceSession. The calendar × timetable expansion and the
+    anti-join against submitted sessions both run in the database, using the
+    (subject, date, slot) unique index on attendance sessions. Read-only: dates the
+    SchoolDay calendar doesn't cover yet (see extend_calendar) aren't expanded.
+    """
+    now = timezone.localtime(now)
+    today = now.date()
+    start = today - datetime.timedelta(days=lookback_days)
+    tables = {
+        'slot': TimetableSlot._meta.db_table,
+        'day': SchoolDay._meta.db_table,
+        'subject': Subject._meta.db_table,
+        'division': Division._meta.db_table,
+        'class': Class._meta.db_table,
+        'session': AttendanceSession._meta.db_table,
+    }
+    sql = f"""
+        SELECT ts.subject_id, s.code, s.name, c.name, dv.name, d.date, ts.slot, ts.start_time, ts.end_time
+        FROM {tables['slot']} ts
+        JOIN {tables['subject']} s ON s.id = ts.subject_id
+        JOIN {tables['division']} dv ON dv.id = s.division_id
+        JOIN {tables['class']} c ON c.id = dv.class_field_id
+        JOIN {tables['day']} d ON d.weekday = ts.weekday
+        WHERE s.teacher_id = %s
+          AND d.date BETWEEN %s AND %s
+          AND NOT d.is_holiday
+          AND d.date >= ts.valid_from
+          AND (ts.valid_until IS NULL OR d.date <= ts.valid_until)
+          AND (d.date < %s OR ts.end_time <= %s)
+          AND NOT EXISTS (
+              SELECT 1 FROM {tables['session']} a
+              WHERE a.subject_id = ts.subject_id AND a.date = d.date AND a.slot = ts.slot
+          )
+        ORDER BY d.date, ts.start_time
+    """
+    # The alias the router picks for reads, e.g. the replica under @read_from_replica.
+    connection = connections[router.db_for_read(SchoolDay)]
+    with connection.cursor() as cursor:
+        ops = connection.ops
+        cursor.execute(sql, [
+            teacher.pk, ops.adapt_datefield_value(start), ops.adapt_datefield_value(today),
+            ops.adapt_datefield_value(today), ops.adapt_timefield_value(now.time().replace(microsecond=0)),
+        ])
+        columns = ['subject_id', 'code', 'subject', 'class_name', 'division', 'date', 'slot', 'start_time', 'end_time']
+        rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    for row in rows:
+        # Raw cursors on SQLite hand back strings for date/time columns.
+        for field, parse in (('date', datetime.date.fromisoformat), ('start_time', datetime.time.fromisoformat),
+                             ('end_time', datetime.time.fromisoformat)):
+            if isinstance(row[field], str):
+                row[field] = parse(row[field])
+    return rows
+
+
+RESOURCES = ('teacher', 'division', 'room')
+LOCK = 'timetable_writes'
+
+
+def _validity_overlaps(a, b):
+    return (a['valid_until'] is None or a['valid_until'] >= b['valid_from']) and (
+        b['valid_until'] is None or b['valid_until'] >= a['valid_from']
+    )
+
+def find_conflicts(entries):
+    """
+    Find double bookings among timetable entries (dicts with ``id``, ``weekday``,
+    ``start_time``, ``end_time``, ``valid_from``, ``valid_until``, ``teacher``,
+    ``division`` and ``room``). Entries are bucketed per resource and weekday, then
+    swept in start order with a min-heap of active end times, so the cost is
+    O(n log n + conflicts) rather than comparing every pair.
+
+    Returns ``[(kind, resource, first_id, second_id), ...]``.
+    """
+    buckets = defaultdict(list)
+    for entry in entries:
+        for kind in RESOURCES:
+            resource = entry[kind]
+            if kind == 'room':
+                resource = (resource or '').strip().lower()
+            if resource:
+                buckets[(kind, resource, entry['weekday'])].append(entry)
+    conflicts = []
+    for (kind, resource, _), bucket in buckets.items():
+        bucket.sort(key=lambda entry: entry['start_time'])
+        active = []
+        for entry in bucket:
+            while active and active[0][0] <= entry['start_time']:
+                heapq.heappop(active)
+            for _, _, other in active:
+                if _validity_overlaps(other, entry):
+                    conflicts.append((kind, resource, other['id'], entry['id']))
+            heapq.heappush(active, (entry['end_time'], entry['id'], entry))
+    return conflicts
+
+def timetable_entries(slots=None):
+    """Flatten TimetableSlot rows into the dicts find_conflicts expects, in one query."""
+    slots = TimetableSlot.objects.all() if slots is None else slots
+    return [
+        {
+            'id': row['id'], 'weekday': row['weekday'], 'start_time': row['start_time'], 'end_time': row['end_time'],
+            'valid_from': row['valid_from'], 'valid_until': row['valid_until'], 'teacher': row['subject__teacher_id'],
+            'division': row['subject__division_id'], 'room': row['room'],
+        }
+        for row in slots.values(
+            'id', 'weekday', 'start_time', 'end_time', 'valid_from', 'valid_until', 'subject__teacher_id',
+            'subject__division_id', 'room',
+        ).iterator()
+    ]
+
+def slot_conflicts(slot):
+    """Existing slots that would double-book ``slot``'s teacher, division or room: ``[(kind, other), ...]``."""
+    subject = Subject.objects.filter(pk=slot.subject_id).values('teacher_id', 'division_id').first() or {}
+    resources = Q(subject__division_id=subject.get('division_id'))
+    if subject.get('teacher_id'):
+        resources |= Q(subject__teacher_id=subject['teacher_id'])
+    if slot.room.strip():
+        resources |= Q(room__iexact=slot.room.strip())
+    others = TimetableSlot.objects.filter(
+        resources,
+        weekday=slot.weekday,
+        start_time__lt=slot.end_time,
+        end_time__gt=slot.start_time,
+    ).filter(Q(valid_until__isnull=True) | Q(valid_until__gte=slot.valid_from)).select_related('subject')
+    if slot.valid_until:
+        others = others.filter(valid_from__lte=slot.valid_until)
+    if slot.pk:
+        others = others.exclude(pk=slot.pk)
+    conflicts = []
+    for other in others:
+        if subject.get('teacher_id') and other.subject.teacher_id == subject['teacher_id']:
+            conflicts.append(('teacher', other))
+        if other.subject.division_id == subject.get('division_id'):
+            conflicts.append(('division', other))
+        if slot.room.strip() and other.room.strip().lower() == slot.room.strip().lower():
+            conflicts.append(('room', other))
+    return conflicts
+
+def lock_timetable():
+    """
+    Hold the timetable write lock until the transaction commits. It's taken with an
+    UPDATE rather than SELECT ... FOR UPDATE so SQLite takes its write lock too:
+    writers check for conflicts under it, so two overlapping slots saved at once can't
+    both pass. Call inside a transaction.
+    """
+    now = timezone.now()
+    if not WriteLock.objects.filter(pk=LOCK).update(acquired_at=now):
+        try:
+            with transaction.atomic():
+                WriteLock.objects.create(name=LOCK, acquired_at=now)
+        except IntegrityError:
+            WriteLock.objects.filter(pk=LOCK).update(acquired_at=now)
+
+def check_slot(slot):
+    """Raise ValidationError if ``slot`` would double-book its teacher, division or room."""
+    conflicts = slot_conflicts(slot)
+    if conflicts:
+        raise ValidationError([f"Double-booked {kind}: clashes with {other}." for kind, other in conflicts])
+
+def create_slots(slots, batch_size=None):
+    """
+    ``bulk_create`` new ``slots`` (with their subjects set) under the write lock,
+    raising ValidationError if any would double-book, among themselves or with the
+    existing slots on their weekdays.
+    """
+    new = [
+        {
+            'id': -index, 'weekday': slot.weekday, 'start_time': slot.start_time, 'end_time': slot.end_time,
+            'valid_from': slot.valid_from, 'valid_until': slot.valid_until, 'teacher': slot.subject.teacher_id,
+            'division': slot.subject.division_id, 'room': slot.room,
+        }
+        for index, slot in enumerate(slots, start=1)
+    ]
+    with transaction.atomic():
+        lock_timetable()
+        existing = timetable_entries(TimetableSlot.objects.filter(weekday__in={entry['weekday'] for entry in new}))
+        conflicts = [
+            (kind, resource, first, second)
+            for kind, resource, first, second in find_conflicts(existing + new)
+            if first < 0 or second < 0
+        ]
+        if conflicts:
+            def describe(id):
+                return str(slots[-id - 1]) if id < 0 else f"slot {id}"
+            raise ValidationError([
+                f"Double-booked {kind}: {describe(first)} clashes with {describe(second)}."
+                for kind, _, first, second in conflicts
+            ])
+        return TimetableSlot.objects.bulk_create(slots, batch_size=batch_size)
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     path('', views.index, name='index'),
@@ -9,9 +9,26 @@ urlpatterns = [
     path('dashboard/student', views.dashboard_student, name='dashboard_student'),
     path('dashboard/teacher', views.dashboard_teacher, name='dashboard_teacher'),
     path('dashboard/admin', views.dashboard_admin, name='dashboard_admin'),
+    path('export/roster.csv', views.export_roster, name='export_roster'),
+    path('export/attendance.csv', views.export_attendance, name='export_attendance'),
+    path('search', views.typeahead, name='typeahead'),
+    path('api/attendance', views.submit_attendance, name='submit_attendance'),
+    path('api/sync', views.sync_feed, name='sync_feed'),
+    path('api/analytics', views.attendance_analytics, name='attendance_analytics'),
     path('signout', views.signout, name='signout'),
     path('reset_password/', views.reset_password, name='reset_password'),
     path('forgot_password', views.forgot_password, name='forgot_password'),
     path('reset/<uidb64>/<token>/', views.reset_password_confirm, name='reset_password_confirm'),
 
 ]
+
+# Served under ASGI (erp.urls_async): the dashboards are swapped for their async versions.
+ASYNC_VIEWS = {
+    'dashboard_student': async_views.dashboard_student,
+    'dashboard_teacher': async_views.dashboard_teacher,
+    'dashboard_admin': async_views.dashboard_admin,
+}
+async_urlpatterns = [
+    path(str(pattern.pattern), ASYNC_VIEWS[pattern.name], name=pattern.name) if pattern.name in ASYNC_VIEWS else pattern
+    for pattern in urlpatterns
+]
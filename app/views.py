@@ -1,10 +1,24 @@
+import json
+
 from django.shortcuts import redirect, render, get_object_or_404
+from django.http import HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_date
 from django.contrib.auth.models import User
 from django.contrib import messages
 from django.contrib.auth import login as django_login, logout as django_logout
 from django.contrib.auth.decorators import login_required
-from app.models import StudentProfile, TeacherProfile, Class, Division
-from django.core.mail import send_mail
+from django.db import IntegrityError, transaction
+from app.models import Division, AttendanceStat, Subject
+from app import analytics, attendance, fragments, idempotency, roles, search, stats, sync, timetable
+from app.announcements import division_feed_page
+from app.identifiers import resolve_login_identifier
+from app.ratelimit import RateLimiter
+from app.mail import enqueue_mail
+from erp.db_router import read_from_replica, replica_iterator
+from erp.request_metrics import query_budget
+from app.exports import ATTENDANCE_HEADER, ROSTER_HEADER, attendance_rows, roster_rows, stream_csv
 from django.conf import settings
 from django.urls import reverse
 from django.utils.http import urlsafe_base64_encode
@@ -12,18 +26,25 @@ from django.utils.encoding import force_bytes
 from django.contrib.auth.tokens import default_token_generator
 from django.views.decorators.csrf import csrf_protect
 from django.views.decorators.http import require_http_methods
-from django.core.cache import cache
 from django.core.validators import validate_email
 from django.core.exceptions import ValidationError
 from django.contrib.auth.password_validation import validate_password
 
 # Brute-force protection settings
 MAX_LOGIN_ATTEMPTS = 5
+MAX_LOGIN_ATTEMPTS_PER_IP = 50
 LOGIN_ATTEMPT_WINDOW = 900  # 15 minutes
+MAX_RESET_REQUESTS = 3
+MAX_RESET_REQUESTS_PER_IP = 20
+login_limiter = RateLimiter('login', MAX_LOGIN_ATTEMPTS, LOGIN_ATTEMPT_WINDOW)
+login_ip_limiter = RateLimiter('login_ip', MAX_LOGIN_ATTEMPTS_PER_IP, LOGIN_ATTEMPT_WINDOW)
+reset_limiter = RateLimiter('reset', MAX_RESET_REQUESTS, LOGIN_ATTEMPT_WINDOW)
+reset_ip_limiter = RateLimiter('reset_ip', MAX_RESET_REQUESTS_PER_IP, LOGIN_ATTEMPT_WINDOW)
 LOGIN_TEMPLATE = "app/auth/login.html"
 CONTACT_TEMPLATE = "app/contact/contact.html"
 RESET_PASSWORD_TEMPLATE = "app/auth/reset_password.html"
 RESET_PASSWORD_CONFIRM_TEMPLATE = "app/auth/reset_password_confirm.html"
+MAX_ATTENDANCE_MARKS = 500
 
 
 def get_client_ip(request):
@@ -34,19 +55,15 @@ def get_client_ip(request):
         ip = request.META.get('REMOTE_ADDR')
     return ip
 
-def is_rate_limited(identifier: str) -> bool:
-    cache_key = f"login_attempts_{identifier}"
-    attempts = cache.get(cache_key, 0)
-    return attempts >= MAX_LOGIN_ATTEMPTS
-
-def increment_login_attempts(identifier: str):
-    cache_key = f"login_attempts_{identifier}"
-    attempts = cache.get(cache_key, 0)
-    cache.set(cache_key, attempts + 1, LOGIN_ATTEMPT_WINDOW)
+def count_login_attempt(client_ip: str, identifier: str) -> bool:
+    """
+    Count an attempt before checking the password and return whether it's over the
+    limit, so parallel attempts can't all pass a check made before any is counted.
+    """
+    return login_ip_limiter.hit(client_ip) > MAX_LOGIN_ATTEMPTS_PER_IP or login_limiter.hit(identifier) > MAX_LOGIN_ATTEMPTS
 
 def clear_login_attempts(identifier: str):
-    cache_key = f"login_attempts_{identifier}"
-    cache.delete(cache_key)
+    login_limiter.reset(identifier)
 
 # Create your views here.
 def index(request):
@@ -99,12 +116,11 @@ def contact(request):
         """
         body = f"New Contact Form Submission\n\nName: {name}\nEmail: {email}\nMessage:\n{message}"
         try:
-            send_mail(
+            enqueue_mail(
                 subject=subject,
                 message=body,
                 from_email=settings.EMAIL_HOST_USER,
                 recipient_list=[settings.EMAIL_HOST_USER],
-                fail_silently=False,
                 html_message=html_body,
             )
             messages.success(request, "Your message has been sent successfully!")
@@ -113,48 +129,9 @@ def contact(request):
             messages.error(request, "Error sending message. Please try again later.")
     return render(request, CONTACT_TEMPLATE)
 
-def _find_user_by_student(user_input):
-    try:
-        student_profile = StudentProfile.objects.get(student_id=user_input)
-        return student_profile.user, True, False
-    except StudentProfile.DoesNotExist:
-        try:
-            student_profile = StudentProfile.objects.get(user__email=user_input)
-            return student_profile.user, True, False
-        except StudentProfile.DoesNotExist:
-            return None, False, False
-
-def _find_user_by_teacher(user_input):
-    try:
-        teacher_profile = TeacherProfile.objects.get(employee_id=user_input)
-        return teacher_profile.user, False, True
-    except TeacherProfile.DoesNotExist:
-        try:
-            teacher_profile = TeacherProfile.objects.get(user__email=user_input)
-            return teacher_profile.user, False, True
-        except TeacherProfile.DoesNotExist:
-            return None, False, False
-
-def _find_user_by_admin(user_input):
-    try:
-        user = User.objects.get(email=user_input)
-        return user, False, False
-    except User.DoesNotExist:
-        try:
-            user = User.objects.get(username=user_input)
-            return user, False, False
-        except User.DoesNotExist:
-            return None, False, False
-
-def _must_reset_password(user, is_student, is_teacher):
-    if is_student and hasattr(user, 'student_profile'):
-        return getattr(user.student_profile, 'must_reset_password', False)
-    if is_teacher and hasattr(user, 'teacher_profile'):
-        return getattr(user.teacher_profile, 'must_reset_password', False)
-    return False
-
 @csrf_protect
 @require_http_methods(["GET", "POST"])
+@query_budget(13)
 def login(request):
     if request.user.is_authenticated:
         return redirect('dashboard')
@@ -162,26 +139,21 @@ def login(request):
         user_input = request.POST.get('user', '').strip()
         password = request.POST.get('password', '')
         client_ip = get_client_ip(request)
-        rate_limit_key = f"{client_ip}_{user_input}"
-        if is_rate_limited(rate_limit_key):
+        if count_login_attempt(client_ip, user_input):
             messages.error(request, "Too many failed login attempts. Please try again later.")
             return render(request, LOGIN_TEMPLATE)
-        user, is_student, is_teacher = _find_user_by_student(user_input)
-        if not user:
-            user, is_student, is_teacher = _find_user_by_teacher(user_input)
-        if not user:
-            user, is_student, is_teacher = _find_user_by_admin(user_input)
+        identity = resolve_login_identifier(user_input)
+        user = identity.user if identity else None
         if user and user.check_password(password):
-            if _must_reset_password(user, is_student, is_teacher):
+            if identity.must_reset_password:
                 request.session['reset_user_id'] = user.id
-                clear_login_attempts(rate_limit_key)
+                clear_login_attempts(user_input)
                 return redirect('reset_password')
             django_login(request, user)
-            clear_login_attempts(rate_limit_key)
+            clear_login_attempts(user_input)
             messages.success(request, "You have successfully logged in.")
             return redirect('dashboard')
         else:
-            increment_login_attempts(rate_limit_key)
             # Do not reveal if user exists
             messages.error(request, "Invalid credentials")
             return render(request, LOGIN_TEMPLATE)
@@ -219,79 +191,276 @@ def reset_password(request):
     return render(request, "app/auth/reset_password.html")
 
 @login_required(login_url='login')
+@query_budget(5)
 def dashboard(request):
-    user = request.user
-    if user.is_superuser or user.is_staff:
-        return redirect('dashboard_admin')
-    elif hasattr(user, 'teacher_profile'):
-        return redirect('dashboard_teacher')
-    elif hasattr(user, 'student_profile'):
-        return redirect('dashboard_student')
-    else:
-        return render(request, "app/dashboard/dashboard.html")
+    if request.role in (roles.STAFF, roles.TEACHER, roles.STUDENT):
+        return redirect(roles.DASHBOARDS[request.role])
+    return render(request, "app/dashboard/dashboard.html")
 
 @login_required(login_url='login')
+@read_from_replica
+@query_budget(10)
 def dashboard_student(request):
-    user = request.user
     # Only allow students
-    if not hasattr(user, 'student_profile'):
-        if user.is_superuser or user.is_staff:
-            return redirect('dashboard_admin')
-        elif hasattr(user, 'teacher_profile'):
-            return redirect('dashboard_teacher')
-        else:
-            return redirect('dashboard')
-    student_profile = user.student_profile
-    attendance_percent = getattr(student_profile, 'attendance_percent', 0)
-    announcements = []
-    if student_profile.division:
-        announcements = [a.text for a in getattr(student_profile.division, 'announcements', [])]
+    if request.role != roles.STUDENT:
+        return redirect(roles.DASHBOARDS[request.role])
+    student_profile = request.profile
+    stat = AttendanceStat.objects.filter(scope=AttendanceStat.Scope.STUDENT, object_id=student_profile.pk).first()
+    attendance_percent = stat.percent if stat else 0
+    announcements = division_feed_page(student_profile.division_id, request.GET.get('page', 1))
     return render(request, "app/dashboard/dashboard_student.html", {
         "attendance_percent": attendance_percent,
         "announcements": announcements,
+        "widget_version": fragments.division_version(student_profile.division_id),
     })
 
 @login_required(login_url='login')
+@read_from_replica
+@query_budget(12)
 def dashboard_teacher(request):
-    user = request.user
     # Only allow teachers
-    if not hasattr(user, 'teacher_profile'):
-        if user.is_superuser or user.is_staff:
-            return redirect('dashboard_admin')
-        elif hasattr(user, 'student_profile'):
-            return redirect('dashboard_student')
-        else:
-            return redirect('dashboard')
-    teacher_profile = user.teacher_profile
-    teacher_divisions = Division.objects.filter(teacher=teacher_profile)
-    pending_attendance = []
+    if request.role != roles.TEACHER:
+        return redirect(roles.DASHBOARDS[request.role])
+    teacher_profile = request.profile
+    teacher_divisions = list(Division.objects.filter(teacher=teacher_profile).select_related('class_field'))
+    division_stats = {
+        stat.object_id: stat
+        for stat in AttendanceStat.objects.filter(
+            scope=AttendanceStat.Scope.DIVISION, object_id__in=[d.pk for d in teacher_divisions]
+        )
+    }
+    for division in teacher_divisions:
+        stat = division_stats.get(division.pk)
+        division.attendance_percent = stat.percent if stat else 0
+    pending_attendance = timetable.pending_attendance(teacher_profile)
     return render(request, "app/dashboard/dashboard_teacher.html", {
         "teacher_divisions": teacher_divisions,
         "pending_attendance": pending_attendance,
+        "widget_version": fragments.division_version(*[d.pk for d in teacher_divisions]),
     })
 
 @login_required(login_url='login')
+@read_from_replica
+@query_budget(10)
 def dashboard_admin(request):
-    user = request.user
     # Only allow admin/staff
-    if not (user.is_superuser or user.is_staff):
-        if hasattr(user, 'teacher_profile'):
-            return redirect('dashboard_teacher')
-        elif hasattr(user, 'student_profile'):
-            return redirect('dashboard_student')
-        else:
-            return redirect('dashboard')
-    total_students = StudentProfile.objects.count()
-    total_teachers = TeacherProfile.objects.count()
-    total_classes = Class.objects.count()
-    recent_activity = []
+    if request.role != roles.STAFF:
+        return redirect(roles.DASHBOARDS[request.role])
+    school = stats.snapshot()
     return render(request, "app/dashboard/dashboard_admin.html", {
-        "total_students": total_students,
-        "total_teachers": total_teachers,
-        "total_classes": total_classes,
-        "recent_activity": recent_activity,
+        "total_students": school['students'],
+        "total_teachers": school['teachers'],
+        "total_classes": school['classes'],
+        "students_by_class": school['by_class'],
+        "students_by_category": school['by_category'],
+        "recent_activity": stats.recent_activity(),
     })
 
+def _csv_response(filename, header, rows):
+    response = StreamingHttpResponse(stream_csv(header, rows), content_type="text/csv")
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+def _export_filters(request, ids, dates=False):
+    filters = {}
+    for name in ids:
+        value = request.GET.get(name, '').strip()
+        if value:
+            if not value.isdigit():
+                raise ValueError(f"Invalid {name}.")
+            filters[f"{name}_id"] = int(value)
+    for name in ('start', 'end') if dates else ():
+        value = request.GET.get(name, '').strip()
+        if value:
+            try:
+                filters[name] = parse_date(value)
+            except ValueError:
+                filters[name] = None
+            if filters[name] is None:
+                raise ValueError(f"Invalid {name} date, expected YYYY-MM-DD.")
+    return filters
+
+@login_required(login_url='login')
+@require_http_methods(["GET"])
+@query_budget(6)
+def export_roster(request):
+    if not (request.user.is_superuser or request.user.is_staff):
+        return redirect('dashboard')
+    try:
+        filters = _export_filters(request, ('class', 'division'))
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    return _csv_response("roster.csv", ROSTER_HEADER, replica_iterator(roster_rows(**filters)))
+
+@login_required(login_url='login')
+@require_http_methods(["GET"])
+@query_budget(8)
+def export_attendance(request):
+    if not (request.user.is_superuser or request.user.is_staff):
+        return redirect('dashboard')
+    try:
+        filters = _export_filters(request, ('class', 'division', 'subject'), dates=True)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    return _csv_response("attendance.csv", ATTENDANCE_HEADER, replica_iterator(attendance_rows(**filters)))
+
+@login_required(login_url='login')
+@require_http_methods(["GET"])
+@read_from_replica
+@query_budget(5)
+def typeahead(request):
+    scope = search.scope_for(request.role, request.profile)
+    if scope is None:
+        return JsonResponse({'error': "Search is available to staff and teachers."}, status=403)
+    try:
+        limit = min(int(request.GET.get('limit', 10)), search.MAX_LIMIT)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid limit.")
+    query = request.GET.get('q', '')
+    return JsonResponse({'query': query, 'results': search.typeahead(query, scope, limit)})
+
+def _attendance_payload(payload):
+    """Validate a submit_attendance body; returns ``(subject_id, date, slot, {student_id: present})``."""
+    if not isinstance(payload, dict):
+        raise ValueError("Expected a JSON object.")
+    subject_id, slot = payload.get('subject'), payload.get('slot', 1)
+    if type(subject_id) is not int or type(slot) is not int or slot < 1:
+        raise ValueError("subject and slot must be positive integers.")
+    try:
+        date = parse_date(payload.get('date') or '')
+    except (TypeError, ValueError):
+        date = None
+    if date is None:
+        raise ValueError("Invalid date, expected YYYY-MM-DD.")
+    if date > timezone.localdate():
+        raise ValueError("Attendance can't be submitted for a future date.")
+    records = payload.get('marks')
+    if not isinstance(records, list) or not 0 < len(records) <= MAX_ATTENDANCE_MARKS:
+        raise ValueError(f"marks must be a list of 1 to {MAX_ATTENDANCE_MARKS} entries.")
+    marks = {}
+    for record in records:
+        student_id = record.get('student') if isinstance(record, dict) else None
+        if type(student_id) is not int or not isinstance(record.get('present'), bool):
+            raise ValueError('Each mark needs an integer "student" and a boolean "present".')
+        if student_id in marks:
+            raise ValueError(f"Student {student_id} is marked twice.")
+        marks[student_id] = record['present']
+    return subject_id, date, slot, marks
+
+def _json_error(message, status=400):
+    return JsonResponse({'error': message}, status=status)
+
+def _replay(stored):
+    status, body = stored
+    response = JsonResponse(body, status=status)
+    response[idempotency.REPLAYED_HEADER] = 'true'
+    return response
+
+@require_http_methods(["POST"])
+@csrf_protect
+@login_required(login_url='login')
+@query_budget(19)  # Including the purge of expired keys that one store() in a hundred runs.
+def submit_attendance(request):
+    """
+    Record a session's attendance from one JSON request (for the mobile app):
+    ``{"subject": 3, "date": "2026-10-18", "slot": 1, "marks": [{"student": 12, "present": true}, ...]}``
+    with an ``Idempotency-Key`` header, so retries replay the first response.
+    """
+    if request.role not in (roles.TEACHER, roles.STAFF):
+        return _json_error("Only teachers and staff can submit attendance.", status=403)
+    key = request.headers.get(idempotency.HEADER, '').strip()
+    if not key or len(key) > idempotency.MAX_KEY_LENGTH:
+        return _json_error(f"An {idempotency.HEADER} header of up to {idempotency.MAX_KEY_LENGTH} characters is required.")
+    try:
+        payload = json.loads(request.body)
+        subject_id, date, slot, marks = _attendance_payload(payload)
+    except ValueError as e:
+        return _json_error(str(e))
+    digest = idempotency.fingerprint(payload)
+    try:
+        stored = idempotency.lookup(request.user, key, digest)
+    except idempotency.KeyReused as e:
+        return _json_error(str(e), status=422)
+    if stored is not None:
+        return _replay(stored)
+    subject = Subject.objects.select_related('division').filter(pk=subject_id).first()
+    if subject is None:
+        return _json_error("Subject not found.", status=404)
+    teacher = request.profile if request.role == roles.TEACHER else None
+    if teacher is not None and teacher.pk not in (subject.teacher_id, subject.division.teacher_id):
+        return _json_error("You don't teach this subject or class.", status=403)
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                session, created, results = attendance.submit_marks(subject, date, marks, slot=slot, marked_by=teacher)
+                status = 201 if created else 200
+                body = {
+                    'session': session.pk, 'subject': subject.pk, 'date': date.isoformat(), 'slot': slot,
+                    'created': created, 'present_count': session.present_count, 'roster_size': session.roster_size,
+                    'results': [{'student': student_id, 'status': result} for student_id, result in results.items()],
+                }
+                idempotency.store(request.user, key, digest, status, body)
+        except IntegrityError:
+            # Everything here was rolled back. Either a retry with the same key committed
+            # first (replay it), or another submission created the session first: try
+            # once more, which locks that session and merges these marks into it.
+            try:
+                stored = idempotency.lookup(request.user, key, digest)
+            except idempotency.KeyReused as e:
+                return _json_error(str(e), status=422)
+            if stored is not None:
+                return _replay(stored)
+        else:
+            return JsonResponse(body, status=status)
+    # Lost twice in a row: nothing was written, so the client can safely send it again.
+    return _json_error("The session was being changed by another submission; please try again.", status=409)
+
+@login_required(login_url='login')
+@require_http_methods(["GET"])
+@query_budget(13)
+def sync_feed(request):
+    """
+    A teacher's divisions, rosters, subjects, timetable and announcements for the
+    mobile app: everything without ``since``, else what changed after that cursor
+    (see app.sync). The ETag is the cursor the response would carry.
+    """
+    if request.role != roles.TEACHER:
+        return _json_error("The sync feed is available to teachers.", status=403)
+    divisions = sync.teacher_divisions(request.profile)
+    cursor = sync.current_cursor(divisions)
+    since = request.GET.get('since')
+    if since:
+        try:
+            since, digest = sync.parse_cursor(since)
+        except ValueError as e:
+            return _json_error(str(e))
+        if digest != sync.parse_cursor(cursor)[1]:
+            since = None  # Divisions were gained or lost: start over.
+    else:
+        since = None
+    etag = f'"{cursor}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse({'cursor': cursor, 'reset': since is None, **sync.feed(divisions, since)})
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+@login_required(login_url='login')
+@require_http_methods(["GET"])
+@query_budget(8)
+def attendance_analytics(request):
+    """Weekly attendance and at-risk students for one ``class``, ``division`` or ``subject`` (see app.analytics)."""
+    if not (request.user.is_superuser or request.user.is_staff):
+        return _json_error("Attendance analytics are available to staff.", status=403)
+    try:
+        filters = _export_filters(request, ('class', 'division', 'subject'))
+    except ValueError as e:
+        return _json_error(str(e))
+    if len(filters) != 1:
+        return _json_error("Choose one of class, division or subject.")
+    return JsonResponse(analytics.report(**filters))
+
 @require_http_methods(["POST"])
 @csrf_protect
 @login_required(login_url='login')
@@ -312,6 +481,10 @@ def forgot_password(request):
         except ValidationError:
             messages.error(request, "Please enter a valid email address.")
             return render(request, "app/auth/forgot_password.html")
+        client_ip = get_client_ip(request)
+        if reset_ip_limiter.hit(client_ip) > MAX_RESET_REQUESTS_PER_IP or reset_limiter.hit(email) > MAX_RESET_REQUESTS:
+            messages.error(request, "Too many reset requests. Please try again later.")
+            return render(request, "app/auth/forgot_password.html")
         user = User.objects.filter(email=email).first()
         # Always show the same message to prevent user enumeration
         messages.success(request, "If an account with that email exists, a password reset link has been sent.")
@@ -322,12 +495,11 @@ def forgot_password(request):
                 reset_url = request.build_absolute_uri(
                     reverse('reset_password_confirm', kwargs={'uidb64': uid, 'token': token})
                 )
-                send_mail(
+                enqueue_mail(
                     subject="ClassTrack Password Reset",
                     message=f"Hi {user.get_full_name()},\n\nClick the link below to reset your password:\n{reset_url}\n\nIf you did not request this, ignore this email.",
                     from_email=settings.EMAIL_HOST_USER,
                     recipient_list=[user.email],
-                    fail_silently=False,
                 )
             except Exception:
                 pass
@@ -12,5 +12,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'erp.settings')
+os.environ.setdefault('DJANGO_ROOT_URLCONF', 'erp.urls_async')
 
 application = get_asgi_application()
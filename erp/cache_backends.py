@@ -0,0 +1,179 @@
+"""
+The project's cache backends, counting hits and misses for erp.request_metrics.
+
+``SQLiteCache`` keeps entries in a local SQLite file shared by every worker process
+on the host, with atomic ``incr``; it backs the ``shared`` cache alias when no Redis
+is configured. ``shared_cache`` is that alias, for state every worker must see the
+same: invalidation versions, counters and the activity log.
+"""
+import os
+import pickle
+import random
+import sqlite3
+import threading
+import time
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+from django.utils.connection import ConnectionProxy
+
+from erp.request_metrics import record_cache
+
+_MISSING = object()
+SQLITE_INTEGER = range(-2 ** 63, 2 ** 63)
+
+shared_cache = ConnectionProxy(caches, 'shared')
+
+
+class CacheMetricsMixin:
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version=version)
+        if value is _MISSING:
+            record_cache(0, 1)
+            return default
+        record_cache(1, 0)
+        return value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        values = super().get_many(keys, version=version)
+        record_cache(len(values), len(keys) - len(values))
+        return values
+
+
+class SQLiteCache(BaseCache):
+    # Integers are stored as SQLite integers so incr() can add in SQL; anything else is pickled.
+    purge_probability = 0.01
+    batch_size = 500
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.path = location
+        self.local = threading.local()
+
+    def _connection(self):
+        if getattr(self.local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL) WITHOUT ROWID"
+            )
+            self.local.connection, self.local.pid = connection, os.getpid()
+        return self.local.connection
+
+    @staticmethod
+    def _encode(value):
+        if type(value) is int and value in SQLITE_INTEGER:
+            return value
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _decode(raw):
+        return raw if isinstance(raw, int) else pickle.loads(raw)
+
+    def _purge(self):
+        if random.random() < self.purge_probability:
+            self._connection().execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version)
+        cursor = self._connection().execute(
+            "INSERT INTO cache (key, value, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at "
+            "WHERE cache.expires_at <= ?",
+            (key, self._encode(value), self.get_backend_timeout(timeout), time.time()),
+        )
+        return cursor.rowcount == 1
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version)
+        row = self._connection().execute(
+            "SELECT value FROM cache WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)", (key, time.time())
+        ).fetchone()
+        return default if row is None else self._decode(row[0])
+
+    def get_many(self, keys, version=None):
+        names = {self.make_and_validate_key(key, version): key for key in keys}
+        found = {}
+        connection, now, names_list = self._connection(), time.time(), list(names)
+        for start in range(0, len(names_list), self.batch_size):
+            batch = names_list[start:start + self.batch_size]
+            rows = connection.execute(
+                f"SELECT key, value FROM cache WHERE key IN ({','.join('?' * len(batch))}) "
+                "AND (expires_at IS NULL OR expires_at > ?)",
+                (*batch, now),
+            )
+            found.update((names[name], self._decode(raw)) for name, raw in rows)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version)
+        self._connection().execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, self._encode(value), self.get_backend_timeout(timeout)),
+        )
+        self._purge()
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires_at = self.get_backend_timeout(timeout)
+        rows = [(self.make_and_validate_key(key, version), self._encode(value), expires_at) for key, value in data.items()]
+        connection = self._connection()
+        connection.execute("BEGIN")
+        try:
+            connection.executemany("INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)", rows)
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        self._purge()
+        return []
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version)
+        cursor = self._connection().execute(
+            "UPDATE cache SET expires_at = ? WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (self.get_backend_timeout(timeout), key, time.time()),
+        )
+        return cursor.rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        name = self.make_and_validate_key(key, version)
+        row = self._connection().execute(
+            "UPDATE cache SET value = value + ? WHERE key = ? AND typeof(value) = 'integer' "
+            "AND (expires_at IS NULL OR expires_at > ?) RETURNING value",
+            (delta, name, time.time()),
+        ).fetchone()
+        if row is None:
+            raise ValueError(f"Key '{key}' not found.")
+        return row[0]
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version)
+        return self._connection().execute("DELETE FROM cache WHERE key = ?", (key,)).rowcount == 1
+
+    def delete_many(self, keys, version=None):
+        names = [self.make_and_validate_key(key, version) for key in keys]
+        for start in range(0, len(names), self.batch_size):
+            batch = names[start:start + self.batch_size]
+            self._connection().execute(f"DELETE FROM cache WHERE key IN ({','.join('?' * len(batch))})", batch)
+
+    def has_key(self, key, version=None):
+        return self.get(key, _MISSING, version=version) is not _MISSING
+
+    def clear(self):
+        self._connection().execute("DELETE FROM cache")
+
+
+class InstrumentedLocMemCache(CacheMetricsMixin, LocMemCache):
+    pass
+
+
+class InstrumentedRedisCache(CacheMetricsMixin, RedisCache):
+    pass
+
+
+class InstrumentedSQLiteCache(CacheMetricsMixin, SQLiteCache):
+    pass
@@ -0,0 +1,76 @@
+import contextvars
+import functools
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction
+from django.db import connections
+
+REPLICA_ALIAS = 'replica'
+# Only this project's models are read from the replica; auth and sessions always
+# read from the primary so logins and session writes are never stale.
+REPLICA_APP_LABELS = {'app'}
+
+_use_replica = contextvars.ContextVar('use_replica', default=False)
+
+
+@contextmanager
+def use_replica():
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+def read_from_replica(view):
+    """Route the view's reads of app models to the replica, for pages that tolerate replication lag."""
+    if iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def wrapper(*args, **kwargs):
+            with use_replica():
+                return await view(*args, **kwargs)
+    else:
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            with use_replica():
+                return view(*args, **kwargs)
+    return wrapper
+
+def replica_iterator(rows):
+    """
+    Keep a lazily consumed generator (e.g. a streamed export) on the replica while it
+    runs. The flag is set around each step rather than across yields: under ASGI each
+    step may run in a different context, and in between it would leak into other code.
+    """
+    rows = iter(rows)
+    try:
+        while True:
+            with use_replica():
+                try:
+                    row = next(rows)
+                except StopIteration:
+                    return
+            yield row
+    finally:
+        if hasattr(rows, 'close'):
+            with use_replica():
+                rows.close()
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if (
+            _use_replica.get()
+            and model._meta.app_label in REPLICA_APP_LABELS
+            and REPLICA_ALIAS in connections.settings
+        ):
+            return REPLICA_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA_ALIAS
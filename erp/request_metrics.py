@@ -0,0 +1,223 @@
+"""
+Per-request performance metrics.
+
+``RequestMetricsMiddleware`` collects, for every request, the number and total time
+of SQL queries (on every database alias), template render time and cache
+hits/misses. They are logged as one JSON object on the ``erp.request_metrics``
+logger and, when ``settings.SERVER_TIMING`` is on, returned in a ``Server-Timing``
+header. The collectors hook in through a connection execute wrapper, the
+``TimedDjangoTemplates`` template backend and the cache backends in
+erp.cache_backends; they only record while a request is being measured.
+
+Views declare how many queries they may run with ``@query_budget(n)``. The count
+covers the whole request, middleware included. Going over budget raises
+``QueryBudgetExceeded`` when ``settings.QUERY_BUDGET_MODE`` is ``'raise'`` (the
+test suite) and logs a warning when it is ``'warn'``.
+"""
+import contextvars
+import json
+import logging
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger('erp.request_metrics')
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def query_budget(max_queries):
+    """Declare the most queries a request to this view should run."""
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+    return decorator
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_ms = 0.0
+        self.template_ms = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.view = None
+        self.budget = None
+
+    @property
+    def total_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def server_timing(self):
+        return ", ".join([
+            f'db;dur={self.sql_ms:.1f};desc="{self.queries} queries"',
+            f'tpl;dur={self.template_ms:.1f}',
+            f'cache;desc="{self.cache_hits} hits, {self.cache_misses} misses"',
+            f'total;dur={self.total_ms:.1f}',
+        ])
+
+    def as_dict(self, request, status):
+        return {
+            'method': request.method,
+            'path': request.path,
+            'view': self.view,
+            'status': status,
+            'total_ms': round(self.total_ms, 2),
+            'queries': self.queries,
+            'sql_ms': round(self.sql_ms, 2),
+            'template_ms': round(self.template_ms, 2),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'query_budget': self.budget,
+        }
+
+
+def current_metrics():
+    return _current.get()
+
+@contextmanager
+def paused():
+    """Leave the enclosed work (e.g. the middleware's own bookkeeping) out of the metrics."""
+    token = _current.set(None)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+def _record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.sql_ms += (time.perf_counter() - start) * 1000
+
+def _install_query_recorder(connection):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+@receiver(connection_created)
+def _connection_created(sender, connection, **kwargs):
+    _install_query_recorder(connection)
+
+def record_cache(hits, misses):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.cache_hits += hits
+        metrics.cache_misses += misses
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_ms += (time.perf_counter() - start) * 1000
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing each top-level render for RequestMetricsMiddleware."""
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def start(self):
+        # Connections opened before this module was imported missed connection_created.
+        for connection in connections.all(initialized_only=True):
+            _install_query_recorder(connection)
+        return RequestMetrics()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = self.start()
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = self.start()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.view = f"{view_func.__module__}.{getattr(view_func, '__name__', type(view_func).__name__)}"
+            metrics.budget = getattr(view_func, 'query_budget', None)
+
+    def finish(self, request, response, metrics):
+        if response.streaming and not response.is_async:
+            # The body (and its queries) is produced while the server iterates it.
+            response.streaming_content = self._measure_stream(request, response, response.streaming_content, metrics)
+            return response
+        if getattr(settings, 'SERVER_TIMING', False):
+            response['Server-Timing'] = metrics.server_timing()
+        self.report(request, response.status_code, metrics)
+        return response
+
+    def _measure_stream(self, request, response, content, metrics):
+        # Measure each chunk on its own: under ASGI consecutive steps may run in
+        # different contexts, where a token from an earlier step can't be reset.
+        content = iter(content)
+        try:
+            while True:
+                token = _current.set(metrics)
+                try:
+                    chunk = next(content)
+                except StopIteration:
+                    break
+                finally:
+                    _current.reset(token)
+                yield chunk
+        finally:
+            if hasattr(content, 'close'):
+                content.close()
+        self.report(request, response.status_code, metrics)
+
+    def report(self, request, status, metrics):
+        record = metrics.as_dict(request, status)
+        logger.info(json.dumps(record), extra={'metrics': record})
+        if metrics.budget is not None and metrics.queries > metrics.budget:
+            message = f"{metrics.view} ran {metrics.queries} queries, over its budget of {metrics.budget}"
+            if getattr(settings, 'QUERY_BUDGET_MODE', 'warn') == 'raise':
+                raise QueryBudgetExceeded(message)
+            logger.warning(message, extra={'metrics': record})
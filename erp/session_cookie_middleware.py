@@ -1,18 +1,79 @@
+import time
+
 from django.conf import settings
+from django.contrib.sessions.backends.base import UpdateError
+from django.contrib.sessions.exceptions import SessionInterrupted
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+
+ADMIN_SESSION_COOKIE_NAME = 'sessionid_admin'
+
+
+def session_cookie_name(request):
+    if request.path.startswith('/admin/'):
+        return ADMIN_SESSION_COOKIE_NAME
+    return settings.SESSION_COOKIE_NAME
+
 
-class AdminSessionCookieMiddleware:
+class AdminSessionMiddleware(SessionMiddleware):
     """
-    Use a different session cookie for /admin/ so admin and main site sessions don't conflict.
+    Session middleware that uses a different session cookie for /admin/ so admin and
+    main site sessions don't conflict. The cookie name is chosen per request and kept
+    on ``request.session_cookie_name``; global settings are never modified, so it is
+    safe under threaded and ASGI workers.
     """
-    def __init__(self, get_response):
-        self.get_response = get_response
+    def process_request(self, request):
+        request.session_cookie_name = session_cookie_name(request)
+        request.session = self.SessionStore(request.COOKIES.get(request.session_cookie_name))
 
-    def __call__(self, request):
-        if request.path.startswith('/admin/'):
-            request.session_cookie_name = 'sessionid_admin'
-            # Patch the session cookie name for this request
-            settings.SESSION_COOKIE_NAME = 'sessionid_admin'
+    def process_response(self, request, response):
+        # Mirrors SessionMiddleware.process_response with the per-request cookie name.
+        try:
+            accessed = request.session.accessed
+            modified = request.session.modified
+            empty = request.session.is_empty()
+        except AttributeError:
+            return response
+        cookie_name = getattr(request, 'session_cookie_name', settings.SESSION_COOKIE_NAME)
+        if cookie_name in request.COOKIES and empty:
+            response.delete_cookie(
+                cookie_name,
+                path=settings.SESSION_COOKIE_PATH,
+                domain=settings.SESSION_COOKIE_DOMAIN,
+                samesite=settings.SESSION_COOKIE_SAMESITE,
+            )
+            need_vary_cookie = True
         else:
-            settings.SESSION_COOKIE_NAME = 'sessionid_main'
-        response = self.get_response(request)
+            need_vary_cookie = accessed
+            if (modified or settings.SESSION_SAVE_EVERY_REQUEST) and not empty:
+                if request.session.get_expire_at_browser_close():
+                    max_age = None
+                    expires = None
+                else:
+                    max_age = request.session.get_expiry_age()
+                    expires = http_date(time.time() + max_age)
+                if response.status_code < 500:
+                    try:
+                        request.session.save()
+                    except UpdateError:
+                        raise SessionInterrupted(
+                            "The request's session was deleted before the "
+                            "request completed. The user may have logged "
+                            "out in a concurrent request, for example."
+                        )
+                    response.set_cookie(
+                        cookie_name,
+                        request.session.session_key,
+                        max_age=max_age,
+                        expires=expires,
+                        domain=settings.SESSION_COOKIE_DOMAIN,
+                        path=settings.SESSION_COOKIE_PATH,
+                        secure=settings.SESSION_COOKIE_SECURE or None,
+                        httponly=settings.SESSION_COOKIE_HTTPONLY or None,
+                        samesite=settings.SESSION_COOKIE_SAMESITE,
+                    )
+                    need_vary_cookie = True
+        if need_vary_cookie:
+            patch_vary_headers(response, ("Cookie",))
         return response
@@ -11,7 +11,10 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
 import os
+import sys
 from pathlib import Path
+
+import django
 from dotenv import load_dotenv
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -19,6 +22,8 @@ load_dotenv(os.path.join(BASE_DIR, '.env'))
 
 SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY')
 DEBUG = False
+TESTING = sys.argv[1:2] == ['test']
+
 ALLOWED_HOSTS = os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',')
 
 EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', 'True') == 'True'
@@ -26,6 +31,13 @@ EMAIL_HOST = os.environ.get('EMAIL_HOST')
 EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD')
 EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 587))
+# Without an SMTP host (local development, CI) queued mail is written to files instead.
+EMAIL_BACKEND = os.environ.get(
+    'EMAIL_BACKEND',
+    'django.core.mail.backends.smtp.EmailBackend' if EMAIL_HOST else 'django.core.mail.backends.filebased.EmailBackend',
+)
+EMAIL_FILE_PATH = os.environ.get('EMAIL_FILE_PATH', os.path.join(BASE_DIR, 'sent_emails'))
+EMAIL_TIMEOUT = int(os.environ.get('EMAIL_TIMEOUT', 30))
 
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -52,29 +64,41 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'erp.request_metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'erp.session_cookie_middleware.AdminSessionCookieMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'erp.staticfiles.StaticFilesMiddleware',
+    'erp.session_cookie_middleware.AdminSessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'app.roles.RoleMiddleware',
+    'app.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'erp.urls'
+# erp/asgi.py switches to erp.urls_async, which serves the async dashboard views.
+ROOT_URLCONF = os.environ.get('DJANGO_ROOT_URLCONF', 'erp.urls')
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'erp.request_metrics.TimedDjangoTemplates',
         'DIRS': ['templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'app.fragments.fragment_cache',
+            ],
+            # Compiled templates are kept in memory; with DEBUG on, Django's autoreloader
+            # resets them when a template file changes.
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
             ],
         },
     },
@@ -86,13 +110,115 @@ WSGI_APPLICATION = 'erp.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE selects 'sqlite' (default) or 'postgres'. Connections are persistent
+# (DB_CONN_MAX_AGE seconds) and health-checked before reuse. Setting DB_REPLICA_HOST
+# (postgres) or DB_REPLICA_NAME (sqlite) adds a 'replica' alias that
+# erp.db_router.ReplicaRouter uses for views marked @read_from_replica.
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+
+if DB_ENGINE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'classtrack'),
+            'USER': os.environ.get('DB_USER', ''),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', ''),
+            'PORT': os.environ.get('DB_PORT', ''),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+    if os.environ.get('DB_REPLICA_HOST'):
+        DATABASES['replica'] = {
+            **DATABASES['default'],
+            'HOST': os.environ['DB_REPLICA_HOST'],
+            'PORT': os.environ.get('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+            'TEST': {'MIRROR': 'default'},
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+        }
     }
+    if django.VERSION >= (5, 1):
+        # Take the write lock when a transaction starts instead of failing to upgrade later.
+        DATABASES['default']['OPTIONS'] = {'transaction_mode': 'IMMEDIATE'}
+    if os.environ.get('DB_REPLICA_NAME'):
+        DATABASES['replica'] = {
+            **DATABASES['default'],
+            'NAME': os.environ['DB_REPLICA_NAME'],
+            'TEST': {'MIRROR': 'default'},
+        }
+
+# Applied to every new SQLite connection (see app.signals.configure_sqlite).
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)),
 }
 
+DATABASE_ROUTERS = ['erp.db_router.ReplicaRouter']
+
+
+# Cache
+# 'default' holds cached data; without DJANGO_REDIS_URL each process keeps its own
+# LocMemCache. 'shared' (erp.cache_backends.shared_cache) holds what every worker must
+# agree on, such as invalidation versions and counters: Redis when configured, else a
+# SQLite file shared by the workers of a single host (multi-host deployments need Redis).
+
+if os.environ.get('DJANGO_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'erp.cache_backends.InstrumentedRedisCache',
+            'LOCATION': os.environ['DJANGO_REDIS_URL'],
+        },
+        'shared': {
+            'BACKEND': 'erp.cache_backends.InstrumentedRedisCache',
+            'LOCATION': os.environ['DJANGO_REDIS_URL'],
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'erp.cache_backends.InstrumentedLocMemCache',
+        },
+        'shared': {
+            'BACKEND': 'erp.cache_backends.InstrumentedSQLiteCache',
+            'LOCATION': os.environ.get('CACHE_SQLITE_PATH', os.path.join(BASE_DIR, 'cache.sqlite3')),
+        },
+    }
+
+
+# Template fragments cached with {% cache fragment_timeout ... %} (see app.fragments).
+FRAGMENT_CACHE_TIMEOUT = int(os.environ.get('FRAGMENT_CACHE_TIMEOUT', 3600))
+
+
+# Rate limiting (app.ratelimit): CacheBackend needs a shared cache to be multi-worker safe,
+# SQLiteBackend shares a local file between the workers of a single host.
+
+RATELIMIT_BACKEND = os.environ.get(
+    'RATELIMIT_BACKEND',
+    'app.ratelimit.CacheBackend' if os.environ.get('DJANGO_REDIS_URL') else 'app.ratelimit.SQLiteBackend',
+)
+RATELIMIT_SQLITE_PATH = os.environ.get('RATELIMIT_SQLITE_PATH', os.path.join(BASE_DIR, 'ratelimit.sqlite3'))
+
+# Keeps the suite's local state files (above and the SQLite cache) in a temporary directory.
+TEST_RUNNER = 'erp.test_runner.TestRunner'
+
+# Responses to Idempotency-Key submissions (app.idempotency) are replayed for this long.
+IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL', 86400))
+
+# At-risk rules per StudentProfile.Category for app.analytics, as
+# (min_rate, min_recent_rate, max_absence_streak); categories left out keep the defaults.
+ATTENDANCE_RULES = {}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -133,6 +259,17 @@ STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'app', 'static'),
 ]
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+# collectstatic writes content-hashed names plus .gz/.br variants (brotli when the
+# package is installed); erp.staticfiles.StaticFilesMiddleware serves them with DEBUG
+# off. Before collectstatic has run, {% static %} falls back to the plain names.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'erp.staticfiles.CompressedManifestStaticFilesStorage',
+    },
+}
 
 
 # Default primary key field type
@@ -141,3 +278,34 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 SESSION_COOKIE_NAME = "sessionid_main"
+
+
+# Request metrics (erp.request_metrics): Server-Timing headers, a JSON log line per
+# request, and @query_budget checks that fail the test suite but only warn in production.
+
+SERVER_TIMING = os.environ.get('DJANGO_SERVER_TIMING', str(DEBUG)).lower() in ('1', 'true', 'yes')
+QUERY_BUDGET_MODE = os.environ.get('QUERY_BUDGET_MODE', 'raise' if TESTING else 'warn')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'erp.request_metrics': {
+            'handlers': ['console'],
+            'level': os.environ.get('REQUEST_METRICS_LOG_LEVEL', 'WARNING' if TESTING else 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
+
+# Request profiling (app.profiling): staff can profile a request with ?_profile=1 or an
+# X-Profile-Token header; PROFILER_SAMPLE_RATE profiles that fraction of all traffic.
+
+PROFILER_SAMPLE_RATE = float(os.environ.get('PROFILER_SAMPLE_RATE', 0))
+PROFILER_TOKEN_MAX_AGE = int(os.environ.get('PROFILER_TOKEN_MAX_AGE', 3600))
+PROFILER_SAMPLE_INTERVAL = float(os.environ.get('PROFILER_SAMPLE_INTERVAL', 0.001))
+PROFILER_MAX_STORED = int(os.environ.get('PROFILER_MAX_STORED', 500))
@@ -0,0 +1,198 @@
+"""
+Static files with content-hashed names, precompressed variants and long-lived caching.
+
+``CompressedManifestStaticFilesStorage`` is Django's manifest storage (``name.<hash>.ext``
+files plus ``staticfiles.json``) that also writes ``.gz`` and, when the optional
+``brotli`` package is installed, ``.br`` copies of every compressible hashed file at
+``collectstatic`` time, keeping only those that come out meaningfully smaller. Names
+missing from the manifest fall back to their unhashed URLs.
+
+``StaticFilesMiddleware`` serves ``STATIC_ROOT`` under ``STATIC_URL`` when DEBUG is
+off, so no separate file server is needed. It indexes the directory once at startup
+(restart after ``collectstatic``), picks the smallest variant the client's
+``Accept-Encoding`` allows, sets ``Vary: Accept-Encoding``, and marks hashed files
+``immutable`` for a year; anything else gets a short max-age and an ETag.
+"""
+import gzip
+import json
+import mimetypes
+import os
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = {
+    '.css', '.js', '.mjs', '.json', '.map', '.svg', '.txt', '.html', '.xml', '.ico', '.ttf', '.otf', '.eot',
+}
+MIN_COMPRESS_SIZE = 256
+# A variant must save at least this fraction of the original to be kept.
+MIN_SAVING = 0.05
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+DEFAULT_CACHE_CONTROL = 'public, max-age=60'
+
+# Content-Encoding name and file suffix, in order of preference.
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+
+def _encoders():
+    yield '.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0)
+    if brotli is not None:
+        yield '.br', lambda data: brotli.compress(data, quality=11)
+
+def compress_file(path):
+    """Write the compressed variants of ``path`` worth keeping; return their suffixes."""
+    if os.path.splitext(path)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+        return []
+    with open(path, 'rb') as source:
+        data = source.read()
+    if len(data) < MIN_COMPRESS_SIZE:
+        return []
+    written = []
+    for suffix, compress in _encoders():
+        compressed = compress(data)
+        if len(compressed) <= len(data) * (1 - MIN_SAVING):
+            with open(path + suffix, 'wb') as target:
+                target.write(compressed)
+            written.append(suffix)
+    return written
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def stored_name(self, name):
+        # A file missing from the manifest (collectstatic hasn't run yet, or ran before
+        # the file was added) is linked under its plain name rather than failing the page.
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        for name in sorted(set(self.hashed_files.values())):
+            for suffix in compress_file(self.path(name)):
+                yield name, name + suffix, True
+
+
+def accepted_encodings(header):
+    """The content codings an ``Accept-Encoding`` header allows (``identity`` is implied)."""
+    accepted, refused, wildcard = set(), set(), False
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding == '*':
+            wildcard = quality > 0
+        elif quality > 0:
+            accepted.add(coding)
+        else:
+            refused.add(coding)
+    if wildcard:
+        accepted.update(encoding for encoding, _ in ENCODINGS if encoding not in refused)
+    return accepted
+
+
+class StaticAsset:
+    def __init__(self, path, name, immutable):
+        stat = os.stat(path)
+        self.path = path
+        self.content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        self.immutable = immutable
+        self.last_modified = http_date(stat.st_mtime)
+        self.etag = f'"{stat.st_size:x}-{int(stat.st_mtime):x}"'
+        self.variants = {
+            encoding: path + suffix for encoding, suffix in ENCODINGS if os.path.isfile(path + suffix)
+        }
+
+    def variant(self, accepted):
+        for encoding, _ in ENCODINGS:
+            if encoding in accepted and encoding in self.variants:
+                return encoding, self.variants[encoding]
+        return None, self.path
+
+
+def build_index(root, manifest_name=ManifestStaticFilesStorage.manifest_name):
+    """Map each URL-relative name under ``root`` to its StaticAsset."""
+    try:
+        with open(os.path.join(root, manifest_name)) as manifest:
+            hashed = set(json.load(manifest).get('paths', {}).values())
+    except (OSError, ValueError):
+        hashed = set()
+    suffixes = tuple(suffix for _, suffix in ENCODINGS)
+    index = {}
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, root).replace(os.sep, '/')
+            if name.endswith(suffixes) and os.path.isfile(path.rsplit('.', 1)[0]):
+                continue  # A compressed variant, served through its original.
+            index[name] = StaticAsset(path, name, name in hashed)
+    return index
+
+
+class StaticFilesMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        prefix = settings.STATIC_URL or ''
+        root = settings.STATIC_ROOT
+        if settings.DEBUG or not prefix.startswith('/') or not root or not os.path.isdir(root):
+            # runserver serves static files itself in DEBUG; a CDN STATIC_URL needs nothing here.
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.prefix = prefix
+        self.index = build_index(root)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.serve(request)
+        return response if response is not None else self.get_response(request)
+
+    async def __acall__(self, request):
+        response = self.serve(request)
+        return response if response is not None else await self.get_response(request)
+
+    def serve(self, request):
+        if request.method not in ('GET', 'HEAD') or not request.path_info.startswith(self.prefix):
+            return None
+        asset = self.index.get(request.path_info[len(self.prefix):])
+        if asset is None:
+            return None
+        encoding, path = asset.variant(accepted_encodings(request.headers.get('Accept-Encoding', '')))
+        etag = asset.etag if encoding is None else f'{asset.etag[:-1]}-{encoding}"'
+        if request.headers.get('If-None-Match') == etag:
+            response = HttpResponseNotModified()
+        else:
+            response = FileResponse(open(path, 'rb'), content_type=asset.content_type)
+            if encoding is not None:
+                response['Content-Encoding'] = encoding
+        response['ETag'] = etag
+        response['Last-Modified'] = asset.last_modified
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if asset.immutable else DEFAULT_CACHE_CONTROL
+        patch_vary_headers(response, ['Accept-Encoding'])
+        return response
@@ -0,0 +1,34 @@
+"""
+The project's test runner: local state files (the SQLite rate-limit counters and
+SQLite caches) go to a temporary directory for the run instead of the project directory, so runs never
+share or leave counts behind.
+"""
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.state_dir = tempfile.mkdtemp(prefix='classtrack-tests-')
+        self.state_settings = override_settings(**self.state_files(self.state_dir))
+        self.state_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.state_settings.disable()
+        shutil.rmtree(self.state_dir, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
+
+    @staticmethod
+    def state_files(directory):
+        caches = {
+            alias: {**config, 'LOCATION': os.path.join(directory, f"{alias}-cache.sqlite3")}
+            if config['BACKEND'].endswith('SQLiteCache') else config
+            for alias, config in settings.CACHES.items()
+        }
+        return {'RATELIMIT_SQLITE_PATH': os.path.join(directory, 'ratelimit.sqlite3'), 'CACHES': caches}
@@ -0,0 +1,13 @@
+"""
+URL configuration used under ASGI (see erp/asgi.py): the same routes as erp.urls,
+with the dashboards served by their async views.
+"""
+from django.contrib import admin
+from django.urls import path, include
+
+from app.urls import async_urlpatterns
+
+urlpatterns = [
+    path('admin/', admin.site.urls),
+    path('', include(async_urlpatterns)),
+]